@@ -1,90 +1,2920 @@
 #Flask File
 
-from flask import Flask, request, render_template_string
+from flask import Flask, Response, g, has_request_context, jsonify, request, send_file, stream_with_context, url_for
 import os
 from io import BytesIO
-from PIL import Image
-import pytesseract
-import cohere
-import base64
 import platform
 import re
 import socket
 import json
+import argparse
+import contextvars
+import difflib
+import gzip
+import importlib
+import importlib.util
+import math
+import multiprocessing
+import queue
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import random
+import secrets
+import statistics
+import sys
+import textwrap
+import unicodedata
+import zlib
 
-app = Flask(__name__)
+# ----------------------------
+# Lazy imports and startup timings
+# The heavy modules load on first attribute access, so importing this file (CLI commands,
+# OCR worker processes, server master) stays fast. warm_up() pays the remaining one-time
+# costs before a server worker reports ready.
+# ----------------------------
+_IMPORT_STARTED = time.perf_counter()
+STARTUP_TIMINGS = {}  # phase -> seconds
+
+_LAZY_IMPORT_LOCK = threading.Lock()
+
+class LazyModule:
+    """Stands in for a module until its first attribute access, which imports it under
+    _LAZY_IMPORT_LOCK so concurrent first uses from request threads import it once, fully."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with _LAZY_IMPORT_LOCK:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return module
+
+    def __getattr__(self, attr):
+        if attr in ("_name", "_module"):  # not set up yet, e.g. while copying
+            raise AttributeError(attr)
+        return getattr(self._load(), attr)
+
+def lazy_import(name: str):
+    """`name` if it is already imported, else a LazyModule that imports it on first use."""
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        raise ImportError(f"No module named {name!r}")
+    return LazyModule(name)
+
+Image = lazy_import("PIL.Image")
+ImageFilter = lazy_import("PIL.ImageFilter")
+pytesseract = lazy_import("pytesseract")
+cohere = lazy_import("cohere")
+httpx = lazy_import("httpx")
+
+# ----------------------------
+# Metrics (Prometheus text format at /metrics)
+# Counters, gauges and histograms kept in-process. Every sample carries a worker="<pid>"
+# label; under gunicorn each worker publishes its samples to the shared state DB (see
+# MetricsPublisher), so a scrape answered by any worker reports all of them.
+# stage_timer() also records each stage for the request's Server-Timing header.
+# ----------------------------
+METRICS = []
+# Histogram buckets in seconds: from a cache lookup up to a slow LLM call
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _metric_labels(names, values, extra=""):
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values tuple -> value (or histogram state)
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, "", value) for key, value in sorted(self._values.items())]
+
+    def sample_lines(self, worker):
+        """Exposition lines for this process's samples, labelled with `worker`."""
+        return [f"{name}{_metric_labels(('worker',) + self.labelnames, (worker,) + key, extra)} {value:g}"
+                for name, key, extra, value in self.samples()]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        # collect() -> {label values tuple: value}, read at scrape time
+        self.collect = collect
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.collect is None:
+            return super().samples()
+        return [(self.name, key, "", value) for key, value in sorted(self.collect().items())]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=METRICS_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]  # bucket counts, sum, count
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            states = [(key, list(state)) for key, state in sorted(self._values.items())]
+        samples = []
+        for key, state in states:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key, f'le="{bound:g}"', cumulative))
+            samples.append((f"{self.name}_bucket", key, 'le="+Inf"', state[-1]))
+            samples.append((f"{self.name}_sum", key, "", state[-2]))
+            samples.append((f"{self.name}_count", key, "", state[-1]))
+        return samples
+
+def render_metrics(lines_by_metric) -> str:
+    """Prometheus text for {metric name: [sample line, ...]}, one family per metric."""
+    families = []
+    for metric in METRICS:
+        lines = [f"# HELP {metric.name} {metric.documentation}", f"# TYPE {metric.name} {metric.kind}"]
+        families.append("\n".join(lines + lines_by_metric.get(metric.name, [])))
+    return "\n".join(families) + "\n"
+
+HTTP_REQUESTS = Counter("infobait_http_requests_total", "HTTP requests by endpoint and status code.", ("endpoint", "status"))
+HTTP_SECONDS = Histogram("infobait_http_request_seconds", "HTTP request duration, streamed bodies included.", ("endpoint",))
+HTTP_IN_FLIGHT = Gauge("infobait_http_requests_in_flight", "HTTP requests being handled.", ("endpoint",))
+STAGE_SECONDS = Histogram("infobait_stage_seconds", "Duration of each pipeline stage.", ("stage",))
+STAGE_ERRORS = Counter("infobait_stage_errors_total", "Pipeline stages that failed.", ("stage",))
+CACHE_LOOKUPS = Counter("infobait_cache_lookups_total", "Cache lookups by cache and outcome (hit/miss).", ("cache", "outcome"))
+LLM_CALLS = Counter("infobait_llm_calls_total", "LLM calls per stage and model by outcome (ok/invalid/error).", ("stage", "model", "outcome"))
+LLM_SECONDS = Histogram("infobait_llm_call_seconds", "LLM call duration per stage and model, retries included.", ("stage", "model"))
+LLM_TOKENS = Counter("infobait_llm_tokens_total", "Billed LLM tokens per stage and model.", ("stage", "model", "direction"))
+
+# Stage durations of work running off the request thread (batch items) collect here, one
+# dict per item, and merge_stage_timings() adds them to Server-Timing on the request thread
+STAGE_TIMINGS = contextvars.ContextVar("stage_timings", default=None)
+
+def _add_timings(timings, additions):
+    for stage, seconds in additions.items():
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time a pipeline stage into STAGE_SECONDS (and Server-Timing inside a request)."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = STAGE_TIMINGS.get()
+        if timings is not None:
+            _add_timings(timings, {stage: elapsed})
+        elif has_request_context():
+            _add_timings(g.setdefault("server_timing", {}), {stage: elapsed})
+
+def merge_stage_timings(timings):
+    """Add an item's stage durations to the request's Server-Timing (request thread only)."""
+    if has_request_context():
+        _add_timings(g.setdefault("server_timing", {}), timings)
+
+def record_llm_tokens(stage, model, meta):
+    billed = getattr(meta, "billed_units", None)
+    for direction, field in (("input", "input_tokens"), ("output", "output_tokens")):
+        count = getattr(billed, field, None)
+        if count:
+            LLM_TOKENS.inc(count, stage=stage, model=model, direction=direction)
+
+# static_folder=None: /static/ is served from the fingerprinted bundles built from the page templates
+app = Flask(__name__, static_folder=None)
 
 # ----------------------------
 # Cohere setup
 # ----------------------------
 COHERE_API_KEY = os.environ.get("COHERE_API_KEY", "F2ahifI4wPh18RvXrbQnEd17WlL8avVAJfl3HQ2d")  # Replace or set env
-# Allow model override via env var for faster/cheaper options
+# First model of every stage's cascade (see LLM_STAGE_MODELS below)
 COHERE_MODEL = os.environ.get("COHERE_MODEL", "command-r7b-12-2024")
-co = cohere.Client(COHERE_API_KEY)
+COHERE_BASE_URL = os.environ.get("COHERE_BASE_URL", "https://api.cohere.com")
+
+# ----------------------------
+# LLM gateway
+# Every Cohere call goes through llm.chat(stage, ...): one keep-alive connection pool,
+# a per-stage time budget, retries with jittered exponential backoff on transient errors
+# (timeouts, connection errors, 429 and 5xx), and a circuit breaker that fails fast while
+# the upstream is down instead of letting every request wait out its timeout.
+# ----------------------------
+# Total seconds a call may take per stage, retries included (override with LLM_TIMEOUT_<STAGE>)
+LLM_STAGE_TIMEOUTS = {"cleanup": 15.0, "analysis": 30.0, "rating": 10.0, "fused": 45.0, "chat": 20.0, "summary": 20.0, "chat_pool": 30.0}
+LLM_DEFAULT_TIMEOUT = float(os.environ.get("LLM_DEFAULT_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "4"))
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "20"))
+# Consecutive transient failures that open the breaker, and how long it stays open
+LLM_BREAKER_THRESHOLD = int(os.environ.get("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+
+for _stage in LLM_STAGE_TIMEOUTS:
+    LLM_STAGE_TIMEOUTS[_stage] = float(os.environ.get(f"LLM_TIMEOUT_{_stage.upper()}", LLM_STAGE_TIMEOUTS[_stage]))
+
+# Model cascade per stage, cheapest first (override with LLM_MODELS_<STAGE>="model-a,model-b").
+# A stage escalates to the next model only when the reply fails that stage's validation.
+LLM_ESCALATION_MODEL = os.environ.get("LLM_ESCALATION_MODEL", "command-r-08-2024")
+LLM_STAGE_MODELS = {
+    "cleanup": [COHERE_MODEL],
+    "analysis": [COHERE_MODEL, LLM_ESCALATION_MODEL],
+    "rating": [COHERE_MODEL, LLM_ESCALATION_MODEL],
+    "fused": [COHERE_MODEL, LLM_ESCALATION_MODEL],
+    "chat": [COHERE_MODEL],
+    "summary": [COHERE_MODEL],
+    "chat_pool": [COHERE_MODEL],
+}
+for _stage in LLM_STAGE_MODELS:
+    _models = os.environ.get(f"LLM_MODELS_{_stage.upper()}")
+    if _models:
+        LLM_STAGE_MODELS[_stage] = [m.strip() for m in _models.split(",") if m.strip()]
+    # drop duplicates (e.g. COHERE_MODEL set to the escalation model), keeping order
+    LLM_STAGE_MODELS[_stage] = list(dict.fromkeys(LLM_STAGE_MODELS[_stage]))
+# Latency samples kept per (stage, model) for the percentiles in /stats
+LLM_LATENCY_WINDOW = 500
+
+class LLMUnavailable(Exception):
+    """Raised without calling the upstream while the circuit breaker is open."""
+
+class CircuitBreaker:
+    """closed -> open after `threshold` consecutive failures; open -> half_open after `cooldown`
+    seconds, letting a single probe through; the probe's outcome closes or re-opens it."""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.trips += 1
+
+    def stats(self):
+        with self._lock:
+            retry_in = self.cooldown - (time.monotonic() - self.opened_at) if self.state == "open" else 0.0
+            return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips,
+                    "retry_in_seconds": round(max(0.0, retry_in), 1)}
+
+def is_transient_llm_error(error) -> bool:
+    if isinstance(error, httpx.TransportError):  # timeouts, refused/reset connections
+        return True
+    status = getattr(error, "status_code", None)
+    return status == 429 or (isinstance(status, int) and status >= 500)
+
+# ----------------------------
+# LLM scheduler
+# A global cap on concurrent Cohere calls shared by priority classes: fact-check stages
+# always go ahead of character chat, and chat may only hold part of the slots. Each client
+# (keyed by CLIENT_ID, set per request) also draws from its own token bucket, so a single
+# client cannot use up the API rate limit for everyone.
+# ----------------------------
+LLM_MAX_CONCURRENT = int(os.environ.get("LLM_MAX_CONCURRENT", "8"))
+LLM_CHAT_MAX_CONCURRENT = int(os.environ.get("LLM_CHAT_MAX_CONCURRENT", "3"))
+# Per-client budget: LLM calls per second, and the burst allowed on top
+LLM_CLIENT_RATE = float(os.environ.get("LLM_CLIENT_RATE", "1"))
+LLM_CLIENT_BURST = float(os.environ.get("LLM_CLIENT_BURST", "30"))
+LLM_CLIENT_BUCKETS_MAX = 10000
+# Priority class per stage (lower runs first) and the slots each class may hold
+LLM_STAGE_CLASSES = {"chat": "chat", "summary": "chat", "chat_pool": "chat"}  # every other stage is "fact_check"
+LLM_CLASS_PRIORITY = {"fact_check": 0, "chat": 1}
+LLM_CLASS_LIMITS = {"fact_check": LLM_MAX_CONCURRENT, "chat": LLM_CHAT_MAX_CONCURRENT}
+
+# Who the current LLM calls are for; None (CLI runs) is not rate limited
+CLIENT_ID = contextvars.ContextVar("client_id", default=None)
+
+class LLMRateLimited(Exception):
+    """Raised when the calling client's token bucket is empty."""
+    def __init__(self, retry_after):
+        super().__init__(f"LLM rate limit exceeded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, count=1) -> float:
+        """Take `count` tokens; returns 0 on success, else the seconds until they are available.
+        A charge above the capacity goes through once the bucket is full and leaves it in debt."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        needed = min(count, self.capacity)
+        if self.tokens >= needed:
+            self.tokens -= count
+            return 0.0
+        return (needed - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+class LLMScheduler:
+    def __init__(self, max_concurrent, class_limits, client_rate, client_burst):
+        self.max_concurrent = max_concurrent
+        self.class_limits = class_limits
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self._cond = threading.Condition()
+        self._active = {cls: 0 for cls in class_limits}
+        self._waiting = []  # (priority, sequence, class) tickets
+        self._sequence = 0
+        self._buckets = OrderedDict()  # client id -> TokenBucket, least recently used first
+        self._waits = {cls: {"acquired": 0, "timed_out": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0} for cls in class_limits}
+        self._rate_limited = 0
+
+    def check_rate(self, client_id, calls=1):
+        """Charge `calls` LLM calls to the client's bucket; raises LLMRateLimited when it can't pay."""
+        if client_id is None or self.client_rate <= 0:
+            return
+        with self._cond:
+            bucket = self._buckets.pop(client_id, None) or TokenBucket(self.client_rate, self.client_burst)
+            self._buckets[client_id] = bucket
+            while len(self._buckets) > LLM_CLIENT_BUCKETS_MAX:
+                self._buckets.popitem(last=False)
+            wait = bucket.take(calls)
+            if wait:
+                self._rate_limited += 1
+        if wait:
+            raise LLMRateLimited(max(1, math.ceil(wait)))
+
+    def _can_run(self, ticket):
+        # caller holds the lock; runs if a slot is free and no runnable ticket is ahead of it
+        if sum(self._active.values()) >= self.max_concurrent:
+            return False
+        runnable = [t for t in self._waiting if self._active[t[2]] < self.class_limits[t[2]]]
+        return bool(runnable) and min(runnable) == ticket
+
+    def acquire(self, cls, timeout) -> bool:
+        """Wait for a slot for class `cls`; False if none freed up within `timeout` seconds."""
+        started = time.monotonic()
+        with self._cond:
+            self._sequence += 1
+            ticket = (LLM_CLASS_PRIORITY[cls], self._sequence, cls)
+            self._waiting.append(ticket)
+            try:
+                while not self._can_run(ticket):
+                    remaining = timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self._waits[cls]["timed_out"] += 1
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting.remove(ticket)
+                # a ticket leaving (either way) can unblock the ones behind it
+                self._cond.notify_all()
+            self._active[cls] += 1
+            waited = time.monotonic() - started
+            stats = self._waits[cls]
+            stats["acquired"] += 1
+            stats["total_wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+            return True
+
+    def release(self, cls):
+        with self._cond:
+            self._active[cls] -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            classes = {}
+            for cls, waits in self._waits.items():
+                classes[cls] = dict(waits, active=self._active[cls], limit=self.class_limits[cls],
+                                    waiting=sum(1 for t in self._waiting if t[2] == cls),
+                                    avg_wait_seconds=round(waits["total_wait_seconds"] / waits["acquired"], 4) if waits["acquired"] else 0.0)
+                classes[cls]["total_wait_seconds"] = round(waits["total_wait_seconds"], 3)
+                classes[cls]["max_wait_seconds"] = round(waits["max_wait_seconds"], 3)
+            return {"max_concurrent": self.max_concurrent, "classes": classes,
+                    "clients_tracked": len(self._buckets), "rate_limited": self._rate_limited}
+
+class LLMGateway:
+    def __init__(self, http_factory, client_factory, stage_models, stage_timeouts, max_retries, breaker, scheduler):
+        self._http_factory = http_factory
+        self._client_factory = client_factory
+        self._client = None
+        self._http = None
+        self.stage_models = stage_models
+        self.stage_timeouts = stage_timeouts
+        self.max_retries = max_retries
+        self.breaker = breaker
+        self.scheduler = scheduler
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "escalations": 0, "retries": 0, "failures": 0, "timeouts": 0, "short_circuited": 0}
+        self._latency = {}  # (stage, model) -> outcome counts and recent latencies
+
+    @property
+    def client(self):
+        """The Cohere client, built on first use (the SDK is slow to import and set up)."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    started = time.perf_counter()
+                    self._http = self._http_factory()
+                    self._client = self._client_factory(self._http)
+                    STARTUP_TIMINGS["cohere_client"] = round(time.perf_counter() - started, 4)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def connect(self):
+        """Open the keep-alive TLS connection to the API ahead of the first real call."""
+        self.client
+        if self._http is not None:
+            self._http.head(COHERE_BASE_URL, timeout=5.0)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+        headers = getattr(error, "headers", None) or {}
+        try:
+            # honour the upstream's Retry-After on 429, within our own cap
+            delay = max(delay, min(LLM_BACKOFF_MAX, float(headers.get("retry-after", 0))))
+        except (TypeError, ValueError):
+            pass
+        return delay
+
+    def chat(self, stage: str, validate=None, **kwargs):
+        """co.chat through the stage's model cascade (LLM_STAGE_MODELS), with its time budget,
+        scheduling, retries and the circuit breaker. A model whose reply fails `validate`
+        (default: non-empty text) or that errors hands over to the next one; the last model's
+        reply is returned as is. Raises LLMRateLimited when the client is over its budget,
+        LLMUnavailable while the breaker is open or no slot frees up in time, otherwise the
+        last upstream error."""
+        deadline = time.monotonic() + self.stage_timeouts.get(stage, LLM_DEFAULT_TIMEOUT)
+        validate = validate or (lambda text: bool(text and text.strip()))
+        models = self.stage_models.get(stage) or [COHERE_MODEL]
+        self.scheduler.check_rate(CLIENT_ID.get())
+        self._count("calls")
+        for i, model in enumerate(models):
+            last = i == len(models) - 1
+            started = time.monotonic()
+            try:
+                response = self._call(stage, deadline, dict(kwargs, model=model))
+                record_llm_tokens(stage, model, getattr(response, "meta", None))
+            except LLMUnavailable:
+                self._record_latency(stage, model, started, "error")
+                raise
+            except Exception as e:
+                self._record_latency(stage, model, started, "error")
+                if last or deadline - time.monotonic() < 2.0:
+                    raise
+                print(f"LLM {stage} escalating past {model}: {e}")
+                self._count("escalations")
+                continue
+            if validate(response.text) or last:
+                self._record_latency(stage, model, started, "ok")
+                return response
+            self._record_latency(stage, model, started, "invalid")
+            if deadline - time.monotonic() < 2.0:
+                return response
+            self._count("escalations")
+
+    def chat_stream(self, stage: str, **kwargs):
+        """co.chat_stream through the stage's cascade: returns an iterator of reply text chunks.
+        The rate limit is checked here, before anything is sent; retries and escalation to the
+        next model only happen before the first chunk, after that an error ends the stream."""
+        self.scheduler.check_rate(CLIENT_ID.get())
+        self._count("calls")
+        return self._stream(stage, kwargs)
+
+    def _stream(self, stage, kwargs):
+        deadline = time.monotonic() + self.stage_timeouts.get(stage, LLM_DEFAULT_TIMEOUT)
+        cls = LLM_STAGE_CLASSES.get(stage, "fact_check")
+        models = self.stage_models.get(stage) or [COHERE_MODEL]
+        for i, model in enumerate(models):
+            started = time.monotonic()
+            # the slot is held for the whole stream: the upstream is busy until it ends
+            if not self.scheduler.acquire(cls, deadline - started - 1.0):
+                self._count("failures")
+                raise LLMUnavailable(f"{stage}: no free LLM slot within the time budget")
+            sent = False
+            try:
+                if not self.breaker.allow():
+                    self._count("short_circuited")
+                    raise LLMUnavailable(f"{stage}: upstream unavailable (circuit open)")
+                stream = self.client.chat_stream(**kwargs, model=model, request_options={
+                    "timeout": max(1.0, deadline - time.monotonic()), "max_retries": 0})
+                for event in stream:
+                    event_type = getattr(event, "event_type", None)
+                    if event_type == "text-generation" and event.text:
+                        sent = True
+                        yield event.text
+                    elif event_type == "stream-end":
+                        record_llm_tokens(stage, model, getattr(getattr(event, "response", None), "meta", None))
+                self.breaker.record_success()
+                self._record_latency(stage, model, started, "ok")
+                return
+            except LLMUnavailable:
+                raise
+            except GeneratorExit:
+                # the client went away mid-stream; the upstream itself was fine
+                self.breaker.record_success()
+                raise
+            except Exception as e:
+                self._record_latency(stage, model, started, "error")
+                if isinstance(e, httpx.TimeoutException):
+                    self._count("timeouts")
+                if is_transient_llm_error(e):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if sent or i == len(models) - 1 or deadline - time.monotonic() < 2.0:
+                    self._count("failures")
+                    raise
+                print(f"LLM {stage} stream escalating past {model}: {e}")
+                self._count("escalations")
+            finally:
+                self.scheduler.release(cls)
+
+    def _call(self, stage, deadline, kwargs):
+        cls = LLM_STAGE_CLASSES.get(stage, "fact_check")
+        attempt = 0
+        while True:
+            # the slot is held per attempt, not across backoff sleeps
+            if not self.scheduler.acquire(cls, deadline - time.monotonic() - 1.0):
+                self._count("failures")
+                raise LLMUnavailable(f"{stage}: no free LLM slot within the time budget")
+            try:
+                if not self.breaker.allow():
+                    self._count("short_circuited")
+                    raise LLMUnavailable(f"{stage}: upstream unavailable (circuit open)")
+                remaining = deadline - time.monotonic()
+                response = self.client.chat(**kwargs, request_options={"timeout": max(1.0, remaining), "max_retries": 0})
+                self.breaker.record_success()
+                return response
+            except LLMUnavailable:
+                raise
+            except Exception as e:
+                if isinstance(e, httpx.TimeoutException):
+                    self._count("timeouts")
+                if not is_transient_llm_error(e):
+                    # the upstream answered (bad request, auth...), so it is not down
+                    self.breaker.record_success()
+                    self._count("failures")
+                    raise
+                self.breaker.record_failure()
+                delay = self._backoff(attempt, e)
+                if attempt >= self.max_retries or time.monotonic() + delay + 1.0 > deadline:
+                    self._count("failures")
+                    raise
+            finally:
+                self.scheduler.release(cls)
+            attempt += 1
+            self._count("retries")
+            time.sleep(delay)
+
+    def _record_latency(self, stage, model, started, outcome):
+        elapsed = time.monotonic() - started
+        with self._lock:
+            entry = self._latency.setdefault((stage, model), {"ok": 0, "invalid": 0, "error": 0, "recent": deque(maxlen=LLM_LATENCY_WINDOW)})
+            entry[outcome] += 1
+            entry["recent"].append(elapsed)
+        LLM_CALLS.inc(stage=stage, model=model, outcome=outcome)
+        LLM_SECONDS.observe(elapsed, stage=stage, model=model)
+
+    def latency_stats(self):
+        """{stage: {model: counts by outcome and p50/p95/max seconds over the recent window}}"""
+        with self._lock:
+            entries = {key: (dict(entry), list(entry["recent"])) for key, entry in self._latency.items()}
+        report = {}
+        for (stage, model), (entry, recent) in sorted(entries.items()):
+            recent.sort()
+            row = {"ok": entry["ok"], "invalid": entry["invalid"], "error": entry["error"]}
+            if recent:
+                row["p50_seconds"] = round(recent[len(recent) // 2], 3)
+                row["p95_seconds"] = round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 3)
+                row["max_seconds"] = round(recent[-1], 3)
+            report.setdefault(stage, {})[model] = row
+        return report
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters["breaker"] = self.breaker.stats()
+        counters["stage_timeouts"] = dict(self.stage_timeouts)
+        counters["scheduler"] = self.scheduler.stats()
+        counters["stage_models"] = {stage: list(models) for stage, models in self.stage_models.items()}
+        counters["models"] = self.latency_stats()
+        return counters
+
+def make_http_client():
+    # Shared keep-alive pool for every Cohere call
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE, keepalive_expiry=60),
+        timeout=httpx.Timeout(LLM_DEFAULT_TIMEOUT, connect=5.0),
+    )
+
+def make_cohere_client(http_client):
+    # the SDK's own retries are off because the gateway retries
+    return cohere.Client(COHERE_API_KEY, base_url=COHERE_BASE_URL, max_retries=0, httpx_client=http_client)
+
+llm = LLMGateway(make_http_client, make_cohere_client, LLM_STAGE_MODELS, LLM_STAGE_TIMEOUTS, LLM_MAX_RETRIES, CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_COOLDOWN),
+                 LLMScheduler(LLM_MAX_CONCURRENT, LLM_CLASS_LIMITS, LLM_CLIENT_RATE, LLM_CLIENT_BURST))
 
 # ----------------------------
 # Tesseract setup (cross-platform)
 # Attempts to locate a sensible tesseract binary on macOS, Windows, or Linux
 # ----------------------------
-tesseract_cmd = None
-system = platform.system()
-if system == "Darwin":
-    # common Homebrew and default paths on macOS
-    for p in ("/opt/homebrew/bin/tesseract", "/usr/local/bin/tesseract", "/usr/bin/tesseract"):
-        if os.path.exists(p):
-            tesseract_cmd = p
-            break
-elif system == "Windows":
-    # common install locations on Windows
-    for p in (r"C:\Program Files\Tesseract-OCR\tesseract.exe", r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe"):
-        if os.path.exists(p):
-            tesseract_cmd = p
-            break
-else:
-    # On Linux, assume `tesseract` is on PATH
-    tesseract_cmd = "tesseract"
-
-if tesseract_cmd and os.path.exists(tesseract_cmd):
-    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
-else:
-    # leave default (requires tesseract on PATH) and warn
-    print("Warning: tesseract binary not found at common locations; ensure tesseract is installed and on PATH")
+_tesseract_configured = False
+
+def configure_tesseract():
+    """Point pytesseract at the tesseract binary; probed once, on first OCR."""
+    global _tesseract_configured
+    if _tesseract_configured:
+        return
+    _tesseract_configured = True
+    tesseract_cmd = None
+    system = platform.system()
+    if system == "Darwin":
+        # common Homebrew and default paths on macOS
+        for p in ("/opt/homebrew/bin/tesseract", "/usr/local/bin/tesseract", "/usr/bin/tesseract"):
+            if os.path.exists(p):
+                tesseract_cmd = p
+                break
+    elif system == "Windows":
+        # common install locations on Windows
+        for p in (r"C:\Program Files\Tesseract-OCR\tesseract.exe", r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe"):
+            if os.path.exists(p):
+                tesseract_cmd = p
+                break
+    else:
+        # On Linux, assume `tesseract` is on PATH
+        tesseract_cmd = "tesseract"
+
+    if tesseract_cmd and os.path.exists(tesseract_cmd):
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    else:
+        # leave default (requires tesseract on PATH) and warn
+        print("Warning: tesseract binary not found at common locations; ensure tesseract is installed and on PATH")
+
+# Performance tunables
+# Maximum image dimension (pixels). Images larger than this will be downscaled before OCR.
+MAX_IMAGE_DIM = int(os.environ.get("MAX_IMAGE_DIM", "1200"))
+# Tesseract config for faster OCR (OEM 1 = LSTM engine, PSM 3 = Fully automatic page segmentation)
+TESSERACT_CONFIG = os.environ.get("TESSERACT_CONFIG", "--oem 1 --psm 3")
+# "chain" = cleanup, analysis and rating as three Cohere calls; "fused" = one structured-output call
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "chain")
+
+# ----------------------------
+# Text Cleanup Function
+# ----------------------------
+def clean_text(raw_text: str) -> str:
+    """Use Cohere to spell-check and make OCR text coherent."""
+    if not raw_text or not raw_text.strip():
+        return raw_text
+    
+    try:
+        cleanup_prompt = (
+            "You are a text cleanup assistant. Given OCR-extracted text that may contain spelling errors, "
+            "missing spaces, or formatting issues, correct all spelling mistakes and make the text coherent and readable. "
+            "Preserve the original meaning and structure. Only fix errors - do not add, remove, or rephrase content unnecessarily. "
+            "Output ONLY the corrected text without any preamble or explanation.\\n\\n"
+            f"Text to clean:\\n{raw_text}"
+        )
+        
+        response = llm.chat(
+            "cleanup",
+            message=cleanup_prompt,
+            max_tokens=500
+        )
+        
+        cleaned = response.text.strip()
+        return cleaned if cleaned else raw_text
+        
+    except LLMRateLimited:
+        raise
+    except Exception as e:
+        print(f"Text cleanup error: {e}")
+        return raw_text  # fallback to original text on error
+
+# ----------------------------
+# Confidence-gated cleanup
+# A crisp screenshot OCRs perfectly, so the LLM rewrite is skipped when Tesseract's
+# word confidences clear both thresholds. With only a few doubtful words, just those
+# are sent for correction instead of the whole text.
+# ----------------------------
+CLEANUP_SKIP_MEAN_CONF = float(os.environ.get("CLEANUP_SKIP_MEAN_CONF", "90"))
+CLEANUP_SKIP_MIN_CONF = float(os.environ.get("CLEANUP_SKIP_MIN_CONF", "60"))
+# Up to this many low-confidence words are corrected selectively; more means a full cleanup
+CLEANUP_SELECTIVE_MAX_WORDS = int(os.environ.get("CLEANUP_SELECTIVE_MAX_WORDS", "8"))
+CLEANUP_STATS = {"skipped": 0, "selective": 0, "full": 0}
+CLEANUP_STATS_LOCK = threading.Lock()
+
+def _count_cleanup(kind):
+    with CLEANUP_STATS_LOCK:
+        CLEANUP_STATS[kind] += 1
+
+def cleanup_stats() -> dict:
+    with CLEANUP_STATS_LOCK:
+        counters = dict(CLEANUP_STATS)
+    total = sum(counters.values())
+    counters["skip_ratio"] = round(counters["skipped"] / total, 4) if total else 0.0
+    return counters
+
+def is_json_object(text: str) -> bool:
+    try:
+        return isinstance(json.loads(text), dict)
+    except ValueError:
+        return False
+
+def correct_words(raw_text: str, suspect_words: list):
+    """Ask Cohere to correct only the listed low-confidence words. Returns None on failure."""
+    try:
+        prompt = (
+            "The text below was extracted by OCR. The listed words were recognized with low confidence "
+            "and may be misspelled. Using the surrounding text as context, return a JSON object mapping each "
+            "listed word to its corrected spelling (map a word to itself if it is already correct). "
+            "Do not include any other words.\n\n"
+            f"Words: {json.dumps(suspect_words)}\n\n"
+            f"Text:\n{raw_text}"
+        )
+        response = llm.chat(
+            "cleanup",
+            validate=is_json_object,
+            message=prompt,
+            max_tokens=20 * len(suspect_words) + 20,
+            response_format={"type": "json_object"},
+        )
+        corrections = json.loads(response.text)
+        if not isinstance(corrections, dict):
+            raise ValueError("corrections are not a JSON object")
+    except LLMRateLimited:
+        raise
+    except Exception as e:
+        print(f"Selective cleanup error: {e}")
+        return None
+    corrected = raw_text
+    for word in suspect_words:
+        fixed = corrections.get(word)
+        if isinstance(fixed, str) and fixed.strip() and fixed != word:
+            corrected = re.sub(rf"(?<!\S){re.escape(word)}(?!\S)", lambda _: fixed.strip(), corrected)
+    return corrected
+
+def clean_ocr_text(raw_text: str, words: list) -> str:
+    """Clean OCR output, spending LLM tokens only where Tesseract was unsure."""
+    if not raw_text or not raw_text.strip():
+        return raw_text
+    if words:
+        confidences = [conf for _, conf in words]
+        mean_conf = sum(confidences) / len(confidences)
+        suspect = list(dict.fromkeys(word for word, conf in words if conf < CLEANUP_SKIP_MIN_CONF))
+        if mean_conf >= CLEANUP_SKIP_MEAN_CONF:
+            if not suspect:
+                _count_cleanup("skipped")
+                return raw_text
+            if len(suspect) <= CLEANUP_SELECTIVE_MAX_WORDS:
+                corrected = correct_words(raw_text, suspect)
+                if corrected is not None:
+                    _count_cleanup("selective")
+                    return corrected
+    _count_cleanup("full")
+    return clean_text(raw_text)
+
+# ----------------------------
+# Image preprocessing
+# ----------------------------
+# "1" = draft/reduce decode path with EXIF orientation; "0" = plain full decode + thumbnail
+FAST_DECODE = os.environ.get("FAST_DECODE", "1") == "1"
+# draft()/reduce() stop at this multiple of the target size, leaving the rest to LANCZOS
+DECODE_REDUCING_GAP = float(os.environ.get("DECODE_REDUCING_GAP", "1.5"))
+# EXIF orientation tag value -> Image.Transpose member that displays the image upright
+EXIF_ORIENTATION_TRANSPOSE = {
+    2: "FLIP_LEFT_RIGHT",
+    3: "ROTATE_180",
+    4: "FLIP_TOP_BOTTOM",
+    5: "TRANSPOSE",
+    6: "ROTATE_270",
+    7: "TRANSVERSE",
+    8: "ROTATE_90",
+}
+
+# Images at least this many times taller than wide (scrolling screenshots) are only
+# limited in width, then OCR'd as horizontal strips in parallel
+TALL_IMAGE_RATIO = float(os.environ.get("TALL_IMAGE_RATIO", "2.5"))
+
+def is_tall(size) -> bool:
+    return size[1] >= size[0] * TALL_IMAGE_RATIO
+
+def fit_within(size, max_dim):
+    """Size scaled down (never up) to fit a max_dim x max_dim box, preserving aspect ratio.
+    Tall images only have their width limited so the text is not crushed."""
+    w, h = size
+    scale = min(1.0, max_dim / (w if is_tall(size) else max(w, h)))
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+def preprocess_image(image_bytes, max_dim=MAX_IMAGE_DIM, fast=None):
+    """Decode and downscale an upload for OCR; the "decode" and "resize" stages are timed separately."""
+    if fast is None:
+        fast = FAST_DECODE
+    with stage_timer("decode"):
+        img = Image.open(BytesIO(image_bytes))
+        # Phone photos are stored sideways with an EXIF orientation tag; the transpose is
+        # applied last, on the small image. Orientations 5-8 swap width and height, so the
+        # tall/fit decision is made on the upright size and the target swapped back.
+        orientation = img.getexif().get(0x0112) if fast else None
+        sideways = orientation in (5, 6, 7, 8)
+        target = fit_within(img.size[::-1] if sideways else img.size, max_dim)
+        if sideways:
+            target = target[::-1]
+        if target != img.size:
+            # JPEG: libjpeg scales by 1/2, 1/4 or 1/8 in the DCT domain while decoding,
+            # as long as the result still covers the target with some headroom (thumbnail()
+            # uses a gap of 2 on the plain path)
+            gap = DECODE_REDUCING_GAP if fast else 2.0
+            img.draft(None, (int(target[0] * gap), int(target[1] * gap)))
+        img.load()
+        # Keep original color mode (do NOT convert to grayscale).
+        # Convert palette images to RGB for compatibility, but otherwise keep color as-is.
+        if img.mode == 'P':
+            img = img.convert("RGB")
+
+    with stage_timer("resize"):
+        if not fast:
+            # downscale large images to speed up OCR while preserving aspect ratio
+            img.thumbnail(target, Image.LANCZOS)
+            return img
+        if target != img.size:
+            # Cheap integer box reduction first, then one LANCZOS resample to the exact size
+            factor = int(min(img.width / target[0], img.height / target[1]) / DECODE_REDUCING_GAP)
+            if factor > 1:
+                img = img.reduce(factor)
+            img = img.resize(target, Image.LANCZOS)
+        if orientation in EXIF_ORIENTATION_TRANSPOSE:
+            img = img.transpose(Image.Transpose[EXIF_ORIENTATION_TRANSPOSE[orientation]])
+    return img
+
+# ----------------------------
+# Strip OCR for tall scrolling screenshots
+# Cuts are placed in whitespace gaps found with a horizontal projection profile (edge
+# energy per row, so light and dark themes both work). A cut that has to go through
+# text gets an overlap, and the duplicated lines are dropped when stitching.
+# ----------------------------
+OCR_STRIP_HEIGHT = int(os.environ.get("OCR_STRIP_HEIGHT", "1200"))
+OCR_STRIP_OVERLAP = int(os.environ.get("OCR_STRIP_OVERLAP", "48"))
+
+def row_ink_profile(img) -> list:
+    """Mean edge strength of every pixel row (0 = blank row)."""
+    edges = img.convert("L").filter(ImageFilter.FIND_EDGES)
+    # A 1-pixel-wide BOX resize averages each row in C
+    return list(edges.resize((1, img.height), Image.BOX).tobytes())
+
+def find_strip_cuts(profile, strip_height) -> list:
+    """Return (cut row, is_clean_gap) pairs splitting the rows into ~strip_height strips."""
+    height = len(profile)
+    cuts = []
+    start = 0
+    while height - start > strip_height * 1.5:
+        # Look for the best gap in the last quarter of the strip window
+        lo, hi = start + int(strip_height * 0.75), min(height - 1, start + int(strip_height * 1.25))
+        window = profile[lo:hi]
+        quietest = min(window)
+        # Middle of the longest run of quietest rows, so the cut sits mid-gap
+        best_run, run_start = (0, lo), None
+        for i, value in enumerate(window + [float("inf")]):
+            if value <= quietest and run_start is None:
+                run_start = i
+            elif value > quietest and run_start is not None:
+                if i - run_start > best_run[0]:
+                    best_run = (i - run_start, lo + run_start)
+                run_start = None
+        cut = best_run[1] + best_run[0] // 2
+        cuts.append((cut, quietest < 1))
+        start = cut
+    return cuts
+
+def split_into_strips(img) -> list:
+    """Return (strip image, overlaps previous strip) pairs."""
+    cuts = find_strip_cuts(row_ink_profile(img), OCR_STRIP_HEIGHT)
+    strips, top, top_clean = [], 0, True
+    for cut, clean in cuts + [(img.height, True)]:
+        upper = top if top_clean else max(0, top - OCR_STRIP_OVERLAP)
+        lower = cut if clean else min(img.height, cut + OCR_STRIP_OVERLAP)
+        strips.append((img.crop((0, upper, img.width, lower)), not top_clean))
+        top, top_clean = cut, clean
+    return strips
+
+def stitch_strip_texts(strips, max_overlap_lines=3) -> str:
+    """Join (text, overlaps previous) strip results. Where strips overlap, leading lines
+    that repeat the end of the previous strip are dropped, and a line the previous strip
+    only had a fragment of replaces that fragment."""
+    def norm(line):
+        return re.sub(r"\W+", "", line.lower())
+
+    lines = []
+    for text, overlapped in strips:
+        strip_lines = text.strip("\n").split("\n")
+        skip = 0
+        while overlapped and skip < min(max_overlap_lines, len(strip_lines)):
+            key = norm(strip_lines[skip])
+            if not key:
+                skip += 1
+                continue
+            tail = [i for i in range(max(0, len(lines) - max_overlap_lines), len(lines)) if norm(lines[i])]
+            match = next((i for i in tail if key == norm(lines[i]) or key in norm(lines[i])), None)
+            if match is None:
+                match = next((i for i in tail if norm(lines[i]) in key), None)
+                if match is None:
+                    break
+                lines[match] = strip_lines[skip]
+            skip += 1
+        lines.extend(strip_lines[skip:])
+    return "\n".join(lines)
+
+# ----------------------------
+# OCR engine
+# pytesseract forks the tesseract binary, writes temp files and reloads the traineddata on
+# every call. The "tesserocr" engine instead keeps a pool of long-lived worker processes,
+# each holding one pre-loaded Tesseract API; images are sent as raw pixel buffers.
+# pytesseract stays as the fallback when tesserocr is unavailable or the pool fails.
+# ----------------------------
+# "auto" = tesserocr pool if installed, else pytesseract; or force "tesserocr" / "pytesseract"
+OCR_ENGINE = os.environ.get("OCR_ENGINE", "auto")
+OCR_POOL_SIZE = int(os.environ.get("OCR_POOL_SIZE", str(os.cpu_count() or 2)))
+OCR_LANG = os.environ.get("OCR_LANG", "eng")
+# Directory holding <lang>.traineddata for tesserocr; empty = library default
+TESSDATA_PREFIX = os.environ.get("TESSDATA_PREFIX", "")
+
+def parse_tesseract_config(config: str) -> dict:
+    """Translate a tesseract CLI config ("--oem 1 --psm 3 -c key=value") into tesserocr arguments."""
+    options = {"psm": None, "oem": None, "variables": {}}
+    tokens = config.split()
+    for i, token in enumerate(tokens[:-1]):
+        if token == "--psm":
+            options["psm"] = int(tokens[i + 1])
+        elif token == "--oem":
+            options["oem"] = int(tokens[i + 1])
+        elif token == "-c" and "=" in tokens[i + 1]:
+            key, value = tokens[i + 1].split("=", 1)
+            options["variables"][key] = value
+    return options
+
+# Per-process Tesseract handle inside pool workers
+_worker_tess_api = None
+
+def _ocr_worker_init(tessdata, lang, config):
+    global _worker_tess_api
+    import tesserocr
+    options = parse_tesseract_config(config)
+    kwargs = {"lang": lang}
+    if tessdata:
+        kwargs["path"] = tessdata
+    if options["psm"] is not None:
+        kwargs["psm"] = options["psm"]
+    if options["oem"] is not None:
+        kwargs["oem"] = options["oem"]
+    _worker_tess_api = tesserocr.PyTessBaseAPI(**kwargs)
+    for key, value in options["variables"].items():
+        _worker_tess_api.SetVariable(key, value)
+
+def _ocr_worker_ping():
+    return os.getpid()
+
+def _ocr_worker_run(mode, size, pixels):
+    img = Image.frombytes(mode, size, pixels)
+    _worker_tess_api.SetImage(img)
+    text = _worker_tess_api.GetUTF8Text()
+    return {"text": text, "words": [(word, float(conf)) for word, conf in _worker_tess_api.MapWordConfidences()]}
+
+def pytesseract_image_to_data(img) -> dict:
+    """OCR via pytesseract's image_to_data, rebuilding the text layout from its line numbers."""
+    configure_tesseract()
+    data = pytesseract.image_to_data(img, config=TESSERACT_CONFIG, output_type=pytesseract.Output.DICT)
+    words, lines = [], []
+    current_line, current_par, line_words = None, None, []
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if conf < 0 or not word.strip():
+            continue
+        words.append((word, conf))
+        line_key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if line_key != current_line:
+            if line_words:
+                lines.append(" ".join(line_words))
+            if current_par is not None and line_key[:2] != current_par:
+                lines.append("")  # blank line between paragraphs, like image_to_string
+            current_line, current_par, line_words = line_key, line_key[:2], []
+        line_words.append(word)
+    if line_words:
+        lines.append(" ".join(line_words))
+    return {"text": "\n".join(lines), "words": words}
+
+class OCREngine:
+    def __init__(self, engine, pool_size):
+        self.pool_size = max(1, pool_size)
+        self.engine = engine
+        if engine == "auto":
+            self.engine = "tesserocr" if importlib.util.find_spec("tesserocr") else "pytesseract"
+        self._pool = None
+        self._lock = threading.Lock()
+        self._counters = {"pool_calls": 0, "pytesseract_calls": 0, "pool_failures": 0, "strip_images": 0, "strips": 0}
+
+    def _get_pool(self):
+        # Created on first use (or by warm_up) so each forked server worker gets its own pool
+        with self._lock:
+            if self._pool is None:
+                methods = multiprocessing.get_all_start_methods()
+                # forkserver/spawn children start clean instead of inheriting a threaded parent
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                    mp_context=context,
+                    initializer=_ocr_worker_init,
+                    initargs=(TESSDATA_PREFIX, OCR_LANG, TESSERACT_CONFIG),
+                )
+            return self._pool
+
+    def warm_up(self):
+        """Start every pool worker and load its traineddata before the first upload."""
+        if self.engine != "tesserocr":
+            return
+        try:
+            pool = self._get_pool()
+            for future in [pool.submit(_ocr_worker_ping) for _ in range(self.pool_size)]:
+                future.result()
+        except Exception as e:
+            self._disable_pool(e)
+
+    def shutdown(self):
+        """Stop the worker pool, e.g. when a server worker exits."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _disable_pool(self, error):
+        print(f"OCR worker pool unavailable, falling back to pytesseract: {error}")
+        with self._lock:
+            self._counters["pool_failures"] += 1
+            self.engine = "pytesseract"
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def image_to_data(self, img) -> dict:
+        """Returns {'text': str, 'words': [(word, confidence 0-100), ...]}."""
+        if is_tall(img.size) and img.height > OCR_STRIP_HEIGHT * 1.5:
+            return self._strip_image_to_data(img)
+        return self._image_to_data_many([img])[0]
+
+    def _image_to_data_many(self, images) -> list:
+        """OCR several images concurrently across the pool."""
+        if self.engine == "tesserocr":
+            images = [img if img.mode in ("RGB", "RGBA", "L") else img.convert("RGB") for img in images]
+            try:
+                pool = self._get_pool()
+                futures = [pool.submit(_ocr_worker_run, img.mode, img.size, img.tobytes()) for img in images]
+                results = [future.result() for future in futures]
+                with self._lock:
+                    self._counters["pool_calls"] += len(images)
+                return results
+            except Exception as e:
+                self._disable_pool(e)
+        with self._lock:
+            self._counters["pytesseract_calls"] += len(images)
+        if len(images) == 1:
+            return [pytesseract_image_to_data(images[0])]
+        # Each pytesseract call is its own tesseract process, so threads give real parallelism
+        with ThreadPoolExecutor(max_workers=min(self.pool_size, len(images))) as executor:
+            return list(executor.map(pytesseract_image_to_data, images))
+
+    def _strip_image_to_data(self, img) -> dict:
+        strips = split_into_strips(img)
+        results = self._image_to_data_many([strip for strip, _ in strips])
+        with self._lock:
+            self._counters["strip_images"] += 1
+            self._counters["strips"] += len(strips)
+        return {
+            "text": stitch_strip_texts([(r["text"], overlapped) for r, (_, overlapped) in zip(results, strips)]),
+            "words": [word for r in results for word in r["words"]],
+        }
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, engine=self.engine, pool_size=self.pool_size if self.engine == "tesserocr" else 0)
+
+OCR = OCREngine(OCR_ENGINE, OCR_POOL_SIZE)
+
+# ----------------------------
+# Fact-check analysis (shared by /upload and /reanalyze)
+# ----------------------------
+def build_analysis_prompt(extracted_text: str) -> str:
+    return (
+        "You are a fact-check assistant.\n"
+        "Analyze the following text for factual accuracy.\n"
+        "Instructions:\n"
+        "1) Provide a clear, concise analysis explaining whether the claim(s) are accurate, misleading, or false.\n"
+        "2) Focus only on factual accuracy — do NOT mention grammar, spelling, punctuation, or style.\n"
+        "3) Be explicit about your conclusion: clearly state whether the statement is 'accurate', 'mostly accurate', "
+        "'partially true', 'misleading', 'mostly false', or 'false'.\n"
+        "4) Keep your analysis brief but informative (2-4 sentences).\n"
+        "5) Write in clear, coherent, and grammatically correct English. Use complete sentences with proper punctuation.\n"
+        "6) Do NOT use asterisks (*) anywhere in your response. No bold, no bullet markers with asterisks, no emphasis with asterisks.\n"
+        "7) After your analysis, output a blank line, then 'SOURCES:' on its own line, followed by 2-4 credible reference sources "
+        "that support your fact-check. Each source on its own line in this format: '- Source Title | https://example.com/page'\n"
+        "   Only cite real, well-known sources (e.g., Reuters, AP News, BBC, Wikipedia, WHO, CDC, official .gov sites, major newspapers). "
+        "Do NOT invent URLs.\n\n"
+        f"Text to evaluate:\n{extracted_text}"
+    )
+
+def derive_rating_from_analysis(analysis_text: str):
+    """Score the AI analysis 1-10 from its conclusion. The local verdict scorer answers
+    when the conclusion is clear; ambiguous analyses go to the LLM scorer."""
+    if not analysis_text or analysis_text.startswith('AI Error:'):
+        return None
+    if RATING_MODE == "local":
+        score, decided = score_analysis_locally(analysis_text)
+        if decided:
+            with RATING_STATS_LOCK:
+                RATING_STATS["local"] += 1
+            return score
+    with RATING_STATS_LOCK:
+        RATING_STATS["llm"] += 1
+    return rate_with_llm(analysis_text)
+
+RATING_REPLY_RE = re.compile(r"^\s*(N/A|([1-9]|10)\b)", re.IGNORECASE)
+
+def is_rating_reply(text: str) -> bool:
+    """The rating stage must answer with a 1-10 score or N/A."""
+    return bool(text and RATING_REPLY_RE.match(text))
+
+def rate_with_llm(analysis_text: str):
+    """Send the AI analysis to a second Cohere call that scores it 1-10
+    based on the sentiment/conclusion of the analysis."""
+    try:
+        rating_prompt = (
+            "You are a strict accuracy scoring system. Read the fact-check analysis below and output "
+            "a single accuracy score from 1 to 10.\n\n"
+            "CRITICAL RULES — you must follow these exactly:\n"
+            "1. Look for the conclusion keyword in the analysis (e.g. 'false', 'accurate', 'misleading', etc.)\n"
+            "2. If the analysis concludes the statement is FALSE, FABRICATED, DEBUNKED, INCORRECT, or COMPLETELY WRONG, "
+            "you MUST output 1 or 2. Never output higher than 2 for false statements.\n"
+            "3. If the analysis says MISLEADING, EXAGGERATED, LACKS CONTEXT, MOSTLY FALSE, or MOSTLY INACCURATE, output 3 or 4.\n"
+            "4. If the analysis says PARTIALLY TRUE, MIXED, or has significant caveats, output 5 or 6.\n"
+            "5. If the analysis says MOSTLY ACCURATE or LARGELY TRUE with only minor issues, output 7 or 8.\n"
+            "6. If the analysis says TRUE, ACCURATE, CORRECT, VERIFIED, or CONFIRMED with no caveats, output 9 or 10.\n"
+            "7. If the analysis cannot determine accuracy or says INSUFFICIENT INFO, output N/A.\n\n"
+            "IMPORTANT: A score of 9-10 should be RARE — only for clearly verified true statements. "
+            "When in doubt, score LOWER rather than higher.\n\n"
+            "Output ONLY the integer (1-10) or 'N/A'. Nothing else.\n\n"
+            f"Fact-check analysis:\n{analysis_text}"
+        )
+        resp = llm.chat(
+            "rating",
+            validate=is_rating_reply,
+            message=rating_prompt,
+            max_tokens=10
+        )
+        result = resp.text.strip().splitlines()[0].strip()
+        if result.upper() == 'N/A':
+            return None
+        m = re.match(r'^([1-9]|10)\b', result)
+        if m:
+            return apply_rating_guardrails(int(m.group(1)), analysis_text)
+        return None
+    except LLMRateLimited:
+        raise
+    except Exception as e:
+        print(f"Rating derivation error: {e}")
+        return None
+
+def apply_rating_guardrails(score: int, analysis_text: str) -> int:
+    # Sanity check: if the analysis states a "false" verdict, cap the score.
+    # Negated phrases ("not false", "no evidence that ... is false") don't count.
+    labels = {label for label, _, _ in find_verdicts(analysis_text)}
+    if "false" in labels and score > 3:
+        score = 2
+    elif labels & {"mostly false", "misleading"} and score > 5:
+        score = 4
+    return max(1, min(10, score))
+
+# ----------------------------
+# Local rating engine
+# Maps the analysis conclusion onto 1-10 in-process with multi-pattern verdict matching
+# and negation handling, so most analyses don't need a second LLM round trip.
+# ----------------------------
+# "local" = in-process scorer, LLM only for ambiguous verdicts; "llm" = always ask Cohere
+RATING_MODE = os.environ.get("RATING_MODE", "local")
+RATING_STATS = {"local": 0, "llm": 0}
+RATING_STATS_LOCK = threading.Lock()
+
+# phrase -> (verdict label, score); scores follow the rules of the LLM rating prompt
+VERDICT_PHRASES = {
+    "completely false": ("false", 1), "entirely false": ("false", 1), "totally false": ("false", 1),
+    "fabricated": ("false", 1), "debunked": ("false", 1), "hoax": ("false", 1), "completely wrong": ("false", 1),
+    "false": ("false", 2), "incorrect": ("false", 2), "untrue": ("false", 2), "inaccurate": ("false", 2),
+    "baseless": ("false", 2), "no evidence": ("false", 2),
+    "mostly false": ("mostly false", 3), "largely false": ("mostly false", 3),
+    "mostly inaccurate": ("mostly false", 3), "mostly incorrect": ("mostly false", 3), "largely inaccurate": ("mostly false", 3),
+    "misleading": ("misleading", 4), "exaggerated": ("misleading", 4), "lacks context": ("misleading", 4),
+    "lacking context": ("misleading", 4), "out of context": ("misleading", 4), "unsubstantiated": ("misleading", 4),
+    "partially true": ("partially true", 5), "partly true": ("partially true", 5), "half true": ("partially true", 5),
+    "partially accurate": ("partially true", 5), "partly accurate": ("partially true", 5), "mixed": ("partially true", 5),
+    "mostly accurate": ("mostly accurate", 7), "mostly true": ("mostly accurate", 7), "largely true": ("mostly accurate", 7),
+    "largely accurate": ("mostly accurate", 7), "mostly correct": ("mostly accurate", 7),
+    "accurate": ("accurate", 9), "true": ("accurate", 9), "correct": ("accurate", 9),
+    "verified": ("accurate", 9), "confirmed": ("accurate", 9), "factual": ("accurate", 9),
+    "cannot be verified": ("unverifiable", None), "could not be verified": ("unverifiable", None),
+    "can't be verified": ("unverifiable", None), "cannot verify": ("unverifiable", None),
+    "unable to verify": ("unverifiable", None), "impossible to verify": ("unverifiable", None),
+    "not possible to verify": ("unverifiable", None), "difficult to verify": ("unverifiable", None),
+    "cannot be confirmed": ("unverifiable", None), "could not be confirmed": ("unverifiable", None),
+    "unable to confirm": ("unverifiable", None), "unconfirmed": ("unverifiable", None),
+    "unverifiable": ("unverifiable", None), "unverified": ("unverifiable", None), "unproven": ("unverifiable", None),
+    "insufficient information": ("unverifiable", None), "insufficient info": ("unverifiable", None),
+    "not enough information": ("unverifiable", None), "not enough evidence": ("unverifiable", None),
+    "cannot determine": ("unverifiable", None), "can't determine": ("unverifiable", None),
+    "unable to determine": ("unverifiable", None), "cannot be determined": ("unverifiable", None),
+    "could not be determined": ("unverifiable", None), "unclear": ("unverifiable", None),
+    "uncertain": ("unverifiable", None), "inconclusive": ("unverifiable", None),
+}
+# One alternation, longest phrases first, so "mostly false" wins over "false" at the same position
+VERDICT_RE = re.compile(
+    r"\b(" + "|".join(re.escape(p) for p in sorted(VERDICT_PHRASES, key=len, reverse=True)) + r")\b"
+)
+# A negator within the three words before a verdict flips or voids it ("not false", "isn't accurate")
+NEGATION_BEFORE_RE = re.compile(r"(?:\bnot\b|n't\b|\bnever\b|\bno\b|\bhardly\b)(?:\W+\w+){0,2}\W*$")
+# "not entirely accurate" is a caveat, not a refutation
+PARTIAL_NEGATION_RE = re.compile(r"(?:\bnot\b|n't\b)\W+(?:entirely|completely|fully|wholly|totally|quite|100%)\W*$")
+# "no evidence that ... is false" negates the later verdict, up to the end of the clause
+NO_EVIDENCE_SCOPE_RE = re.compile(r"\bno evidence (?:that|to suggest|to show|to support)\b[^.;!?]*$")
+# Concessions ("while it is true that ...") are not the conclusion
+CONCESSION_AFTER_RE = re.compile(r"^\s+(?:that|in that)\b")
+# "The claim is false", "rated as misleading", "Verdict: accurate"
+VERDICT_CONTEXT_RE = re.compile(
+    r"(?:\b(?:is|are|was|were|be|as|remains|appears|seems|verdict|conclusion|rated|rating)\b(?:\W+\w+)?|:)\W*$"
+)
+# "whether the statement is true", "unclear if it is accurate": a question, not a verdict
+HYPOTHETICAL_BEFORE_RE = re.compile(r"\b(?:whether|if)\b[^.,;!?]*$")
+# "partially true but misleading": the second phrase is part of the stated verdict
+CONJOINED_RE = re.compile(r"^[^.;!?\w]*(?:\b(?:but|and|yet|though|although)\b)?[^.;!?\w]*(?:\b(?:also|still|somewhat|ultimately)\b)?[^.;!?\w]*$")
+
+def find_verdicts(analysis_text: str) -> list:
+    """Return (label, score, in_verdict_context) for each non-negated verdict phrase."""
+    text = analysis_text.lower().replace("\u2019", "'")
+    matches = list(VERDICT_RE.finditer(text))
+    verdicts = []
+    previous_end = None
+    for i, m in enumerate(matches):
+        phrase = m.group(1)
+        label, score = VERDICT_PHRASES[phrase]
+        before = text[max(0, m.start() - 60):m.start()]
+        if label != "unverifiable" and HYPOTHETICAL_BEFORE_RE.search(before):
+            continue
+        if phrase == "no evidence":
+            # It negates a verdict later in the same clause instead of being one itself
+            clause_end = re.search(r"[.;!?]", text[m.end():])
+            clause_end = m.end() + clause_end.start() if clause_end else len(text)
+            if any(later.start() < clause_end for later in matches[i + 1:]):
+                continue
+        elif NO_EVIDENCE_SCOPE_RE.search(text[:m.start()][-200:]):
+            continue
+        elif CONCESSION_AFTER_RE.match(text[m.end():]):
+            continue
+        elif NEGATION_BEFORE_RE.search(before):
+            if label not in ("accurate", "mostly accurate"):
+                continue  # "not false" / "not misleading" says nothing definite
+            if phrase in ("verified", "confirmed"):
+                label, score = "unverifiable", None  # "has not been verified" is not a refutation
+            elif PARTIAL_NEGATION_RE.search(before):
+                label, score = "misleading", 4
+            else:
+                label, score = "false", 2
+        stated = bool(VERDICT_CONTEXT_RE.search(before)) or (
+            previous_end is not None and verdicts[-1][2] and bool(CONJOINED_RE.match(text[previous_end:m.start()])))
+        verdicts.append((label, score, stated))
+        previous_end = m.end()
+    return verdicts
+
+def score_analysis_locally(analysis_text: str):
+    """Return (score, decided). score is None for 'unverifiable'; decided is False
+    when the analysis has no clear verdict and the LLM scorer should be asked."""
+    verdicts = find_verdicts(analysis_text)
+    if not verdicts:
+        return None, False
+    labels = {label for label, _, _ in verdicts}
+    if "unverifiable" in labels:
+        # Doubt outranks any verdict phrase next to it; with other verdicts, let the LLM decide
+        return None, labels == {"unverifiable"}
+    if len(labels) > 1:
+        # Conflicting phrases: trust the ones stated as the verdict ("the claim is X")
+        stated = [v for v in verdicts if v[2]]
+        if not stated:
+            return None, False
+        stated_scores = [score for _, score, _ in stated]
+        if min(stated_scores) <= 4 and max(stated_scores) >= 7:
+            return None, False  # stated as both true and false
+        verdicts = stated
+    # When in doubt, score lower
+    return min(score for _, score, _ in verdicts), True
+
+def rating_agreement_report(corpus_path: str, use_llm: bool = True) -> dict:
+    """Compare the local scorer (and optionally the LLM scorer) against a labeled corpus.
+
+    The corpus is JSONL with one {"analysis": str, "label": int 1-10 or null} per line.
+    """
+    def band(score):
+        if score is None:
+            return None
+        for label, score_range in VERDICT_SCORE_RANGES.items():
+            if score_range and score_range[0] <= score <= score_range[1]:
+                return label
+        return None
+
+    rows = []
+    with open(corpus_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rows.append(json.loads(line))
+
+    report = {"items": len(rows), "local_decided": 0, "local_band_agree": 0, "local_within_1": 0,
+              "llm_band_agree": 0, "llm_within_1": 0, "local_vs_llm_band_agree": 0, "disagreements": []}
+    for row in rows:
+        label = row.get("label")
+        local, decided = score_analysis_locally(row["analysis"])
+        llm_score = rate_with_llm(row["analysis"]) if use_llm else None
+        if decided:
+            report["local_decided"] += 1
+            report["local_band_agree"] += band(local) == band(label)
+            report["local_within_1"] += (local is None and label is None) or (
+                local is not None and label is not None and abs(local - label) <= 1)
+            if use_llm:
+                report["local_vs_llm_band_agree"] += band(local) == band(llm_score)
+            if band(local) != band(label):
+                report["disagreements"].append({"analysis": row["analysis"][:120], "label": label, "local": local, "llm": llm_score})
+        if use_llm:
+            report["llm_band_agree"] += band(llm_score) == band(label)
+            report["llm_within_1"] += (llm_score is None and label is None) or (
+                llm_score is not None and label is not None and abs(llm_score - label) <= 1)
+    return report
+
+def parse_sources(ai_output: str):
+    """Split AI output into (analysis, sources). Sources format: SOURCES: then "- Title | URL" lines."""
+    sources_list = []
+    if 'SOURCES:' not in ai_output:
+        return ai_output, sources_list
+    parts = ai_output.split('SOURCES:', 1)
+    analysis = parts[0].strip()
+    sources_raw = parts[1].strip()
+    for line in sources_raw.split('\n'):
+        line = line.strip()
+        if line.startswith('- '):
+            line = line[2:].strip()
+        if not line or line.upper() == 'SOURCES:':
+            continue
+        if '|' in line:
+            name, url = line.split('|', 1)
+            name = name.strip()
+            url = url.strip()
+            if name:
+                sources_list.append({'name': name, 'url': url})
+        elif line.startswith('http'):
+            sources_list.append({'name': line, 'url': line})
+        elif line:
+            sources_list.append({'name': line, 'url': ''})
+    return analysis, sources_list
+
+def has_sources_block(text: str) -> bool:
+    """The analysis stage must end with the SOURCES: block parse_sources expects."""
+    return bool(text) and 'SOURCES:' in text and bool(text.split('SOURCES:', 1)[0].strip())
+
+def iter_analysis(extracted_text: str, fuzzy_cache: bool = True):
+    """Staged fact-check analysis and rating for a claim text.
+
+    Yields ("analysis" | "rating" | "sources", payload) progress events as each stage
+    finishes and returns {'ai_output', 'rating', 'sources'}. With fuzzy_cache=False only
+    an analysis of the exact same (normalized) text is reused.
+    """
+    # Near-identical claims (OCR noise) reuse a stored analysis
+    cached = CLAIM_CACHE.get(extracted_text, fuzzy=fuzzy_cache)
+    CACHE_LOOKUPS.inc(cache="claim", outcome="miss" if cached is None else "hit")
+    if cached is not None:
+        return cached
+
+    # Step 1: AI Analysis
+    try:
+        with stage_timer("analysis"):
+            response = llm.chat(
+                "analysis",
+                validate=has_sources_block,
+                message=build_analysis_prompt(extracted_text),
+                max_tokens=350
+            )
+        ai_output = response.text.strip()
+    except LLMRateLimited:
+        raise
+    except Exception as e:
+        ai_output = f"AI Error: {e}"
+
+    # Strip any asterisks the AI might have included
+    ai_output = ai_output.replace('*', '')
+    ai_analysis_display, sources_list = parse_sources(ai_output)
+    yield "analysis", {'ai_output': ai_analysis_display}
+
+    # Step 2: Derive rating from analysis sentiment (sources stripped first)
+    with stage_timer("rating"):
+        rating = derive_rating_from_analysis(ai_analysis_display)
+    yield "rating", rating_fields(rating)
+    yield "sources", {'sources': sources_list}
+
+    result = {'ai_output': ai_analysis_display, 'rating': rating, 'sources': sources_list}
+    if not ai_analysis_display.startswith('AI Error:'):
+        CLAIM_CACHE.put(extracted_text, result)
+    return result
+
+def run_pipeline(events):
+    """Drain a staged pipeline generator and return its result."""
+    while True:
+        try:
+            next(events)
+        except StopIteration as stop:
+            return stop.value
+
+def analyze_text(extracted_text: str, fuzzy_cache: bool = True) -> dict:
+    """Run the fact-check analysis and rating for a claim text.
+    Returns {'ai_output', 'rating', 'sources'}."""
+    return run_pipeline(iter_analysis(extracted_text, fuzzy_cache))
+
+def rating_fields(rating) -> dict:
+    """Rating plus the derived percentage and bar color shown on the result page."""
+    rating_percent = (rating * 10) if rating is not None else 0
+    bar_color = compute_bar_color(rating_percent) or 'var(--accent)'
+    return {'rating': rating, 'rating_percent': rating_percent, 'bar_color': bar_color}
+
+def compute_bar_color(percent: int):
+    try:
+        p = int(percent)
+    except Exception:
+        return None
+    if p <= 0:
+        return None
+    if p <= 50:
+        # interpolate red (255,0,0) -> yellow (255,255,0)
+        ratio = p / 50.0
+        r = 255
+        g = round(255 * ratio)
+        b = 0
+    else:
+        # interpolate yellow (255,255,0) -> green (0,200,0)
+        ratio = (p - 50) / 50.0
+        r = round(255 * (1 - ratio))
+        g = round(255 - 55 * ratio)
+        b = 0
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+# ----------------------------
+# Fused pipeline: cleanup + analysis + rating + sources in one structured-output call
+# ----------------------------
+# Verdict label -> allowed score range, mirroring the rules of the rating prompt
+VERDICT_SCORE_RANGES = {
+    "false": (1, 2),
+    "mostly false": (3, 4),
+    "misleading": (3, 4),
+    "partially true": (5, 6),
+    "mostly accurate": (7, 8),
+    "accurate": (9, 10),
+    "unverifiable": None,
+}
+
+FUSED_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "cleaned_text": {"type": "string"},
+        "verdict": {"type": "string", "enum": list(VERDICT_SCORE_RANGES)},
+        "explanation": {"type": "string"},
+        "score": {"type": ["integer", "null"]},
+        "sources": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"title": {"type": "string"}, "url": {"type": "string"}},
+                "required": ["title", "url"],
+            },
+        },
+    },
+    "required": ["cleaned_text", "verdict", "explanation", "score", "sources"],
+}
+
+def build_fused_prompt(raw_text: str) -> str:
+    return (
+        "You are a fact-check assistant. The text below was extracted from a screenshot by OCR.\n"
+        "Respond with a single JSON object with these fields:\n"
+        "- cleaned_text: the OCR text with spelling mistakes, missing spaces and formatting issues fixed. "
+        "Preserve the original meaning and structure; do not add, remove, or rephrase content unnecessarily.\n"
+        "- verdict: one of 'accurate', 'mostly accurate', 'partially true', 'misleading', 'mostly false', 'false', "
+        "or 'unverifiable' if accuracy cannot be determined.\n"
+        "- explanation: a clear, concise analysis (2-4 complete sentences) of the factual accuracy of the claim(s), "
+        "explicitly stating the verdict. Focus only on factual accuracy, not grammar or style. Do NOT use asterisks.\n"
+        "- score: accuracy from 1 to 10 (1-2 false, 3-4 misleading or mostly false, 5-6 partially true, "
+        "7-8 mostly accurate, 9-10 accurate; 9-10 should be RARE), or null if unverifiable. When in doubt, score lower.\n"
+        "- sources: 2-4 credible references supporting the fact-check, each {\"title\": ..., \"url\": ...}. "
+        "Only cite real, well-known sources (e.g., Reuters, AP News, BBC, Wikipedia, WHO, CDC, official .gov sites, "
+        "major newspapers). Do NOT invent URLs.\n\n"
+        f"OCR text:\n{raw_text}"
+    )
+
+def is_fused_reply(text: str) -> bool:
+    try:
+        data = json.loads(text)
+        return (isinstance(data, dict) and str(data.get("verdict", "")).strip().lower() in VERDICT_SCORE_RANGES
+                and bool(str(data.get("cleaned_text", "")).strip()) and bool(str(data.get("explanation", "")).strip()))
+    except ValueError:
+        return False
+
+def fused_analysis(raw_text: str):
+    """One Cohere call returning cleaned text, verdict, explanation, score and sources.
+    Returns a pipeline result dict, or None if the call fails or the output does not validate."""
+    try:
+        response = llm.chat(
+            "fused",
+            validate=is_fused_reply,
+            message=build_fused_prompt(raw_text),
+            max_tokens=900,
+            response_format={"type": "json_object", "schema": FUSED_RESPONSE_SCHEMA},
+        )
+        data = json.loads(response.text)
+        cleaned = str(data["cleaned_text"]).strip()
+        verdict = str(data["verdict"]).strip().lower()
+        explanation = str(data["explanation"]).replace('*', '').strip()
+        if not cleaned or not explanation or verdict not in VERDICT_SCORE_RANGES:
+            raise ValueError(f"incomplete fused output (verdict={verdict!r})")
+        score_range = VERDICT_SCORE_RANGES[verdict]
+        rating = None
+        if score_range is not None:
+            score = data.get("score")
+            score = int(score) if score is not None else score_range[1]
+            # Keep the score consistent with the verdict label
+            rating = apply_rating_guardrails(max(score_range[0], min(score_range[1], score)), explanation)
+        sources_list = []
+        for src in data.get("sources") or []:
+            name = str(src.get("title", "")).strip()
+            url = str(src.get("url", "")).strip()
+            if name or url:
+                sources_list.append({'name': name or url, 'url': url})
+    except LLMRateLimited:
+        raise
+    except Exception as e:
+        print(f"Fused analysis error, falling back to chain: {e}")
+        return None
+
+    result = {'ai_output': explanation, 'rating': rating, 'sources': sources_list}
+    CLAIM_CACHE.put(cleaned, result)
+    return dict(result, extracted_text=cleaned)
+
+# ----------------------------
+# Result cache (content-addressed by SHA-256 of the uploaded bytes)
+# Tier 1: in-process LRU bounded by total payload size
+# Tier 2: SQLite on disk with a TTL, survives restarts and is shared between workers
+# ----------------------------
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Path of the SQLite file; set to an empty string to disable the disk tier
+RESULT_CACHE_DB = os.environ.get("RESULT_CACHE_DB", "infobait_cache.sqlite3")
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", str(7 * 24 * 3600)))
+# Expired rows are deleted at most this often rather than on every write
+RESULT_CACHE_PURGE_INTERVAL = 3600
+
+class ResultCache:
+    def __init__(self, max_bytes, db_path, ttl):
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self.ttl = ttl
+        self._lru = OrderedDict()  # key -> (JSON payload, created timestamp)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "purged": 0}
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+                    conn.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+            except sqlite3.Error as e:
+                print(f"Result cache disk tier disabled: {e}")
+                self.db_path = ""
+
+    def _connect(self):
+        # A fresh connection per operation keeps this safe across threads and forked workers
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _remember(self, key, payload, created):
+        # caller holds the lock
+        if key in self._lru:
+            self._bytes -= len(self._lru.pop(key)[0])
+        if len(payload) > self.max_bytes:
+            return
+        self._lru[key] = (payload, created)
+        self._bytes += len(payload)
+        while self._bytes > self.max_bytes:
+            _, (evicted, _) = self._lru.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._counters["evictions"] += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None and time.time() - entry[1] > self.ttl:
+                self._bytes -= len(self._lru.pop(key)[0])
+                entry = None
+            if entry is not None:
+                self._lru.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return json.loads(entry[0])
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+                    if row and time.time() - row[1] > self.ttl:
+                        conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                        row = None
+            except sqlite3.Error as e:
+                print(f"Result cache read error: {e}")
+                row = None
+            if row:
+                with self._lock:
+                    self._remember(key, row[0], row[1])
+                    self._counters["disk_hits"] += 1
+                return json.loads(row[0])
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def put(self, key, value):
+        payload = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._remember(key, payload, now)
+            self._counters["stores"] += 1
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("INSERT OR REPLACE INTO results (key, value, created) VALUES (?, ?, ?)", (key, payload, now))
+            except sqlite3.Error as e:
+                print(f"Result cache write error: {e}")
+            self._maybe_purge()
+
+    def _maybe_purge(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < RESULT_CACHE_PURGE_INTERVAL:
+                return
+            self._last_purge = now
+        try:
+            with self._connect() as conn:
+                purged = conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,)).rowcount
+        except sqlite3.Error as e:
+            print(f"Result cache purge error: {e}")
+            return
+        with self._lock:
+            self._counters["purged"] += purged
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            counters["memory_entries"] = len(self._lru)
+            counters["memory_bytes"] = self._bytes
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        counters["hit_ratio"] = round((counters["memory_hits"] + counters["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return counters
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_DB, RESULT_CACHE_TTL)
+
+# ----------------------------
+# Blob store for uploaded images (content-addressed by SHA-256, on local disk)
+# The result page references /img/<id> instead of embedding the image as base64,
+# so the browser fetches it once, caches it forever and never posts it back.
+# ----------------------------
+BLOB_DIR = os.environ.get("BLOB_DIR", "infobait_blobs")
+BLOB_TTL = int(os.environ.get("BLOB_TTL", str(7 * 24 * 3600)))
+BLOB_PURGE_INTERVAL = 3600
+BLOB_ID_RE = re.compile(r"[0-9a-f]{64}")
+
+class BlobStore:
+    def __init__(self, root, ttl):
+        self.root = root
+        self.ttl = ttl
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"stores": 0, "dedups": 0, "purged": 0}
+
+    def path(self, blob_id):
+        """Path of a blob on disk, or None if the id is malformed."""
+        if not blob_id or not BLOB_ID_RE.fullmatch(blob_id):
+            return None
+        return os.path.join(self.root, blob_id[:2], blob_id)
+
+    def put(self, data: bytes) -> str:
+        blob_id = hashlib.sha256(data).hexdigest()
+        path = self.path(blob_id)
+        if os.path.exists(path):
+            # refresh the mtime so the TTL counts from the latest upload
+            os.utime(path)
+            with self._lock:
+                self._counters["dedups"] += 1
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write to a temp file and rename so readers never see a partial blob
+            tmp_path = f"{path}.{secrets.token_hex(4)}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._counters["stores"] += 1
+        self._maybe_purge()
+        return blob_id
+
+    def get(self, blob_id):
+        path = self.path(blob_id)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _maybe_purge(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < BLOB_PURGE_INTERVAL:
+                return
+            self._last_purge = now
+        purged = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    if now - os.path.getmtime(path) > self.ttl:
+                        os.remove(path)
+                        purged += 1
+                except OSError:
+                    pass
+        with self._lock:
+            self._counters["purged"] += purged
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+BLOBS = BlobStore(BLOB_DIR, BLOB_TTL)
+
+# ----------------------------
+# Near-duplicate index (perceptual hash + OCR text)
+# Re-shared screenshots are recompressed, resized or cropped by a few pixels, so their
+# bytes differ. Each analysed screenshot's difference hash (dHash) goes into a
+# multi-index hashing table: the hash is split into PHASH_MAX_DISTANCE + 1 chunks, and
+# any hash within that Hamming distance shares at least one chunk exactly, so a lookup
+# only compares the hashes filed under the query's chunks.
+# The layout alone can't tell two posts apart: a dHash of a text screenshot is mostly
+# zero bits, so different claims in the same layout land within a few bits of each
+# other. A layout match is therefore only reused once the new OCR text matches the
+# cached text up to OCR-style character errors. A re-share still pays for OCR, but
+# skips the cleanup, analysis and rating calls.
+# ----------------------------
+PHASH_ENABLED = os.environ.get("PHASH_ENABLED", "1") == "1"
+# dHash grid size; the hash has PHASH_SIZE * PHASH_SIZE bits
+PHASH_SIZE = int(os.environ.get("PHASH_SIZE", "16"))
+# Maximum Hamming distance for two uploads to count as the same layout
+PHASH_MAX_DISTANCE = int(os.environ.get("PHASH_MAX_DISTANCE", "12"))
+# Screenshots indexed per server worker, about 1.5 KB each
+PHASH_INDEX_MAX_ENTRIES = int(os.environ.get("PHASH_INDEX_MAX_ENTRIES", "500000"))
+# Screenshots kept per chunk value; bounds the lookup cost of the all-zero chunks that
+# every plain text screenshot shares
+PHASH_BUCKET_MAX = int(os.environ.get("PHASH_BUCKET_MAX", "64"))
+# Closest layout matches whose text is compared with the new OCR text
+PHASH_TEXT_CHECKS = int(os.environ.get("PHASH_TEXT_CHECKS", "4"))
+# Minimum character similarity (difflib ratio) of each run of differing words
+PHASH_TEXT_MIN_RATIO = float(os.environ.get("PHASH_TEXT_MIN_RATIO", "0.75"))
+
+def dhash(img, hash_size=PHASH_SIZE) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a tiny grayscale thumbnail."""
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def ocr_words_match(words, other) -> bool:
+    """True when two normalized word lists differ only by OCR-style errors: numbers and
+    negations agree and every run of differing words is a close spelling of the other.
+    A swapped word ("coffee" / "bleach") fails, where a shingle similarity would not."""
+    if not words or not other:
+        return False
+    if words == other:
+        return True
+    if claim_guard(words) != claim_guard(other):
+        return False
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, words, other, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+        left, right = " ".join(words[i1:i2]), " ".join(other[j1:j2])
+        if difflib.SequenceMatcher(None, left, right, autojunk=False).ratio() < PHASH_TEXT_MIN_RATIO:
+            return False
+    return True
+
+class NearDuplicateIndex:
+    """Multi-index hashing over dHashes, mapping each to a result cache key.
+
+    A lookup touches one bucket per chunk, each holding at most `bucket_max` hashes, so
+    it stays constant-time however many screenshots are indexed. A bucket with a single
+    screenshot holds its bare entry id, which keeps an entry near 1.5 KB.
+    """
+
+    def __init__(self, max_entries, max_distance, bucket_max, hash_bits=PHASH_SIZE * PHASH_SIZE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.bucket_max = bucket_max
+        chunks = max(1, min(max_distance + 1, hash_bits))
+        bounds = [i * hash_bits // chunks for i in range(chunks + 1)]
+        self._chunks = [(low, high - low) for low, high in zip(bounds, bounds[1:])]  # (shift, width)
+        self._tables = [{} for _ in self._chunks]  # chunk value -> entry id or [entry id], oldest first
+        self._entries = OrderedDict()  # entry id -> (dHash, result cache key), LRU order
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "text_mismatches": 0}
+
+    def _chunk_values(self, h):
+        return [(h >> shift) & ((1 << width) - 1) for shift, width in self._chunks]
+
+    def add(self, h, key):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (h, key)
+            for table, value in zip(self._tables, self._chunk_values(h)):
+                bucket = table.get(value)
+                if bucket is None:
+                    table[value] = entry_id
+                elif isinstance(bucket, int):
+                    table[value] = [bucket, entry_id]
+                else:
+                    bucket.append(entry_id)
+                    if len(bucket) > self.bucket_max:
+                        del bucket[0]
+            while len(self._entries) > self.max_entries:
+                old_id, (old_h, _) = self._entries.popitem(last=False)
+                for table, value in zip(self._tables, self._chunk_values(old_h)):
+                    bucket = table.get(value)
+                    if bucket == old_id:
+                        del table[value]
+                    elif isinstance(bucket, list) and old_id in bucket:
+                        bucket.remove(old_id)
+                        if len(bucket) == 1:
+                            table[value] = bucket[0]
+
+    def find(self, h):
+        """Indexed screenshots within max_distance of h as [(distance, entry id, key)], closest first."""
+        with self._lock:
+            seen = set()
+            for table, value in zip(self._tables, self._chunk_values(h)):
+                bucket = table.get(value)
+                if isinstance(bucket, int):
+                    seen.add(bucket)
+                elif bucket:
+                    seen.update(bucket)
+            candidates = []
+            for entry_id in seen:
+                entry = self._entries.get(entry_id)
+                if entry is None:
+                    continue
+                distance = (entry[0] ^ h).bit_count()
+                if distance <= self.max_distance:
+                    candidates.append((distance, entry_id, entry[1]))
+            if not candidates:
+                self._counters["misses"] += 1
+        candidates.sort()
+        return candidates
+
+    def confirm(self, candidates, ocr_text, fetch):
+        """The cached result of the closest candidate whose text matches `ocr_text`, or None.
+        fetch(key) returns the cached result for a key (None once it has expired)."""
+        words = normalize_claim_text(ocr_text)
+        for _, entry_id, key in candidates[:PHASH_TEXT_CHECKS]:
+            result = fetch(key)
+            if result is not None and ocr_words_match(words, normalize_claim_text(result.get('extracted_text', ''))):
+                with self._lock:
+                    if entry_id in self._entries:
+                        self._entries.move_to_end(entry_id)
+                    self._counters["hits"] += 1
+                return result
+        with self._lock:
+            self._counters["text_mismatches"] += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries))
+
+NEAR_DUP_INDEX = NearDuplicateIndex(PHASH_INDEX_MAX_ENTRIES, PHASH_MAX_DISTANCE, PHASH_BUCKET_MAX)
+
+# ----------------------------
+# Claim text cache (MinHash / LSH over word shingles)
+# The same claim arrives with small OCR differences. Texts are normalized, shingled into
+# word n-grams and MinHashed; LSH banding finds candidates, which are then checked against
+# CLAIM_CACHE_THRESHOLD (Jaccard similarity). A one-word edit that changes the meaning
+# still passes that check, so /reanalyze (whose point is fixing such a word) only reuses
+# an analysis of the exact same text.
+# ----------------------------
+CLAIM_CACHE_ENABLED = os.environ.get("CLAIM_CACHE_ENABLED", "1") == "1"
+CLAIM_CACHE_THRESHOLD = float(os.environ.get("CLAIM_CACHE_THRESHOLD", "0.8"))
+CLAIM_CACHE_SHINGLE_SIZE = int(os.environ.get("CLAIM_CACHE_SHINGLE_SIZE", "2"))
+# CLAIM_CACHE_PERMUTATIONS must be divisible by CLAIM_CACHE_BANDS
+CLAIM_CACHE_PERMUTATIONS = int(os.environ.get("CLAIM_CACHE_PERMUTATIONS", "64"))
+CLAIM_CACHE_BANDS = int(os.environ.get("CLAIM_CACHE_BANDS", "16"))
+CLAIM_CACHE_MAX_ENTRIES = int(os.environ.get("CLAIM_CACHE_MAX_ENTRIES", "50000"))
+
+# Words that flip or quantify a claim; texts must agree on these to share a verdict
+NEGATION_WORDS = {"not", "no", "never", "none", "nobody", "nothing", "neither", "nor", "without", "cannot"}
+
+def normalize_claim_text(text: str) -> list:
+    """Lowercase, strip accents/punctuation and split into words."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = text.replace("n't", " not")
+    return re.findall(r"[a-z0-9]+(?:[.,][0-9]+)*", text)
+
+def claim_guard(words) -> tuple:
+    """Numbers and negations decide the verdict, so texts sharing one must agree on them exactly."""
+    return tuple(sorted(w for w in words if w[0].isdigit())), sum(w in NEGATION_WORDS for w in words)
+
+class ClaimCache:
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, threshold, shingle_size, permutations, bands, max_entries):
+        if permutations % bands:
+            raise ValueError(f"permutations ({permutations}) must be divisible by bands ({bands})")
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.bands = bands
+        self.rows = permutations // bands
+        self.max_entries = max_entries
+        # Fixed seed so every worker process computes identical signatures
+        rng = random.Random(0x1BA17)
+        self._perms = [(rng.randrange(1, self._PRIME), rng.randrange(0, self._PRIME)) for _ in range(permutations)]
+        self._entries = OrderedDict()  # entry id -> (guard, shingles, band keys, result, exact key)
+        self._buckets = {}  # (band, band signature) -> set of entry ids
+        self._exact = {}  # normalized text -> entry id
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _features(self, text):
+        words = normalize_claim_text(text)
+        if not words:
+            return None
+        guard = claim_guard(words)
+        k = min(self.shingle_size, len(words))
+        shingles = frozenset(
+            zlib.crc32(" ".join(words[i:i + k]).encode("utf-8")) for i in range(len(words) - k + 1)
+        )
+        signature = [min((a * h + b) % self._PRIME for h in shingles) for a, b in self._perms]
+        band_keys = [(band, tuple(signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+        return guard, shingles, band_keys, " ".join(words)
+
+    def get(self, text, fuzzy=True):
+        """Stored result for text, or for a similar text when fuzzy is set."""
+        if not CLAIM_CACHE_ENABLED:
+            return None
+        if not fuzzy:
+            exact_key = " ".join(normalize_claim_text(text))
+            with self._lock:
+                entry_id = self._exact.get(exact_key)
+                if entry_id is None:
+                    self._counters["misses"] += 1
+                    return None
+                self._entries.move_to_end(entry_id)
+                self._counters["hits"] += 1
+                return json.loads(self._entries[entry_id][3])
+        features = self._features(text)
+        if features is None:
+            return None
+        guard, shingles, band_keys, _ = features
+        best = None
+        with self._lock:
+            candidates = set()
+            for key in band_keys:
+                candidates.update(self._buckets.get(key, ()))
+            for entry_id in candidates:
+                entry_guard, entry_shingles, _, result, _ = self._entries[entry_id]
+                if entry_guard != guard:
+                    continue
+                similarity = len(shingles & entry_shingles) / len(shingles | entry_shingles)
+                if similarity >= self.threshold and (best is None or similarity > best[0]):
+                    best = (similarity, entry_id, result)
+            if best is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(best[1])
+            self._counters["hits"] += 1
+        return json.loads(best[2])
+
+    def put(self, text, result):
+        if not CLAIM_CACHE_ENABLED:
+            return
+        features = self._features(text)
+        if features is None:
+            return
+        guard, shingles, band_keys, exact_key = features
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (guard, shingles, band_keys, json.dumps(result), exact_key)
+            self._exact[exact_key] = entry_id
+            for key in band_keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            self._counters["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                old_id, (_, _, old_keys, _, old_exact) = self._entries.popitem(last=False)
+                if self._exact.get(old_exact) == old_id:
+                    del self._exact[old_exact]
+                for key in old_keys:
+                    bucket = self._buckets.get(key)
+                    if bucket is not None:
+                        bucket.discard(old_id)
+                        if not bucket:
+                            del self._buckets[key]
+                self._counters["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries))
+
+CLAIM_CACHE = ClaimCache(CLAIM_CACHE_THRESHOLD, CLAIM_CACHE_SHINGLE_SIZE, CLAIM_CACHE_PERMUTATIONS, CLAIM_CACHE_BANDS, CLAIM_CACHE_MAX_ENTRIES)
+
+# ----------------------------
+# Upload pipeline: image bytes -> {'extracted_text', 'ai_output', 'rating', 'sources'}
+# ----------------------------
+def ocr_upload(file_bytes: bytes) -> dict:
+    """First half of the upload pipeline: cache lookups, preprocessing and OCR.
+    Returns {'cache_key', 'phash', 'result'} on a cache hit, else {'cache_key', 'phash', 'ocr'}."""
+    # Identical uploads (viral screenshots) are served from the result cache
+    cache_key = hashlib.sha256(file_bytes).hexdigest()
+    with stage_timer("result_cache"):
+        result = RESULT_CACHE.get(cache_key)
+    CACHE_LOOKUPS.inc(cache="result", outcome="miss" if result is None else "hit")
+    if result is not None:
+        return {'cache_key': cache_key, 'phash': None, 'result': result}
+
+    # ----------------------------
+    # OCR Step (preprocess image for speed)
+    # ----------------------------
+    img = preprocess_image(file_bytes)
+
+    # Screenshots with a near-identical layout; one is reused below if its text matches too
+    phash, candidates = None, []
+    if PHASH_ENABLED:
+        with stage_timer("near_duplicate"):
+            phash = dhash(img)
+            candidates = NEAR_DUP_INDEX.find(phash)
+
+    with stage_timer("ocr"):
+        ocr = OCR.image_to_data(img)
+
+    if PHASH_ENABLED:
+        result = None
+        if candidates:
+            with stage_timer("near_duplicate_text"):
+                result = NEAR_DUP_INDEX.confirm(candidates, ocr['text'], RESULT_CACHE.get)
+        CACHE_LOOKUPS.inc(cache="near_duplicate", outcome="miss" if result is None else "hit")
+        if result is not None:
+            RESULT_CACHE.put(cache_key, result)
+            return {'cache_key': cache_key, 'phash': phash, 'result': result}
+
+    return {'cache_key': cache_key, 'phash': phash, 'ocr': ocr}
+
+def iter_text_pipeline(upload: dict):
+    """Second half of the upload pipeline: cleanup, analysis and rating of the OCR text
+    from ocr_upload(), then caching. Yields progress events like iter_upload_pipeline."""
+    ocr = upload['ocr']
+    extracted_text = ocr['text']
+
+    # Fused mode: cleanup, analysis and rating in one call; falls back to the chain below
+    result = None
+    if PIPELINE_MODE == "fused" and extracted_text.strip():
+        with stage_timer("fused"):
+            result = fused_analysis(extracted_text)
+
+    if result is None:
+        # Clean up OCR text (spell-check and make coherent), skipped when OCR was confident
+        with stage_timer("cleanup"):
+            extracted_text = clean_ocr_text(extracted_text, ocr['words'])
+        yield "cleaned", {'text': extracted_text}
+
+        # ----------------------------
+        # Cohere Chat API — analysis, rating and sources
+        # ----------------------------
+        result = yield from iter_analysis(extracted_text)
+        result['extracted_text'] = extracted_text
+
+    # Don't cache upstream failures; the next upload should retry them
+    if not result['ai_output'].startswith('AI Error:'):
+        RESULT_CACHE.put(upload['cache_key'], result)
+        if upload['phash'] is not None:
+            NEAR_DUP_INDEX.add(upload['phash'], upload['cache_key'])
+    return result
+
+def iter_upload_pipeline(file_bytes: bytes):
+    """Staged upload pipeline. Yields ("ocr" | "cleaned" | "analysis" | "rating" | "sources",
+    payload) progress events and returns {'extracted_text', 'ai_output', 'rating', 'sources'}."""
+    upload = ocr_upload(file_bytes)
+    if 'result' in upload:
+        return upload['result']
+    yield "ocr", {'text': upload['ocr']['text']}
+    return (yield from iter_text_pipeline(upload))
+
+def process_upload(file_bytes: bytes) -> dict:
+    return run_pipeline(iter_upload_pipeline(file_bytes))
+
+# ----------------------------
+# Batch uploads
+# ----------------------------
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "50"))
+# Cap on images of one batch in the Cohere stages at the same time
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", "4"))
+# LLM calls a batch is charged per image against the client's rate limit, up front
+BATCH_LLM_CALLS_PER_IMAGE = float(os.environ.get("BATCH_LLM_CALLS_PER_IMAGE", "2"))
+
+def process_batch(items) -> list:
+    """Run the pipeline over [(filename, file bytes)]: OCR for all images in parallel,
+    then the Cohere stages concurrently. A failing item gets an error entry instead of
+    failing the batch."""
+    def ocr_item(item):
+        filename, file_bytes = item
+        if not file_bytes:
+            return {'error': "Uploaded file is empty"}
+        try:
+            return ocr_upload(file_bytes)
+        except Exception as e:
+            print(f"Batch OCR error ({filename}): {e}")
+            return {'error': "Could not read this image"}
+
+    def analyze_item(upload):
+        if 'error' in upload or 'result' in upload:
+            return upload
+        try:
+            return {'result': run_pipeline(iter_text_pipeline(upload))}
+        except LLMRateLimited as e:
+            return {'error': f"Too many requests, retry in {e.retry_after}s"}
+        except Exception as e:
+            print(f"Batch analysis error: {e}")
+            return {'error': "Analysis failed"}
+
+    def timed(fn, arg):
+        # Each item collects its own stage timings; the request thread merges them below
+        timings = {}
+        STAGE_TIMINGS.set(timings)
+        return fn(arg), timings
+
+    def run_items(fn, args, workers):
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(args)))) as executor:
+            # each item runs in a copy of the request's context so LLM calls keep its client id
+            done = [f.result() for f in [executor.submit(contextvars.copy_context().run, timed, fn, arg) for arg in args]]
+        for _, timings in done:
+            merge_stage_timings(timings)
+        return [outcome for outcome, _ in done]
+
+    # Threads only hand images to the OCR worker processes (or tesseract subprocesses)
+    uploads = run_items(ocr_item, items, OCR_POOL_SIZE)
+    outcomes = run_items(analyze_item, uploads, BATCH_LLM_CONCURRENCY)
+
+    results = []
+    for (filename, _), outcome in zip(items, outcomes):
+        if 'error' in outcome:
+            results.append({'filename': filename, 'ok': False, 'error': outcome['error']})
+        else:
+            result = outcome['result']
+            results.append({'filename': filename, 'ok': True, **result, **rating_fields(result['rating'])})
+    return results
+
+# ----------------------------
+# Shared state (SQLite)
+# Under "serve" every worker process has its own memory, and a follow-up request (the event
+# stream of a progressive upload, polling /jobs/<id>, the next chat turn) can land on any
+# worker. That state lives in one SQLite file instead, like the result cache's disk tier.
+# ----------------------------
+STATE_DB = os.environ.get("STATE_DB", "infobait_state.sqlite3")
+STATE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS pending_streams (id TEXT PRIMARY KEY, blob_id TEXT NOT NULL, created REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS pending_streams_created ON pending_streams (created)",
+    "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL, "
+    "finished REAL, result TEXT, error TEXT, owner INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)",
+    "CREATE TABLE IF NOT EXISTS chat_sessions (id TEXT PRIMARY KEY, character TEXT NOT NULL, summary TEXT NOT NULL, "
+    "history TEXT NOT NULL, summarizing REAL NOT NULL, updated REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS chat_sessions_updated ON chat_sessions (updated)",
+    "CREATE TABLE IF NOT EXISTS metric_samples (worker INTEGER NOT NULL, metric TEXT NOT NULL, seq INTEGER NOT NULL, "
+    "line TEXT NOT NULL, updated REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS metric_samples_worker ON metric_samples (worker)",
+)
+_STATE_READY = set()  # database paths whose schema this process has created
+_STATE_READY_LOCK = threading.Lock()
+
+@contextmanager
+def state_db():
+    """A connection to the shared state database inside a write transaction, committed on exit.
+    A fresh connection per operation keeps this safe across threads and forked workers."""
+    conn = sqlite3.connect(STATE_DB, timeout=10)
+    try:
+        with _STATE_READY_LOCK:
+            if STATE_DB not in _STATE_READY:
+                conn.execute("PRAGMA journal_mode=WAL")
+                for statement in STATE_SCHEMA:
+                    conn.execute(statement)
+                conn.commit()
+                _STATE_READY.add(STATE_DB)
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+# ----------------------------
+# Metrics across server workers
+# Each worker writes its samples to the state DB every METRICS_PUBLISH_INTERVAL seconds and
+# on every scrape, so /metrics on any worker returns the series of all of them. Rows of a
+# worker that stopped publishing (it exited) are dropped after METRICS_STALE_AFTER.
+# ----------------------------
+METRICS_PUBLISH_INTERVAL = float(os.environ.get("METRICS_PUBLISH_INTERVAL", "10"))
+METRICS_STALE_AFTER = int(os.environ.get("METRICS_STALE_AFTER", "300"))
+
+class MetricsPublisher:
+    def __init__(self, interval, stale_after):
+        self.interval = interval
+        self.stale_after = stale_after
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def ensure_started(self):
+        # Started on first request (not at import) so forked server workers get their own thread
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="metrics-publisher", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.publish()
+
+    def publish(self) -> bool:
+        worker = os.getpid()
+        now = time.time()
+        rows = [(worker, metric.name, seq, line, now)
+                for metric in METRICS for seq, line in enumerate(metric.sample_lines(worker))]
+        try:
+            with state_db() as conn:
+                conn.execute("DELETE FROM metric_samples WHERE worker = ? OR updated < ?", (worker, now - self.stale_after))
+                conn.executemany("INSERT INTO metric_samples (worker, metric, seq, line, updated) VALUES (?, ?, ?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            print(f"Metrics publish error: {e}")
+            return False
+        return True
+
+    def render(self) -> str:
+        """All live workers' samples; only this worker's if the state DB is unavailable."""
+        if self.publish():
+            try:
+                with state_db() as conn:
+                    rows = conn.execute("SELECT metric, line FROM metric_samples ORDER BY worker, seq").fetchall()
+                lines_by_metric = {}
+                for name, line in rows:
+                    lines_by_metric.setdefault(name, []).append(line)
+                return render_metrics(lines_by_metric)
+            except sqlite3.Error as e:
+                print(f"Metrics read error: {e}")
+        worker = os.getpid()
+        return render_metrics({metric.name: metric.sample_lines(worker) for metric in METRICS})
+
+METRICS_PUBLISHER = MetricsPublisher(METRICS_PUBLISH_INTERVAL, METRICS_STALE_AFTER)
+
+# ----------------------------
+# Progressive results (Server-Sent Events)
+# /upload maps a one-time stream id to the image's blob id and returns the result page at
+# once; the page then opens /upload-events/<id>, which reads the image from the blob store,
+# runs the pipeline and emits each stage.
+# ----------------------------
+PROGRESSIVE_RESULTS = os.environ.get("PROGRESSIVE_RESULTS", "1") == "1"
+PENDING_UPLOAD_TTL = int(os.environ.get("PENDING_UPLOAD_TTL", "300"))
+PENDING_UPLOAD_MAX = int(os.environ.get("PENDING_UPLOAD_MAX", "256"))
+
+def add_pending_upload(blob_id: str):
+    """Register a stored upload for its event stream; returns the stream id, or None if the state DB failed."""
+    stream_id = secrets.token_urlsafe(16)
+    now = time.time()
+    try:
+        with state_db() as conn:
+            conn.execute("INSERT INTO pending_streams (id, blob_id, created) VALUES (?, ?, ?)", (stream_id, blob_id, now))
+            conn.execute("DELETE FROM pending_streams WHERE created < ?", (now - PENDING_UPLOAD_TTL,))
+            conn.execute("DELETE FROM pending_streams WHERE id IN "
+                         "(SELECT id FROM pending_streams ORDER BY created DESC LIMIT -1 OFFSET ?)", (PENDING_UPLOAD_MAX,))
+    except sqlite3.Error as e:
+        print(f"Pending upload write error: {e}")
+        return None
+    return stream_id
+
+def take_pending_upload(stream_id: str):
+    """The blob id of a pending upload, handed out once; None if unknown or expired."""
+    try:
+        with state_db() as conn:
+            rows = conn.execute("DELETE FROM pending_streams WHERE id = ? RETURNING blob_id, created", (stream_id,)).fetchall()
+    except sqlite3.Error as e:
+        print(f"Pending upload read error: {e}")
+        return None
+    if not rows or time.time() - rows[0][1] > PENDING_UPLOAD_TTL:
+        return None
+    return rows[0][0]
+
+def sse_event(name: str, data) -> str:
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+# ----------------------------
+# Asynchronous upload jobs
+# In job mode /upload only enqueues; a fixed worker pool drains a bounded queue and
+# /jobs/<id> reports status. A full queue is rejected with 429 + Retry-After instead
+# of letting latency grow without bound.
+# ----------------------------
+# "1" = every /upload from an API client (see wants_json()) is a job, while the HTML
+# form keeps the result page; otherwise clients opt in with ?async=1
+ASYNC_UPLOADS = os.environ.get("ASYNC_UPLOADS", "0") == "1"
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "64"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+# Finished jobs are kept this long for polling
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", "600"))
+
+class JobQueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"job queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class JobQueue:
+    """Bounded local queue and worker threads; job status and results go to the shared
+    state DB so /jobs/<id> can be answered by any server worker."""
+
+    def __init__(self, maxsize, workers, result_ttl):
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+        self._avg_seconds = 5.0  # moving average of job run time, for Retry-After
+        self._counters = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "abandoned": 0}
+
+    def _ensure_workers(self):
+        # Started on first use (not at import) so forked server workers get their own threads
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for _ in range(self.workers - len(self._threads)):
+                t = threading.Thread(target=self._work, name="upload-job-worker", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, fn, *args):
+        """Queue fn(*args); returns the job id, or None if the state DB failed (nothing is queued)."""
+        self._ensure_workers()
+        job_id = secrets.token_urlsafe(12)
+        now = time.time()
+        try:
+            with state_db() as conn:
+                conn.execute("DELETE FROM jobs WHERE finished < ?", (now - self.result_ttl,))
+                conn.execute("INSERT INTO jobs (id, status, created, owner) VALUES (?, 'queued', ?, ?)", (job_id, now, os.getpid()))
+        except sqlite3.Error as e:
+            print(f"Upload job write error: {e}")
+            return None
+        try:
+            # jobs run in the submitting request's context (client id for LLM rate limits)
+            self._queue.put_nowait((job_id, contextvars.copy_context(), fn, args))
+        except queue.Full:
+            try:
+                with state_db() as conn:
+                    conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            except sqlite3.Error as e:
+                print(f"Upload job {job_id} delete error: {e}")
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise JobQueueFull(self.retry_after())
+        with self._lock:
+            self._counters["submitted"] += 1
+        return job_id
+
+    def _update(self, job_id, status, result=None, error=None):
+        try:
+            with state_db() as conn:
+                if status == "running":
+                    conn.execute("UPDATE jobs SET status = 'running' WHERE id = ? AND status = 'queued'", (job_id,))
+                else:
+                    conn.execute("UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? WHERE id = ?",
+                                 (status, json.dumps(result) if result is not None else None, error, time.time(), job_id))
+        except sqlite3.Error as e:
+            print(f"Upload job {job_id} status write error: {e}")
+
+    def _work(self):
+        while True:
+            job_id, context, fn, args = self._queue.get()
+            self._update(job_id, "running")
+            with self._lock:
+                self._running += 1
+            started = time.time()
+            result = error = None
+            try:
+                result = context.run(fn, *args)
+            except LLMRateLimited as e:
+                error = f"Too many requests. Please retry in {e.retry_after}s."
+            except Exception as e:
+                print(f"Upload job {job_id} failed: {e}")
+                error = "Analysis failed. Please try again."
+            finally:
+                self._update(job_id, "error" if error else "done", result, error)
+                with self._lock:
+                    self._running -= 1
+                    self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.time() - started)
+                    self._counters["failed" if error else "completed"] += 1
+                self._queue.task_done()
+
+    def shutdown(self, timeout):
+        """On server worker exit: fail the jobs still queued here, give the running ones up to
+        `timeout` seconds, then fail those too, so clients polling them don't wait forever."""
+        while True:
+            try:
+                job_id, _, _, _ = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._update(job_id, "error", error="The server restarted before this job ran. Please upload again.")
+            with self._lock:
+                self._counters["abandoned"] += 1
+            self._queue.task_done()
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._lock:
+                if not self._running:
+                    return
+            time.sleep(0.1)
+        try:
+            with state_db() as conn:
+                conn.execute("UPDATE jobs SET status = 'error', error = ?, finished = ? WHERE owner = ? AND finished IS NULL",
+                             ("The server restarted before this job finished. Please upload again.", time.time(), os.getpid()))
+        except sqlite3.Error as e:
+            print(f"Upload job shutdown write error: {e}")
+
+    def retry_after(self) -> int:
+        # Time for the workers to drain what is queued now
+        with self._lock:
+            avg = self._avg_seconds
+        return max(1, math.ceil(self._queue.qsize() * avg / max(1, self.workers)))
+
+    def get(self, job_id):
+        try:
+            with state_db() as conn:
+                row = conn.execute("SELECT status, result, error FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Upload job {job_id} status read error: {e}")
+            return None
+        if row is None:
+            return None
+        return {"id": job_id, "status": row[0], "result": json.loads(row[1]) if row[1] else None, "error": row[2]}
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            counters["running"] = self._running
+            counters["avg_job_seconds"] = round(self._avg_seconds, 3)
+        counters["queued"] = self._queue.qsize()
+        counters["capacity"] = self._queue.maxsize
+        counters["workers"] = self.workers
+        return counters
+
+UPLOAD_JOBS = JobQueue(JOB_QUEUE_SIZE, JOB_WORKERS, JOB_RESULT_TTL)
+
+# ----------------------------
+# Character chat sessions
+# Conversations live server-side: the page sends only its session id and the new message.
+# The persona goes in the preamble, the latest turns in chat_history, and older turns are
+# folded into a rolling summary, so the prompt stays about the same size however long
+# the chat runs.
+# ----------------------------
+CHAT_SESSION_MAX = int(os.environ.get("CHAT_SESSION_MAX", "5000"))
+# Sessions idle for longer than this are dropped
+CHAT_SESSION_TTL = int(os.environ.get("CHAT_SESSION_TTL", "1800"))
+# Messages (user + character) kept verbatim; once twice this many pile up, the older
+# ones are folded into the summary
+CHAT_RECENT_MESSAGES = int(os.environ.get("CHAT_RECENT_MESSAGES", "6"))
+
+CHAT_CHARACTERS = {
+    "bibi": {
+        "label": "Bibi",
+        "preamble": (
+            "You are roleplaying as Benjamin 'Bibi' Netanyahu, Prime Minister of Israel. "
+            "Stay in character at all times. Speak with confidence, authority, and occasional humor. "
+            "Reference your long political career, Israel's security, innovation, and strength. "
+            "Occasionally use Hebrew phrases like 'Shalom', 'Toda raba', 'Am Yisrael Chai'. "
+            "Keep responses conversational and 2-4 sentences. This is for entertainment only."
+        ),
+        "error_reply": "Shalom, my friend. I seem to be having technical difficulties. Even prime ministers have bad days! Please try again.",
+    },
+    "trump": {
+        "label": "Trump",
+        "preamble": (
+            "You are roleplaying as Donald J. Trump, President of the United States. "
+            "Stay in character at all times. Speak with supreme confidence, use superlatives constantly. "
+            "Say things are 'tremendous', 'the best', 'like nobody has ever seen before'. "
+            "Reference your deal-making skills, your presidency, Making America Great Again, and winning. "
+            "Occasionally say 'Believe me', 'Many people are saying', 'Everybody knows it'. "
+            "Keep responses conversational and 2-4 sentences. This is for entertainment only."
+        ),
+        "error_reply": "Look, we're having some technical difficulties, okay? Even the greatest president has a bad day. Tremendous. Try again, believe me!",
+    },
+}
+
+def summarize_chat(summary: str, messages: list, char_label: str):
+    """Fold `messages` into the running summary; None if the call fails."""
+    lines = "\n".join(f"{'User' if m['role'] == 'USER' else char_label}: {m['message']}" for m in messages)
+    prompt = (
+        f"Update the running summary of a roleplay chat between a user and {char_label}. "
+        "Keep it under 80 words, in the third person. Keep the topics discussed, facts the user shared "
+        "about themselves and anything they asked to remember. Output ONLY the updated summary.\n\n"
+        f"Current summary:\n{summary or '(none)'}\n\n"
+        f"New messages:\n{lines}"
+    )
+    try:
+        response = llm.chat("summary", message=prompt, max_tokens=150)
+        return response.text.strip()
+    except Exception as e:
+        print(f"Chat summary error: {e}")
+        return None
+
+class ChatSessionStore:
+    """Chat sessions in the shared state DB, so any server worker can continue a chat."""
+
+    def __init__(self, max_sessions, ttl, recent_messages):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.recent_messages = recent_messages
+        self._lock = threading.Lock()
+        self._executor = None
+        self._counters = {"created": 0, "expired": 0, "evicted": 0, "summaries": 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, session_id, character):
+        """The live session for this id and character, or a new one."""
+        now = time.time()
+        with state_db() as conn:
+            row = None
+            if session_id:
+                row = conn.execute("SELECT summary, history FROM chat_sessions WHERE id = ? AND character = ? AND updated >= ?",
+                                   (session_id, character, now - self.ttl)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE chat_sessions SET updated = ? WHERE id = ?", (now, session_id))
+                return {"id": session_id, "character": character, "summary": row[0], "history": json.loads(row[1])}
+            session = {"id": secrets.token_urlsafe(16), "character": character, "summary": "", "history": []}
+            conn.execute("INSERT INTO chat_sessions (id, character, summary, history, summarizing, updated) VALUES (?, ?, '', '[]', 0, ?)",
+                         (session["id"], character, now))
+            expired = conn.execute("DELETE FROM chat_sessions WHERE updated < ?", (now - self.ttl,)).rowcount
+            evicted = conn.execute("DELETE FROM chat_sessions WHERE id IN "
+                                   "(SELECT id FROM chat_sessions ORDER BY updated DESC LIMIT -1 OFFSET ?)", (self.max_sessions,)).rowcount
+        self._count("created")
+        self._count("expired", expired)
+        self._count("evicted", evicted)
+        return session
+
+    def snapshot(self, session):
+        """(summary, chat_history) for the next call."""
+        return session["summary"], list(session["history"])
+
+    def record(self, session, user_msg, reply):
+        with state_db() as conn:
+            row = conn.execute("SELECT history, summarizing FROM chat_sessions WHERE id = ?", (session["id"],)).fetchone()
+            if row is None:
+                return  # expired or evicted meanwhile
+            now = time.time()
+            history = json.loads(row[0]) + [{"role": "USER", "message": user_msg}, {"role": "CHATBOT", "message": reply}]
+            # fold in batches: summarize once the history doubles, not on every turn. summarizing is
+            # the start time of a running summary; one from a worker that died is retried
+            running = row[1] and now - row[1] < 2 * LLM_STAGE_TIMEOUTS["summary"]
+            summarize = len(history) >= 2 * self.recent_messages and not running
+            conn.execute("UPDATE chat_sessions SET history = ?, summarizing = ?, updated = ? WHERE id = ?",
+                         (json.dumps(history), now if summarize else row[1], now, session["id"]))
+        if not summarize:
+            return
+        with self._lock:
+            if self._executor is None:
+                # Started on first use so forked server workers get their own thread
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+        self._executor.submit(self._summarize, session["id"], session["character"])
+
+    def _summarize(self, session_id, character):
+        with state_db() as conn:
+            row = conn.execute("SELECT summary, history FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return
+        history = json.loads(row[1])
+        folded = history[:len(history) - self.recent_messages]
+        updated = summarize_chat(row[0], folded, CHAT_CHARACTERS[character]["label"])
+        with state_db() as conn:
+            row = conn.execute("SELECT summary, history FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                return
+            # turns recorded meanwhile were appended after the folded ones
+            summary, history = row[0], json.loads(row[1])
+            if updated is not None:
+                summary = updated
+                del history[:len(folded)]
+            elif len(history) > 3 * self.recent_messages:
+                # summaries keep failing: drop the oldest turns rather than grow without bound
+                del history[:len(folded)]
+            conn.execute("UPDATE chat_sessions SET summary = ?, history = ?, summarizing = 0 WHERE id = ?",
+                         (summary, json.dumps(history), session_id))
+        if updated is not None:
+            self._count("summaries")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        try:
+            with state_db() as conn:
+                counters["active"] = conn.execute("SELECT COUNT(*) FROM chat_sessions WHERE updated >= ?",
+                                                  (time.time() - self.ttl,)).fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Chat session stats error: {e}")
+        return counters
 
-# Performance tunables
-# Maximum image dimension (pixels). Images larger than this will be downscaled before OCR.
-MAX_IMAGE_DIM = int(os.environ.get("MAX_IMAGE_DIM", "1200"))
-# Tesseract config for faster OCR (OEM 1 = LSTM engine, PSM 3 = Fully automatic page segmentation)
-TESSERACT_CONFIG = os.environ.get("TESSERACT_CONFIG", "--oem 1 --psm 3")
+CHAT_SESSIONS = ChatSessionStore(CHAT_SESSION_MAX, CHAT_SESSION_TTL, CHAT_RECENT_MESSAGES)
 
 # ----------------------------
-# Text Cleanup Function
+# Response pool for common chat openers
+# Most chats open with the same few messages ("hi", "who are you", ...). For the first message
+# of a session, a normalized match is answered from a per-character pool of varied, pre-generated
+# replies. Each reply is served a few times and retired after a while, and a background warmer
+# tops the pools back up. Any other opener that keeps coming back gets a pool of its own.
+# Only pools asked for within CHAT_POOL_IDLE are refilled, promoted openers nobody sent in that
+# time are dropped again, and the warmer stops while no pool is in use.
 # ----------------------------
-def clean_text(raw_text: str) -> str:
-    """Use Cohere to spell-check and make OCR text coherent."""
-    if not raw_text or not raw_text.strip():
-        return raw_text
-    
-    try:
-        cleanup_prompt = (
-            "You are a text cleanup assistant. Given OCR-extracted text that may contain spelling errors, "
-            "missing spaces, or formatting issues, correct all spelling mistakes and make the text coherent and readable. "
-            "Preserve the original meaning and structure. Only fix errors - do not add, remove, or rephrase content unnecessarily. "
-            "Output ONLY the corrected text without any preamble or explanation.\\n\\n"
-            f"Text to clean:\\n{raw_text}"
-        )
-        
-        response = co.chat(
-            model=COHERE_MODEL,
-            message=cleanup_prompt,
-            max_tokens=500
-        )
-        
-        cleaned = response.text.strip()
-        return cleaned if cleaned else raw_text
-        
-    except Exception as e:
-        print(f"Text cleanup error: {e}")
-        return raw_text  # fallback to original text on error
+CHAT_POOL_ENABLED = os.environ.get("CHAT_POOL_ENABLED", "1") == "1"
+# Replies kept per (character, opener)
+CHAT_POOL_SIZE = int(os.environ.get("CHAT_POOL_SIZE", "8"))
+# A pooled reply is retired after this many uses or this many seconds
+CHAT_POOL_MAX_USES = int(os.environ.get("CHAT_POOL_MAX_USES", "20"))
+CHAT_POOL_REFRESH = int(os.environ.get("CHAT_POOL_REFRESH", str(6 * 3600)))
+CHAT_POOL_WARM_INTERVAL = float(os.environ.get("CHAT_POOL_WARM_INTERVAL", "30"))
+# An opener outside CHAT_OPENERS gets its own pool after this many first-turn sightings
+CHAT_POOL_PROMOTE_AFTER = int(os.environ.get("CHAT_POOL_PROMOTE_AFTER", "3"))
+CHAT_POOL_MAX_OPENERS = 200
+# Seconds without a lookup after which a pool is no longer refilled (and a promoted opener is dropped)
+CHAT_POOL_IDLE = int(os.environ.get("CHAT_POOL_IDLE", "3600"))
+
+# Opener key -> (prompt used to generate replies, normalized messages that match it)
+CHAT_OPENERS = {
+    "greeting": ("Hi!", {"hi", "hello", "hey", "hi there", "hello there", "hey there", "yo", "sup",
+                         "shalom", "good morning", "good afternoon", "good evening", "greetings", "howdy"}),
+    "who_are_you": ("Who are you?", {"who are you", "who r u", "what are you", "introduce yourself",
+                                     "tell me about yourself", "who is this", "whats your name", "what is your name"}),
+    "how_are_you": ("How are you?", {"how are you", "how r u", "how are you doing", "hows it going",
+                                     "how is it going", "whats up", "what is up", "wassup"}),
+}
+CHAT_OPENER_INDEX = {phrase: key for key, (_, phrases) in CHAT_OPENERS.items() for phrase in phrases}
+
+def normalize_chat_message(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).lower().replace("'", "").replace("’", "")
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+class ChatResponsePool:
+    def __init__(self, size, max_uses, refresh, warm_interval, promote_after, idle):
+        self.size = size
+        self.max_uses = max_uses
+        self.refresh = refresh
+        self.warm_interval = warm_interval
+        self.promote_after = promote_after
+        self.idle = idle
+        self._pools = {}  # (character, opener key) -> list of [reply, uses, created]
+        self._prompts = {key: prompt for key, (prompt, _) in CHAT_OPENERS.items()}
+        self._sightings = OrderedDict()  # normalized message -> first-turn count, for promotion
+        self._last_lookup = {}  # (character, opener key) -> time of the latest take()
+        self._promoted_at = {}  # promoted opener key -> time of promotion
+        self._lock = threading.Lock()
+        self._warmer = None
+        self._counters = {"hits": 0, "misses": 0, "generated": 0, "retired": 0, "promoted": 0, "demoted": 0}
+
+    def opener_key(self, message: str):
+        """Pool key for a first-turn message, or None if it is not a pooled opener."""
+        normalized = normalize_chat_message(message)
+        if not normalized:
+            return None
+        key = CHAT_OPENER_INDEX.get(normalized)
+        if key:
+            return key
+        with self._lock:
+            if normalized in self._prompts:
+                return normalized
+            self._sightings[normalized] = self._sightings.pop(normalized, 0) + 1
+            while len(self._sightings) > 10 * CHAT_POOL_MAX_OPENERS:
+                self._sightings.popitem(last=False)
+            if self._sightings[normalized] >= self.promote_after and len(self._prompts) < CHAT_POOL_MAX_OPENERS:
+                self._prompts[normalized] = message.strip()
+                self._promoted_at[normalized] = time.time()
+                del self._sightings[normalized]
+                self._counters["promoted"] += 1
+                return normalized
+        return None
+
+    def take(self, character, key):
+        now = time.time()
+        with self._lock:
+            self._last_lookup[(character, key)] = now
+        self._ensure_warmer()
+        with self._lock:
+            pool = self._pools.setdefault((character, key), [])
+            self._retire(pool, now)
+            if not pool:
+                self._counters["misses"] += 1
+                return None
+            entry = random.choice(pool)
+            entry[1] += 1
+            self._counters["hits"] += 1
+            return entry[0]
+
+    def add(self, character, key, reply):
+        if not reply:
+            return
+        with self._lock:
+            pool = self._pools.setdefault((character, key), [])
+            if len(pool) < self.size and reply not in (e[0] for e in pool):
+                pool.append([reply, 0, time.time()])
+
+    def _retire(self, pool, now):
+        # caller holds the lock
+        kept = [e for e in pool if e[1] < self.max_uses and now - e[2] < self.refresh]
+        self._counters["retired"] += len(pool) - len(kept)
+        pool[:] = kept
+
+    def _ensure_warmer(self):
+        # Started on first use (not at import) so forked server workers get their own thread
+        with self._lock:
+            if self._warmer is None or not self._warmer.is_alive():
+                self._warmer = threading.Thread(target=self._warm_loop, name="chat-pool-warmer", daemon=True)
+                self._warmer.start()
+
+    def _warm_loop(self):
+        while True:
+            try:
+                self.warm()
+            except Exception as e:
+                print(f"Chat pool warmer error: {e}")
+            time.sleep(self.warm_interval)
+            with self._lock:
+                if not self._in_use(time.time()):
+                    # take() starts a new warmer once a pool is asked for again
+                    self._warmer = None
+                    return
+
+    def _in_use(self, now):
+        # caller holds the lock
+        return any(now - seen < self.idle for seen in self._last_lookup.values())
+
+    def _demote_idle(self, now):
+        # caller holds the lock; drops promoted openers nobody sent within the idle window
+        for key, promoted in list(self._promoted_at.items()):
+            last = max((seen for (_, k), seen in self._last_lookup.items() if k == key), default=promoted)
+            if now - last >= self.idle:
+                del self._prompts[key], self._promoted_at[key]
+                for pool_key in [pk for pk in self._pools if pk[1] == key]:
+                    del self._pools[pool_key]
+                for pool_key in [pk for pk in self._last_lookup if pk[1] == key]:
+                    del self._last_lookup[pool_key]
+                self._counters["demoted"] += 1
+
+    def warm(self):
+        """Generate one reply for every recently used pool below its target size."""
+        now = time.time()
+        with self._lock:
+            self._demote_idle(now)
+            wanted = []
+            for (character, key), seen in self._last_lookup.items():
+                if now - seen >= self.idle or key not in self._prompts:
+                    continue
+                pool = self._pools.setdefault((character, key), [])
+                self._retire(pool, now)
+                if len(pool) < self.size:
+                    wanted.append((character, key, self._prompts[key]))
+        for character, key, prompt in wanted:
+            response = llm.chat(
+                "chat_pool",
+                message=prompt,
+                preamble=CHAT_CHARACTERS[character]["preamble"],
+                max_tokens=200,
+                temperature=1.0,
+            )
+            self.add(character, key, response.text.strip())
+            with self._lock:
+                self._counters["generated"] += 1
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            counters["openers"] = len(self._prompts)
+            counters["pooled_replies"] = sum(len(pool) for pool in self._pools.values())
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_ratio"] = round(counters["hits"] / lookups, 4) if lookups else 0.0
+        return counters
+
+CHAT_POOL = ChatResponsePool(CHAT_POOL_SIZE, CHAT_POOL_MAX_USES, CHAT_POOL_REFRESH, CHAT_POOL_WARM_INTERVAL, CHAT_POOL_PROMOTE_AFTER, CHAT_POOL_IDLE)
 
 # ----------------------------
 # HTML page
@@ -330,7 +3160,7 @@ HTML_PAGE = """
             </div>
             <div class="faq-item">
                 <div class="faq-q" onclick="toggleFaq(this)"><span>Is my uploaded data private and secure?</span><span class="faq-arrow">▼</span></div>
-                <div class="faq-a"><p>Yes. Images are processed in-memory and never saved to disk. No uploaded files are stored on the server after analysis is complete. Text is sent to the Cohere AI API for analysis but is not retained by InfoBait.</p></div>
+                <div class="faq-a"><p>Yes. Uploaded images are kept in a local store on the server for up to a week so the result page can show them, then deleted automatically. They are never shared. Text is sent to the Cohere AI API for analysis but is not retained by InfoBait.</p></div>
             </div>
             <div class="faq-item">
                 <div class="faq-q" onclick="toggleFaq(this)"><span>Why is the extracted text inaccurate or garbled?</span><span class="faq-arrow">▼</span></div>
@@ -795,7 +3625,7 @@ RESULT_PAGE = """
         .page-footer .footer-logo:hover{opacity:.7}
     </style>
 </head>
-<body>
+<body{% if stream_id %} data-stream-id="{{ stream_id }}"{% endif %}>
     <div class="top-banner">
         <a class="logo" href="/"><span class="logo-text">InfoBait</span><span class="banner-date" id="bannerDate"></span></a>
         <button class="settings-btn" onclick="toggleSettings()">⚙️</button>
@@ -832,7 +3662,7 @@ RESULT_PAGE = """
             </div>
             <div class="faq-item">
                 <div class="faq-q" onclick="toggleFaq(this)"><span>Is my uploaded data private and secure?</span><span class="faq-arrow">▼</span></div>
-                <div class="faq-a"><p>Yes. Images are processed in-memory and never saved to disk. No uploaded files are stored on the server after analysis is complete. Text is sent to the Cohere AI API for analysis but is not retained by InfoBait.</p></div>
+                <div class="faq-a"><p>Yes. Uploaded images are kept in a local store on the server for up to a week so the result page can show them, then deleted automatically. They are never shared. Text is sent to the Cohere AI API for analysis but is not retained by InfoBait.</p></div>
             </div>
             <div class="faq-item">
                 <div class="faq-q" onclick="toggleFaq(this)"><span>Why is the extracted text inaccurate or garbled?</span><span class="faq-arrow">▼</span></div>
@@ -853,7 +3683,7 @@ RESULT_PAGE = """
             <div class="row">
                 <div class="left">
                     <div class="preview">
-                        <img src="data:{{ mime }};base64,{{ image_b64 }}" alt="uploaded image">
+                        {% if image_id %}<img src="/img/{{ image_id }}" alt="uploaded image">{% endif %}
                     </div>
                     <div class="sources-section" id="sourcesSection">
                         <div class="sources-heading">Sources</div>
@@ -883,9 +3713,7 @@ RESULT_PAGE = """
                         <textarea id="extractedTextEdit" class="extracted-textarea">{{ extracted_text }}</textarea>
                         <div id="editHint" class="edit-hint">Edit the text above, then click <strong>Re-analyze</strong> to get an updated analysis.</div>
                     </div>
-                    <input type="hidden" id="hiddenImageB64" value="{{ image_b64 }}">
-                    <input type="hidden" id="hiddenMime" value="{{ mime }}">
-                    <input type="hidden" id="hiddenFilename" value="{{ filename }}">
+                    <input type="hidden" id="hiddenImageId" value="{{ image_id }}">
                     <div style="height:12px"></div>
                     <div class="panel">
                         <div style="display:flex;justify-content:space-between;align-items:center;margin-bottom:8px">
@@ -920,6 +3748,8 @@ RESULT_PAGE = """
                                     <div style="color:var(--muted);font-size:12px">/ 10</div>
                                 </div>
                             </div>
+                        {% elif stream_id %}
+                            <div style="color:var(--muted);font-size:14px">Scoring&hellip;</div>
                         {% else %}
                             <div style="display:flex;align-items:center;gap:12px">
                                 <div style="flex:1;display:flex;align-items:center;gap:12px">
@@ -935,6 +3765,7 @@ RESULT_PAGE = """
             </div>
         </div>
     </div>
+    <script type="application/json" id="sourcesData">{{ sources | tojson }}</script>
     <script>
         let currentTheme = localStorage.getItem('theme') || 'dark';
 
@@ -976,7 +3807,7 @@ RESULT_PAGE = """
             }
             // Render sources
             try{
-                const sources = JSON.parse('{{ sources | safe }}');
+                const sources = JSON.parse(document.getElementById('sourcesData').textContent);
                 const list = document.getElementById('sourcesList');
                 const section = document.getElementById('sourcesSection');
                 if(sources && sources.length > 0 && list){
@@ -1153,6 +3984,61 @@ RESULT_PAGE = """
             }
         }
 
+        function renderRating(rating, barColor){
+            const ratingContent = document.getElementById('ratingContent');
+            if(rating !== null){
+                const pct = rating * 10;
+                ratingContent.innerHTML = ''+
+                    '<div style="display:flex;align-items:center;gap:12px">'+
+                        '<div style="flex:1">'+
+                            '<div style="position:relative;background:rgba(200,195,170,0.1);height:14px;border-radius:0;overflow:hidden;border:1px solid rgba(200,195,170,0.15)">'+
+                                '<div style="position:absolute;inset:0;pointer-events:none;z-index:3;background-image:linear-gradient(to right,rgba(200,195,170,0.15) 1px, transparent 1px);background-size:10% 100%;background-repeat:repeat-x;opacity:0.9"></div>'+
+                                '<div style="position:relative;z-index:2;height:100%;width:'+pct+'%;background:'+barColor+';transition:width 420ms ease;border-radius:0"></div>'+
+                            '</div>'+
+                            '<div style="display:flex;justify-content:space-between;margin-top:6px;color:var(--muted);font-size:12px">'+
+                                '<span>1</span><span>5</span><span>10</span>'+
+                            '</div>'+
+                        '</div>'+
+                        '<div style="min-width:84px;text-align:center">'+
+                            '<div style="font-weight:700;font-size:18px">'+rating+'</div>'+
+                            '<div style="color:var(--muted);font-size:12px">/ 10</div>'+
+                        '</div>'+
+                    '</div>';
+            } else {
+                ratingContent.innerHTML = ''+
+                    '<div style="display:flex;align-items:center;gap:12px">'+
+                        '<div style="flex:1;display:flex;align-items:center;gap:12px">'+
+                            '<div style="min-width:84px;height:38px;border-radius:8px;background:rgba(255,255,255,0.03);display:flex;align-items:center;justify-content:center;font-weight:700;color:var(--muted);font-size:16px">N/A</div>'+
+                            '<div style="color:var(--muted);font-size:14px">Unable to provide an accuracy report. Please try again.</div>'+
+                        '</div>'+
+                    '</div>';
+            }
+        }
+
+        function renderSources(sources){
+            const sourcesList = document.getElementById('sourcesList');
+            sourcesList.innerHTML = '';
+            if(sources && sources.length > 0){
+                sources.forEach(function(s){
+                    const li = document.createElement('li');
+                    if(s.url && s.url.startsWith('http')){
+                        const a = document.createElement('a');
+                        a.href = s.url; a.target = '_blank'; a.rel = 'noopener noreferrer';
+                        const nameSpan = document.createElement('span');
+                        nameSpan.className = 'source-name'; nameSpan.textContent = s.name || s.url;
+                        a.appendChild(nameSpan);
+                        if(s.url && s.name){ const urlSpan = document.createElement('span'); urlSpan.className = 'source-url'; urlSpan.textContent = s.url; a.appendChild(urlSpan); }
+                        li.appendChild(a);
+                    } else {
+                        const span = document.createElement('span'); span.className = 'source-name'; span.textContent = s.name; li.appendChild(span);
+                    }
+                    sourcesList.appendChild(li);
+                });
+            } else {
+                sourcesList.innerHTML = '<li class="no-sources" style="padding:6px 0">No sources available for this analysis.</li>';
+            }
+        }
+
         async function reanalyze(){
             const textarea = document.getElementById('extractedTextEdit');
             const editedText = textarea.value.trim();
@@ -1167,68 +4053,19 @@ RESULT_PAGE = """
                     headers: {'Content-Type': 'application/json'},
                     body: JSON.stringify({
                         extracted_text: editedText,
-                        image_b64: document.getElementById('hiddenImageB64').value,
-                        mime: document.getElementById('hiddenMime').value,
-                        filename: document.getElementById('hiddenFilename').value
+                        image_id: document.getElementById('hiddenImageId').value
                     })
                 });
                 const data = await resp.json();
+                if(!resp.ok) throw new Error(data.error || resp.statusText);
                 // Update extracted text
                 const pre = document.getElementById('extractedTextContent');
                 pre.textContent = editedText;
                 // Update AI analysis
                 document.getElementById('aiAnalysisText').textContent = data.ai_output;
-                // Update rating bar using explicit ID
-                const ratingContent = document.getElementById('ratingContent');
-                if(data.rating !== null){
-                    const pct = data.rating * 10;
-                    ratingContent.innerHTML = ''+
-                        '<div style="display:flex;align-items:center;gap:12px">'+
-                            '<div style="flex:1">'+
-                                '<div style="position:relative;background:rgba(200,195,170,0.1);height:14px;border-radius:0;overflow:hidden;border:1px solid rgba(200,195,170,0.15)">'+
-                                    '<div style="position:absolute;inset:0;pointer-events:none;z-index:3;background-image:linear-gradient(to right,rgba(200,195,170,0.15) 1px, transparent 1px);background-size:10% 100%;background-repeat:repeat-x;opacity:0.9"></div>'+
-                                    '<div style="position:relative;z-index:2;height:100%;width:'+pct+'%;background:'+data.bar_color+';transition:width 420ms ease;border-radius:0"></div>'+
-                                '</div>'+
-                                '<div style="display:flex;justify-content:space-between;margin-top:6px;color:var(--muted);font-size:12px">'+
-                                    '<span>1</span><span>5</span><span>10</span>'+
-                                '</div>'+
-                            '</div>'+
-                            '<div style="min-width:84px;text-align:center">'+
-                                '<div style="font-weight:700;font-size:18px">'+data.rating+'</div>'+
-                                '<div style="color:var(--muted);font-size:12px">/ 10</div>'+
-                            '</div>'+
-                        '</div>';
-                } else {
-                    ratingContent.innerHTML = ''+
-                        '<div style="display:flex;align-items:center;gap:12px">'+
-                            '<div style="flex:1;display:flex;align-items:center;gap:12px">'+
-                                '<div style="min-width:84px;height:38px;border-radius:8px;background:rgba(255,255,255,0.03);display:flex;align-items:center;justify-content:center;font-weight:700;color:var(--muted);font-size:16px">N/A</div>'+
-                                '<div style="color:var(--muted);font-size:14px">Unable to provide an accuracy report. Please try again.</div>'+
-                            '</div>'+
-                        '</div>';
-                }
-                // Update sources
-                const sourcesList = document.getElementById('sourcesList');
-                sourcesList.innerHTML = '';
-                if(data.sources && data.sources.length > 0){
-                    data.sources.forEach(function(s){
-                        const li = document.createElement('li');
-                        if(s.url && s.url.startsWith('http')){
-                            const a = document.createElement('a');
-                            a.href = s.url; a.target = '_blank'; a.rel = 'noopener noreferrer';
-                            const nameSpan = document.createElement('span');
-                            nameSpan.className = 'source-name'; nameSpan.textContent = s.name || s.url;
-                            a.appendChild(nameSpan);
-                            if(s.url && s.name){ const urlSpan = document.createElement('span'); urlSpan.className = 'source-url'; urlSpan.textContent = s.url; a.appendChild(urlSpan); }
-                            li.appendChild(a);
-                        } else {
-                            const span = document.createElement('span'); span.className = 'source-name'; span.textContent = s.name; li.appendChild(span);
-                        }
-                        sourcesList.appendChild(li);
-                    });
-                } else {
-                    sourcesList.innerHTML = '<li class="no-sources" style="padding:6px 0">No sources available for this analysis.</li>';
-                }
+                // Update rating bar and sources
+                renderRating(data.rating, data.bar_color);
+                renderSources(data.sources);
                 // Exit edit mode
                 toggleEdit();
             } catch(err){
@@ -1239,6 +4076,55 @@ RESULT_PAGE = """
             }
         }
     </script>
+    {% if stream_id %}
+    <script>
+        // Progressive results: fill the page in as each pipeline stage finishes
+        window.addEventListener('DOMContentLoaded', function(){
+            const editBtn = document.getElementById('editBtn');
+            editBtn.disabled = true;
+            document.getElementById('sourcesList').innerHTML = '<li class="no-sources" style="padding:6px 0">Gathering sources&hellip;</li>';
+            function setExtractedText(text){
+                document.getElementById('extractedTextContent').textContent = text;
+                document.getElementById('extractedTextEdit').value = text;
+            }
+            const es = new EventSource('/upload-events/' + encodeURIComponent(document.body.dataset.streamId));
+            es.addEventListener('ocr', function(e){
+                setExtractedText(JSON.parse(e.data).text);
+                document.getElementById('aiAnalysisText').textContent = 'Cleaning up extracted text\u2026';
+            });
+            es.addEventListener('cleaned', function(e){
+                setExtractedText(JSON.parse(e.data).text);
+                document.getElementById('aiAnalysisText').textContent = 'Analyzing\u2026';
+            });
+            es.addEventListener('analysis', function(e){
+                document.getElementById('aiAnalysisText').textContent = JSON.parse(e.data).ai_output;
+            });
+            es.addEventListener('rating', function(e){
+                const data = JSON.parse(e.data);
+                renderRating(data.rating, data.bar_color);
+            });
+            es.addEventListener('sources', function(e){
+                renderSources(JSON.parse(e.data).sources);
+            });
+            es.addEventListener('done', function(e){
+                es.close();
+                const data = JSON.parse(e.data);
+                setExtractedText(data.extracted_text);
+                document.getElementById('aiAnalysisText').textContent = data.ai_output;
+                renderRating(data.rating, data.bar_color);
+                renderSources(data.sources);
+                editBtn.disabled = false;
+            });
+            es.addEventListener('error', function(e){
+                es.close();
+                let message = 'Connection lost. Please upload the image again.';
+                if(e.data){ try{ message = JSON.parse(e.data).error; }catch(err){} }
+                document.getElementById('aiAnalysisText').textContent = message;
+                renderRating(null);
+            });
+        });
+    </script>
+    {% endif %}
     <div class="page-footer"><a href="/" class="footer-logo">InfoBait</a></div>
 </body>
 </html>
@@ -1246,7 +4132,7 @@ RESULT_PAGE = """
 
 @app.route("/")
 def home():
-    return render_template_string(HTML_PAGE)
+    return HOME_PAGE.response()
 
 BIBI_PAGE = """<!DOCTYPE html>
 <html lang="en">
@@ -1334,7 +4220,7 @@ body.trump-mode{background:linear-gradient(135deg,#b22234 0%,#b22234 33%,#fff 33
     </div>
 </div>
 <script>
-var chatHistory = [];
+var sessionId = null;
 var input = document.getElementById('userInput');
 var msgs = document.getElementById('messages');
 var btn = document.getElementById('sendBtn');
@@ -1374,8 +4260,8 @@ function switchCharacter(char){
     document.getElementById('headerSymbol').innerHTML = cfg.symbol;
     document.getElementById('bibLabel').className = char==='bibi'?'active':'';
     document.getElementById('trumpLabel').className = char==='trump'?'active':'';
-    // Clear chat and reset
-    chatHistory = [];
+    // Clear chat and start a new server-side session
+    sessionId = null;
     msgs.innerHTML = '<div class="welcome-flag" id="welcomeFlag">'+cfg.welcome+'</div>' +
         '<div class="msg bot"><div class="sender">'+cfg.name+'</div>'+cfg.greeting+'</div>';
     document.title = cfg.title;
@@ -1392,6 +4278,16 @@ function addMsg(text, cls, sender){
     msgs.scrollTop = msgs.scrollHeight;
 }
 
+function addStreamingMsg(sender){
+    var d = document.createElement('div');
+    d.className = 'msg bot';
+    d.innerHTML = '<div class="sender">'+sender+'</div>';
+    var body = document.createElement('span');
+    d.appendChild(body);
+    msgs.appendChild(d);
+    return body;
+}
+
 function showTyping(){
     var cfg = charConfig[currentChar];
     var d = document.createElement('div');
@@ -1413,22 +4309,44 @@ function sendMessage(){
     addMsg(text, 'user');
     input.value = '';
     btn.disabled = true;
-    chatHistory.push({role:'user', text:text});
     showTyping();
     var cfg = charConfig[currentChar];
 
     fetch('/bibi-chat', {
         method:'POST',
         headers:{'Content-Type':'application/json'},
-        body:JSON.stringify({message:text, history:chatHistory, character:currentChar})
+        body:JSON.stringify({message:text, session_id:sessionId, character:currentChar})
     })
-    .then(function(r){return r.json()})
-    .then(function(data){
-        removeTyping();
-        addMsg(data.reply, 'bot', cfg.name);
-        chatHistory.push({role:'bot', text:data.reply});
-        btn.disabled = false;
-        input.focus();
+    .then(function(r){
+        if(!r.ok){
+            return r.json().then(function(data){
+                removeTyping();
+                addMsg(data.error || 'Something went wrong. Please try again.', 'bot', 'System');
+                btn.disabled = false;
+            });
+        }
+        sessionId = r.headers.get('X-Chat-Session') || sessionId;
+        // The reply streams in as plain text; show it as it arrives
+        var reader = r.body.getReader();
+        var decoder = new TextDecoder();
+        var reply = '';
+        var bubble = null;
+        function read(){
+            return reader.read().then(function(chunk){
+                reply += chunk.done ? decoder.decode() : decoder.decode(chunk.value, {stream:true});
+                if(reply.trim() && !bubble){
+                    removeTyping();
+                    bubble = addStreamingMsg(cfg.name);
+                }
+                if(bubble) bubble.textContent = reply.trim();
+                msgs.scrollTop = msgs.scrollHeight;
+                if(!chunk.done) return read();
+                removeTyping();
+                btn.disabled = false;
+                input.focus();
+            });
+        }
+        return read();
     })
     .catch(function(){
         removeTyping();
@@ -1441,57 +4359,231 @@ function sendMessage(){
 </html>
 """
 
+# ----------------------------
+# Precompiled templates, pre-rendered pages and static bundles
+# render_template_string recompiles its template on every call. RESULT_PAGE is compiled once;
+# HTML_PAGE and BIBI_PAGE have no variables, so they are rendered and compressed once and
+# served with an ETag (repeat visits get a 304).
+# Inline <style>/<script> blocks without Jinja tags are moved out of the pages into
+# content-hashed /static/ files that browsers cache for good.
+# ----------------------------
+brotli = importlib.import_module("brotli") if importlib.util.find_spec("brotli") else None
+
+class StaticPage:
+    def __init__(self, body: bytes, mimetype="text/html", cache_control="no-cache"):
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {"identity": body, "gzip": gzip.compress(body, 9)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=11)
+
+    def pick_encoding(self):
+        # prefer the smallest variant the client accepts
+        accepted = request.accept_encodings
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and accepted[encoding]:
+                return encoding
+        return "identity"
+
+    def response(self):
+        headers = {"ETag": f'"{self.etag}"', "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if request.if_none_match.contains(self.etag):
+            return Response(status=304, headers=headers)
+        encoding = self.pick_encoding()
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], mimetype=self.mimetype, headers=headers)
+
+# Blocks smaller than this stay inline; a separate request would cost more than it saves
+STATIC_INLINE_MAX = 1024
+STATIC_ASSET_TYPES = {"style": ("css", "text/css"), "script": ("js", "text/javascript")}
+STATIC_ASSET_RE = re.compile(r"<(style|script)>(.*?)</\1>", re.S)
+STATIC_ASSETS = {}  # fingerprinted file name -> StaticPage
+
+def extract_static_assets(name: str, source: str) -> str:
+    """Move the page's plain <style>/<script> blocks into /static/ bundles and link them instead."""
+    def replace(match):
+        tag, body = match.group(1), match.group(2)
+        if len(body) < STATIC_INLINE_MAX or "{{" in body or "{%" in body:
+            return match.group(0)
+        ext, mimetype = STATIC_ASSET_TYPES[tag]
+        data = textwrap.dedent(body).strip().encode("utf-8") + b"\n"
+        filename = f"{name}.{hashlib.sha256(data).hexdigest()[:12]}.{ext}"
+        STATIC_ASSETS[filename] = StaticPage(data, mimetype, "public, max-age=31536000, immutable")
+        if tag == "style":
+            return f'<link rel="stylesheet" href="/static/{filename}">'
+        return f'<script src="/static/{filename}"></script>'
+    return STATIC_ASSET_RE.sub(replace, source)
+
+def render_static_page(source: str) -> StaticPage:
+    return StaticPage(app.jinja_env.from_string(source).render().encode("utf-8"))
+
+RESULT_TEMPLATE = app.jinja_env.from_string(extract_static_assets("result", RESULT_PAGE))
+HOME_PAGE = render_static_page(extract_static_assets("home", HTML_PAGE))
+BIBI_CHAT_PAGE = render_static_page(extract_static_assets("bibi", BIBI_PAGE))
+
+@app.route("/static/<filename>")
+def static_asset(filename):
+    asset = STATIC_ASSETS.get(filename)
+    if asset is None:
+        return {"error": "Not found"}, 404
+    return asset.response()
+
+# On-the-fly compression for dynamic responses (the result page, JSON APIs).
+# Streams (SSE), files and pre-compressed responses are left alone.
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_MIMETYPES = {"text/html", "application/json"}
+
+@app.after_request
+def compress_response(response):
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    if not request.accept_encodings["gzip"]:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, 6))
+    response.headers["Content-Encoding"] = "gzip"
+    return response
+
+# LLM calls made for a request are rate limited per client address.
+# Set TRUST_PROXY=1 behind a reverse proxy so X-Forwarded-For is used instead.
+TRUST_PROXY = os.environ.get("TRUST_PROXY", "0") == "1"
+
+@app.before_request
+def set_client_id():
+    CLIENT_ID.set(request.access_route[0] if TRUST_PROXY and request.access_route else request.remote_addr)
+
+# Request metrics: in-flight gauge, duration and status per endpoint, plus a Server-Timing
+# header listing the stage_timer() stages of the request (visible in the browser's devtools).
+@app.before_request
+def start_request_metrics():
+    g.metrics_endpoint = request.endpoint or "unmatched"
+    g.metrics_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+    METRICS_PUBLISHER.ensure_started()
+
+def _finish_request_metrics(endpoint, started, status):
+    HTTP_IN_FLIGHT.dec(endpoint=endpoint)
+    HTTP_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+    HTTP_REQUESTS.inc(endpoint=endpoint, status=str(status))
+
+@app.after_request
+def add_server_timing(response):
+    started = g.get("metrics_started")
+    if started is None:
+        return response
+    timings = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in g.get("server_timing", {}).items()]
+    timings.append(f"app;dur={(time.perf_counter() - started) * 1000:.1f}")
+    response.headers["Server-Timing"] = ", ".join(timings)
+    g.metrics_status = response.status_code
+    if response.is_streamed:
+        # count a streamed body once it has been sent, not when the view returns
+        endpoint, status = g.metrics_endpoint, response.status_code
+        g.metrics_started = None
+        response.call_on_close(lambda: _finish_request_metrics(endpoint, started, status))
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    started = g.pop("metrics_started", None)
+    if started is not None:
+        _finish_request_metrics(g.metrics_endpoint, started, g.get("metrics_status", 500))
+
+def wants_json() -> bool:
+    """False only for clients that prefer an HTML page (browsers navigating); fetch() and
+    API clients sending */* or application/json get JSON."""
+    return request.accept_mimetypes.best_match(["application/json", "text/html"]) == "application/json"
+
+@app.errorhandler(LLMRateLimited)
+def llm_rate_limited(e):
+    headers = {"Retry-After": str(e.retry_after)}
+    if wants_json():
+        return {"error": "Too many requests. Please retry shortly."}, 429, headers
+    # A form submit from the home page: the result page, with the error in place of the verdict
+    page = RESULT_TEMPLATE.render(extracted_text="", ai_output=f"Too many requests. Please retry in {e.retry_after}s.", image_id="", filename="", stream_id=None, **rating_fields(None), sources=[])
+    return page, 429, headers
+
 @app.route("/bibi")
 def bibi_page():
-    return render_template_string(BIBI_PAGE)
+    return BIBI_CHAT_PAGE.response()
 
 @app.route("/bibi-chat", methods=["POST"])
 def bibi_chat():
-    data = request.get_json()
-    user_msg = data.get("message", "")
-    chat_history = data.get("history", [])
+    """Streams the character's reply as plain text; the session id comes back in X-Chat-Session."""
+    data = request.get_json() or {}
+    user_msg = str(data.get("message", "")).strip()
     character = data.get("character", "bibi")
+    if character not in CHAT_CHARACTERS:
+        character = "bibi"
+    if not user_msg:
+        return {"error": "Message cannot be empty"}, 400
+    persona = CHAT_CHARACTERS[character]
+    error_reply = persona["error_reply"]
 
-    # Character-specific system prompts
-    if character == "trump":
-        system_prompt = (
-            "You are roleplaying as Donald J. Trump, President of the United States. "
-            "Stay in character at all times. Speak with supreme confidence, use superlatives constantly. "
-            "Say things are 'tremendous', 'the best', 'like nobody has ever seen before'. "
-            "Reference your deal-making skills, your presidency, Making America Great Again, and winning. "
-            "Occasionally say 'Believe me', 'Many people are saying', 'Everybody knows it'. "
-            "Keep responses conversational and 2-4 sentences. This is for entertainment only."
-        )
-        char_label = "Trump"
-        error_reply = "Look, we're having some technical difficulties, okay? Even the greatest president has a bad day. Tremendous. Try again, believe me!"
-    else:
-        system_prompt = (
-            "You are roleplaying as Benjamin 'Bibi' Netanyahu, Prime Minister of Israel. "
-            "Stay in character at all times. Speak with confidence, authority, and occasional humor. "
-            "Reference your long political career, Israel's security, innovation, and strength. "
-            "Occasionally use Hebrew phrases like 'Shalom', 'Toda raba', 'Am Yisrael Chai'. "
-            "Keep responses conversational and 2-4 sentences. This is for entertainment only."
-        )
-        char_label = "Bibi"
-        error_reply = "Shalom, my friend. I seem to be having technical difficulties. Even prime ministers have bad days! Please try again."
+    session = CHAT_SESSIONS.get(data.get("session_id"), character)
+    summary, chat_history = CHAT_SESSIONS.snapshot(session)
+    preamble = persona["preamble"]
+    if summary:
+        preamble += f"\n\nSummary of the conversation so far: {summary}"
 
-    messages_for_api = system_prompt + "\\n\\nConversation so far:\\n"
-    for h in chat_history[-10:]:
-        role = "User" if h["role"] == "user" else char_label
-        messages_for_api += f"{role}: {h['text']}\\n"
-    messages_for_api += f"User: {user_msg}\\n{char_label}:"
+    # Common openers are answered from the pre-generated pool (first message only)
+    opener = CHAT_POOL.opener_key(user_msg) if CHAT_POOL_ENABLED and not chat_history and not summary else None
+    pooled = CHAT_POOL.take(character, opener) if opener else None
+    if opener:
+        CACHE_LOOKUPS.inc(cache="chat_pool", outcome="hit" if pooled else "miss")
+    if pooled:
+        CHAT_SESSIONS.record(session, user_msg, pooled)
+        return Response(pooled, mimetype="text/plain", headers={"Cache-Control": "no-cache", "X-Chat-Session": session["id"]})
 
     try:
-        response = co.chat(
-            model=COHERE_MODEL,
-            message=messages_for_api,
+        chunks = llm.chat_stream(
+            "chat",
+            message=user_msg,
+            preamble=preamble,
+            chat_history=chat_history,
             max_tokens=200,
         )
-        reply = response.text.strip()
+    except LLMRateLimited:
+        raise
     except Exception as e:
-        reply = error_reply
+        print(f"Chat error: {e}")
+        chunks = iter(())
+
+    started = time.perf_counter()
+
+    def generate():
+        # Stream the reply as plain text so the page can render it token by token.
+        # Headers are already sent, so these timings only go to /metrics, not Server-Timing.
+        sent = False
+        reply = []
+        try:
+            for text in chunks:
+                if not sent:
+                    text = text.lstrip()
+                    if not text:
+                        continue
+                    STAGE_SECONDS.observe(time.perf_counter() - started, stage="chat_first_token")
+                sent = True
+                reply.append(text)
+                yield text
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="chat")
+        if not sent:
+            STAGE_ERRORS.inc(stage="chat")
+            yield error_reply
+        else:
+            CHAT_SESSIONS.record(session, user_msg, "".join(reply).strip())
+            if opener:
+                CHAT_POOL.add(character, opener, "".join(reply).strip())
 
-    return {"reply": reply}
+    return Response(stream_with_context(generate()), mimetype="text/plain",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Chat-Session": session["id"]})
 
 @app.route("/reanalyze", methods=["POST"])
 def reanalyze():
@@ -1501,137 +4593,17 @@ def reanalyze():
         return {"error": "No text provided"}, 400
 
     extracted_text = data['extracted_text'].strip()
-    image_b64 = data.get('image_b64', '')
-    mime = data.get('mime', 'image/png')
-    filename = data.get('filename', 'unknown')
 
     if not extracted_text:
         return {"error": "Text cannot be empty"}, 400
 
-    # Step 1: AI Analysis
-    try:
-        analysis_prompt = (
-            "You are a fact-check assistant.\n"
-            "Analyze the following text for factual accuracy.\n"
-            "Instructions:\n"
-            "1) Provide a clear, concise analysis explaining whether the claim(s) are accurate, misleading, or false.\n"
-            "2) Focus only on factual accuracy \u2014 do NOT mention grammar, spelling, punctuation, or style.\n"
-            "3) Be explicit about your conclusion: clearly state whether the statement is 'accurate', 'mostly accurate', "
-            "'partially true', 'misleading', 'mostly false', or 'false'.\n"
-            "4) Keep your analysis brief but informative (2-4 sentences).\n"
-            "5) Write in clear, coherent, and grammatically correct English. Use complete sentences with proper punctuation.\n"
-            "6) Do NOT use asterisks (*) anywhere in your response. No bold, no bullet markers with asterisks, no emphasis with asterisks.\n"
-            "7) After your analysis, output a blank line, then 'SOURCES:' on its own line, followed by 2-4 credible reference sources "
-            "that support your fact-check. Each source on its own line in this format: '- Source Title | https://example.com/page'\n"
-            "   Only cite real, well-known sources (e.g., Reuters, AP News, BBC, Wikipedia, WHO, CDC, official .gov sites, major newspapers). "
-            "Do NOT invent URLs.\n\n"
-            f"Text to evaluate:\n{extracted_text}"
-        )
-        response = co.chat(model=COHERE_MODEL, message=analysis_prompt, max_tokens=350)
-        ai_output = response.text.strip()
-    except Exception as e:
-        ai_output = f"AI Error: {e}"
-
-    # Strip any asterisks the AI might have included
-    ai_output = ai_output.replace('*', '')
-    ai_analysis_display = ai_output
-
-    # Step 2: Derive rating from analysis sentiment
-    analysis_for_rating = ai_analysis_display
-    if 'SOURCES:' in analysis_for_rating:
-        analysis_for_rating = analysis_for_rating.split('SOURCES:', 1)[0].strip()
-
-    def derive_rating_from_analysis(analysis_text: str):
-        if not analysis_text or analysis_text.startswith('AI Error:'):
-            return None
-        try:
-            rating_prompt = (
-                "You are a strict accuracy scoring system. Read the fact-check analysis below and output "
-                "a single accuracy score from 1 to 10.\n\n"
-                "CRITICAL RULES — you must follow these exactly:\n"
-                "1. Look for the conclusion keyword in the analysis (e.g. 'false', 'accurate', 'misleading', etc.)\n"
-                "2. If the analysis concludes the statement is FALSE, FABRICATED, DEBUNKED, INCORRECT, or COMPLETELY WRONG, "
-                "you MUST output 1 or 2. Never output higher than 2 for false statements.\n"
-                "3. If the analysis says MISLEADING, EXAGGERATED, LACKS CONTEXT, MOSTLY FALSE, or MOSTLY INACCURATE, output 3 or 4.\n"
-                "4. If the analysis says PARTIALLY TRUE, MIXED, or has significant caveats, output 5 or 6.\n"
-                "5. If the analysis says MOSTLY ACCURATE or LARGELY TRUE with only minor issues, output 7 or 8.\n"
-                "6. If the analysis says TRUE, ACCURATE, CORRECT, VERIFIED, or CONFIRMED with no caveats, output 9 or 10.\n"
-                "7. If the analysis cannot determine accuracy or says INSUFFICIENT INFO, output N/A.\n\n"
-                "IMPORTANT: A score of 9-10 should be RARE — only for clearly verified true statements. "
-                "When in doubt, score LOWER rather than higher.\n\n"
-                "Output ONLY the integer (1-10) or 'N/A'. Nothing else.\n\n"
-                f"Fact-check analysis:\n{analysis_text}"
-            )
-            resp = co.chat(model=COHERE_MODEL, message=rating_prompt, max_tokens=10)
-            result = resp.text.strip().splitlines()[0].strip()
-            if result.upper() == 'N/A':
-                return None
-            m = re.match(r'^([1-9]|10)\b', result)
-            if m:
-                score = int(m.group(1))
-                # Sanity check: if analysis text contains strong "false" keywords, cap the score
-                lower_analysis = analysis_text.lower()
-                false_keywords = ['false', 'fabricated', 'debunked', 'completely wrong', 'incorrect', 'not true', 'no evidence']
-                misleading_keywords = ['misleading', 'exaggerated', 'lacks context', 'mostly false', 'mostly inaccurate', 'unsubstantiated']
-                if any(kw in lower_analysis for kw in false_keywords) and score > 3:
-                    score = 2
-                elif any(kw in lower_analysis for kw in misleading_keywords) and score > 5:
-                    score = 4
-                return max(1, min(10, score))
-            return None
-        except Exception as e:
-            print(f"Rating derivation error: {e}")
-            return None
-
-    rating = derive_rating_from_analysis(analysis_for_rating)
-    rating_percent = (rating * 10) if rating is not None else 0
-
-    # Parse sources
-    sources_list = []
-    if 'SOURCES:' in ai_analysis_display:
-        parts = ai_analysis_display.split('SOURCES:', 1)
-        ai_analysis_display = parts[0].strip()
-        sources_raw = parts[1].strip()
-        for line in sources_raw.split('\n'):
-            line = line.strip()
-            if line.startswith('- '):
-                line = line[2:].strip()
-            if not line or line.upper() == 'SOURCES:':
-                continue
-            if '|' in line:
-                name, url = line.split('|', 1)
-                name = name.strip()
-                url = url.strip()
-                if name:
-                    sources_list.append({'name': name, 'url': url})
-            elif line.startswith('http'):
-                sources_list.append({'name': line, 'url': line})
-            elif line:
-                sources_list.append({'name': line, 'url': ''})
-
-    def compute_bar_color(percent: int):
-        try:
-            p = int(percent)
-        except Exception:
-            return None
-        if p <= 0:
-            return None
-        if p <= 50:
-            ratio = p / 50.0
-            r, g, b = 255, round(255 * ratio), 0
-        else:
-            ratio = (p - 50) / 50.0
-            r, g, b = round(255 * (1 - ratio)), round(255 - 55 * ratio), 0
-        return f"#{r:02x}{g:02x}{b:02x}"
-
-    bar_color = compute_bar_color(rating_percent) or 'var(--accent)'
+    # The edit is usually the one OCR'd word the verdict depends on, so no fuzzy reuse
+    result = analyze_text(extracted_text, fuzzy_cache=False)
 
     return {
-        'ai_output': ai_analysis_display,
-        'rating': rating,
-        'rating_percent': rating_percent,
-        'bar_color': bar_color,
-        'sources': sources_list
+        'ai_output': result['ai_output'],
+        **rating_fields(result['rating']),
+        'sources': result['sources']
     }
 
 @app.route("/upload", methods=["POST"])
@@ -1647,176 +4619,387 @@ def upload():
     if not file_bytes:
         return "Uploaded file is empty", 400
 
-    # ----------------------------
-    # OCR Step (preprocess image for speed)
-    # ----------------------------
-    def preprocess_image(image_bytes, max_dim=MAX_IMAGE_DIM):
-        img = Image.open(BytesIO(image_bytes))
-        # Keep original color mode (do NOT convert to grayscale).
-        # Convert palette images to RGB for compatibility, but otherwise keep color as-is.
-        if img.mode == 'P':
-            img = img.convert("RGB")
-        # downscale large images to speed up OCR while preserving aspect ratio
-        img.thumbnail((max_dim, max_dim), Image.LANCZOS)
-        return img
-
-    img = preprocess_image(file_bytes)
-    extracted_text = pytesseract.image_to_string(img, config=TESSERACT_CONFIG)
-    
-    # Clean up OCR text (spell-check and make coherent)
-    extracted_text = clean_text(extracted_text)
+    if request.args.get("async") == "1" or (ASYNC_UPLOADS and wants_json()):
+        try:
+            job_id = UPLOAD_JOBS.submit(process_upload, file_bytes)
+        except JobQueueFull as e:
+            return {"error": "Server is busy. Please retry shortly."}, 429, {"Retry-After": str(e.retry_after)}
+        if job_id is None:
+            return {"error": "Server is busy. Please retry shortly."}, 503, {"Retry-After": "1"}
+        return {"job_id": job_id, "status_url": url_for("job_status", job_id=job_id)}, 202
 
-    # ----------------------------
-    # Cohere Chat API — Step 1: Get AI Analysis
-    # ----------------------------
+    # the result page shows the preview from /img/<image_id> rather than inlining the bytes
     try:
-        analysis_prompt = (
-            "You are a fact-check assistant.\n"
-            "Analyze the following text for factual accuracy.\n"
-            "Instructions:\n"
-            "1) Provide a clear, concise analysis explaining whether the claim(s) are accurate, misleading, or false.\n"
-            "2) Focus only on factual accuracy — do NOT mention grammar, spelling, punctuation, or style.\n"
-            "3) Be explicit about your conclusion: clearly state whether the statement is 'accurate', 'mostly accurate', "
-            "'partially true', 'misleading', 'mostly false', or 'false'.\n"
-            "4) Keep your analysis brief but informative (2-4 sentences).\n"
-            "5) Write in clear, coherent, and grammatically correct English. Use complete sentences with proper punctuation.\n"
-            "6) Do NOT use asterisks (*) anywhere in your response. No bold, no bullet markers with asterisks, no emphasis with asterisks.\n"
-            "7) After your analysis, output a blank line, then 'SOURCES:' on its own line, followed by 2-4 credible reference sources "
-            "that support your fact-check. Each source on its own line in this format: '- Source Title | https://example.com/page'\n"
-            "   Only cite real, well-known sources (e.g., Reuters, AP News, BBC, Wikipedia, WHO, CDC, official .gov sites, major newspapers). "
-            "Do NOT invent URLs.\n\n"
-            f"Text to evaluate:\n{extracted_text}"
-        )
+        with stage_timer("store"):
+            image_id = BLOBS.put(file_bytes)
+    except OSError as e:
+        print(f"Blob store write error: {e}")
+        image_id = ""
 
-        response = co.chat(
-            model=COHERE_MODEL,
-            message=analysis_prompt,
-            max_tokens=350
-        )
+    # Render the page shell now; it fills in from /upload-events/<stream_id>
+    stream_id = add_pending_upload(image_id) if PROGRESSIVE_RESULTS and image_id else None
+    if stream_id:
+        return RESULT_TEMPLATE.render(extracted_text="Extracting text\u2026", ai_output="Waiting for extracted text\u2026", image_id=image_id, filename=file.filename, stream_id=stream_id, **rating_fields(None), sources=[])
 
-        ai_output = response.text.strip()
-    except Exception as e:
-        ai_output = f"AI Error: {e}"
+    result = process_upload(file_bytes)
 
-    # Strip any asterisks the AI might have included
-    ai_output = ai_output.replace('*', '')
-    ai_analysis_display = ai_output
+    with stage_timer("render"):
+        return RESULT_TEMPLATE.render(extracted_text=result['extracted_text'], ai_output=result['ai_output'], image_id=image_id, filename=file.filename, stream_id=None, **rating_fields(result['rating']), sources=result['sources'])
 
-    # ----------------------------
-    # Cohere Chat API — Step 2: Derive Accuracy Rating from Analysis Sentiment
-    # ----------------------------
-    # Strip sources from display text before sending to rating prompt
-    analysis_for_rating = ai_analysis_display
-    if 'SOURCES:' in analysis_for_rating:
-        analysis_for_rating = analysis_for_rating.split('SOURCES:', 1)[0].strip()
-
-    def derive_rating_from_analysis(analysis_text: str):
-        """Send the AI analysis to a second Cohere call that scores it 1-10
-        based on the sentiment/conclusion of the analysis."""
-        if not analysis_text or analysis_text.startswith('AI Error:'):
-            return None
+@app.route("/img/<image_id>")
+def uploaded_image(image_id):
+    """Serve an uploaded image from the blob store. Ids are content hashes, so responses never change."""
+    path = BLOBS.path(image_id)
+    if path is None or not os.path.exists(path):
+        return {"error": "Unknown or expired image"}, 404
+    try:
+        with Image.open(path) as img:
+            mime = Image.MIME.get(img.format, "application/octet-stream")
+    except Exception:
+        mime = "application/octet-stream"
+    response = send_file(path, mimetype=mime, etag=image_id, conditional=True, max_age=365 * 24 * 3600)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    return response
+
+@app.route("/upload-batch", methods=["POST"])
+def upload_batch():
+    """Fact-check several images from one multipart request (field name "images").
+    Returns a JSON array with one entry per image, in upload order."""
+    files = [f for f in request.files.getlist("images") if f.filename]
+    if not files:
+        return {"error": "No files uploaded"}, 400
+    if len(files) > BATCH_MAX_FILES:
+        return {"error": f"Too many files (max {BATCH_MAX_FILES})"}, 400
+    # Charge the whole batch before any work starts (429 if the client can't afford it);
+    # its items then don't draw from the client's bucket one call at a time
+    llm.scheduler.check_rate(CLIENT_ID.get(), len(files) * BATCH_LLM_CALLS_PER_IMAGE)
+    CLIENT_ID.set(None)
+    items = [(f.filename, f.read()) for f in files]
+    return jsonify(process_batch(items))
+
+@app.route("/upload-events/<stream_id>")
+def upload_events(stream_id):
+    """Server-Sent Events: ocr, cleaned, analysis, rating, sources, then done (or error)."""
+    blob_id = take_pending_upload(stream_id)
+    file_bytes = BLOBS.get(blob_id) if blob_id else None
+    if file_bytes is None:
+        return {"error": "Unknown or expired upload"}, 404
+    client_id = CLIENT_ID.get()
+
+    def generate():
+        CLIENT_ID.set(client_id)
+        events = iter_upload_pipeline(file_bytes)
         try:
-            rating_prompt = (
-                "You are a strict accuracy scoring system. Read the fact-check analysis below and output "
-                "a single accuracy score from 1 to 10.\n\n"
-                "CRITICAL RULES — you must follow these exactly:\n"
-                "1. Look for the conclusion keyword in the analysis (e.g. 'false', 'accurate', 'misleading', etc.)\n"
-                "2. If the analysis concludes the statement is FALSE, FABRICATED, DEBUNKED, INCORRECT, or COMPLETELY WRONG, "
-                "you MUST output 1 or 2. Never output higher than 2 for false statements.\n"
-                "3. If the analysis says MISLEADING, EXAGGERATED, LACKS CONTEXT, MOSTLY FALSE, or MOSTLY INACCURATE, output 3 or 4.\n"
-                "4. If the analysis says PARTIALLY TRUE, MIXED, or has significant caveats, output 5 or 6.\n"
-                "5. If the analysis says MOSTLY ACCURATE or LARGELY TRUE with only minor issues, output 7 or 8.\n"
-                "6. If the analysis says TRUE, ACCURATE, CORRECT, VERIFIED, or CONFIRMED with no caveats, output 9 or 10.\n"
-                "7. If the analysis cannot determine accuracy or says INSUFFICIENT INFO, output N/A.\n\n"
-                "IMPORTANT: A score of 9-10 should be RARE — only for clearly verified true statements. "
-                "When in doubt, score LOWER rather than higher.\n\n"
-                "Output ONLY the integer (1-10) or 'N/A'. Nothing else.\n\n"
-                f"Fact-check analysis:\n{analysis_text}"
-            )
-            resp = co.chat(
-                model=COHERE_MODEL,
-                message=rating_prompt,
-                max_tokens=10
-            )
-            result = resp.text.strip().splitlines()[0].strip()
-            if result.upper() == 'N/A':
-                return None
-            m = re.match(r'^([1-9]|10)\b', result)
-            if m:
-                score = int(m.group(1))
-                # Sanity check: if analysis text contains strong "false" keywords, cap the score
-                lower_analysis = analysis_text.lower()
-                false_keywords = ['false', 'fabricated', 'debunked', 'completely wrong', 'incorrect', 'not true', 'no evidence']
-                misleading_keywords = ['misleading', 'exaggerated', 'lacks context', 'mostly false', 'mostly inaccurate', 'unsubstantiated']
-                if any(kw in lower_analysis for kw in false_keywords) and score > 3:
-                    score = 2
-                elif any(kw in lower_analysis for kw in misleading_keywords) and score > 5:
-                    score = 4
-                return max(1, min(10, score))
-            return None
+            while True:
+                try:
+                    name, data = next(events)
+                except StopIteration as stop:
+                    result = stop.value
+                    break
+                yield sse_event(name, data)
+            yield sse_event("done", dict(result, **rating_fields(result['rating'])))
+        except LLMRateLimited as e:
+            yield sse_event("error", {"error": f"Too many requests. Please retry in {e.retry_after}s."})
         except Exception as e:
-            print(f"Rating derivation error: {e}")
-            return None
+            print(f"Upload pipeline error: {e}")
+            yield sse_event("error", {"error": "Analysis failed. Please try again."})
 
-    rating = derive_rating_from_analysis(analysis_for_rating)
-    rating_percent = (rating * 10) if rating is not None else 0
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    # Parse sources from AI output (format: SOURCES:\n- Title | URL)
-    sources_list = []
-    if 'SOURCES:' in ai_analysis_display:
-        parts = ai_analysis_display.split('SOURCES:', 1)
-        ai_analysis_display = parts[0].strip()
-        sources_raw = parts[1].strip()
-        for line in sources_raw.split('\n'):
-            line = line.strip()
-            if line.startswith('- '):
-                line = line[2:].strip()
-            if not line or line.upper() == 'SOURCES:':
-                continue
-            if '|' in line:
-                name, url = line.split('|', 1)
-                name = name.strip()
-                url = url.strip()
-                if name:
-                    sources_list.append({'name': name, 'url': url})
-            elif line.startswith('http'):
-                sources_list.append({'name': line, 'url': line})
-            elif line:
-                sources_list.append({'name': line, 'url': ''})
-    sources_json = json.dumps(sources_list)
-
-    def compute_bar_color(percent: int):
-        try:
-            p = int(percent)
-        except Exception:
-            return None
-        if p <= 0:
-            return None
-        if p <= 50:
-            # interpolate red (255,0,0) -> yellow (255,255,0)
-            ratio = p / 50.0
-            r = 255
-            g = round(255 * ratio)
-            b = 0
-        else:
-            # interpolate yellow (255,255,0) -> green (0,200,0)
-            ratio = (p - 50) / 50.0
-            r = round(255 * (1 - ratio))
-            g = round(255 - 55 * ratio)
-            b = 0
-        return f"#{r:02x}{g:02x}{b:02x}"
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = UPLOAD_JOBS.get(job_id)
+    if job is None:
+        return {"error": "Unknown or expired job"}, 404
+    body = {"job_id": job_id, "status": job["status"]}
+    if job["status"] == "done":
+        body["result"] = dict(job["result"], **rating_fields(job["result"]['rating']))
+    elif job["status"] == "error":
+        body["error"] = job["error"]
+    return body
 
-    bar_color = compute_bar_color(rating_percent) or 'var(--accent)'
-    # embed uploaded image as base64 for preview in result page
+@app.route("/stats")
+def stats():
+    """Cache counters, used to size the caches."""
+    with RATING_STATS_LOCK:
+        rating_stats = dict(RATING_STATS)
+    return {"result_cache": RESULT_CACHE.stats(), "near_duplicates": NEAR_DUP_INDEX.stats(), "claim_cache": CLAIM_CACHE.stats(), "rating": rating_stats, "llm": llm.stats(), "jobs": UPLOAD_JOBS.stats(), "blobs": BLOBS.stats(), "chat_sessions": CHAT_SESSIONS.stats(), "chat_pool": CHAT_POOL.stats(), "ocr": OCR.stats(), "cleanup": cleanup_stats(), "startup_seconds": dict(STARTUP_TIMINGS)}
+
+# Gauges read from the live objects at scrape time
+LLM_IN_FLIGHT = Gauge("infobait_llm_in_flight", "LLM calls holding a scheduler slot, per priority class.", ("class",),
+                      collect=lambda: {(cls,): c["active"] for cls, c in llm.scheduler.stats()["classes"].items()})
+LLM_WAITING = Gauge("infobait_llm_waiting", "LLM calls queued for a scheduler slot, per priority class.", ("class",),
+                    collect=lambda: {(cls,): c["waiting"] for cls, c in llm.scheduler.stats()["classes"].items()})
+JOB_QUEUE_DEPTH = Gauge("infobait_job_queue_depth", "Async upload jobs waiting for a worker.",
+                        collect=lambda: {(): UPLOAD_JOBS.stats()["queued"]})
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(METRICS_PUBLISHER.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+# ----------------------------
+# Warm-up and health checks
+# /healthz: the process is up. /readyz: 503 until warm_up() has run the first OCR job
+# (starting the worker pool and loading traineddata) and opened the LLM connection, so a
+# load balancer only routes to warm replicas. Warm-up starts once per server worker.
+# ----------------------------
+WARM_STATE = {"started": False, "ready": False, "errors": {}}
+WARM_LOCK = threading.Lock()
+
+def warm_up():
+    """Pay the one-time costs now instead of on the first upload. Ready once OCR works;
+    a failed LLM connection is reported but does not block (the circuit breaker covers it)."""
+    errors = {}
+    started = time.perf_counter()
     try:
-        image_b64 = base64.b64encode(file_bytes).decode("ascii")
-    except Exception:
-        image_b64 = ""
-    mime = getattr(file, 'content_type', 'image/png') or 'image/png'
+        OCR.warm_up()
+        OCR.image_to_data(Image.new("L", (160, 48), 255))
+    except Exception as e:
+        errors["ocr"] = str(e)
+    STARTUP_TIMINGS["warm_up_ocr"] = round(time.perf_counter() - started, 4)
+    started = time.perf_counter()
+    try:
+        llm.connect()
+    except Exception as e:
+        errors["llm"] = str(e)
+    STARTUP_TIMINGS["warm_up_llm"] = round(time.perf_counter() - started, 4)
+    with WARM_LOCK:
+        WARM_STATE["errors"] = errors
+        WARM_STATE["ready"] = "ocr" not in errors
+    if errors:
+        print(f"Warm-up finished with errors: {errors}")
 
-    return render_template_string(RESULT_PAGE, extracted_text=extracted_text, ai_output=ai_analysis_display, image_b64=image_b64, mime=mime, filename=file.filename, rating=rating, rating_percent=rating_percent, bar_color=bar_color, sources=sources_json)
+def start_warm_up():
+    """Run warm_up() in the background, once per process."""
+    with WARM_LOCK:
+        if WARM_STATE["started"]:
+            return
+        WARM_STATE["started"] = True
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
 
-if __name__ == "__main__":
+@app.before_request
+def ensure_warm_up():
+    # gunicorn workers start warming before their first request (post_worker_init);
+    # under other servers the first request kicks it off
+    if not WARM_STATE["started"]:
+        start_warm_up()
+
+@app.route("/healthz")
+def healthz():
+    return {"status": "ok", "pid": os.getpid()}
+
+@app.route("/readyz")
+def readyz():
+    with WARM_LOCK:
+        body = {"ready": WARM_STATE["ready"], "errors": dict(WARM_STATE["errors"])}
+    body["startup_seconds"] = dict(STARTUP_TIMINGS)
+    return body, 200 if body["ready"] else 503
+
+def bench_decode(paths, repeat=5, run_ocr=False):
+    """Compare decode+resize time (and optionally OCR output) of the fast and plain paths.
+
+    With run_ocr, OCR accuracy is the word-level similarity to <image>.txt when that
+    ground-truth file exists, otherwise the similarity of the fast path's text to the plain path's.
+    """
+    def words_similarity(a, b):
+        return difflib.SequenceMatcher(None, a.split(), b.split()).ratio()
+
+    totals = {"plain": 0.0, "fast": 0.0}
+    for path in paths:
+        with open(path, "rb") as f:
+            image_bytes = f.read()
+        timings, images = {}, {}
+        for label, fast in (("plain", False), ("fast", True)):
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                images[label] = preprocess_image(image_bytes, fast=fast)
+                images[label].load()
+                samples.append(time.perf_counter() - started)
+            timings[label] = statistics.median(samples)
+            totals[label] += timings[label]
+        line = (f"{os.path.basename(path)}: plain {timings['plain'] * 1000:.1f} ms {images['plain'].size}, "
+                f"fast {timings['fast'] * 1000:.1f} ms {images['fast'].size}, "
+                f"speedup x{timings['plain'] / max(timings['fast'], 1e-9):.2f}")
+        if run_ocr:
+            texts = {label: OCR.image_to_data(img)["text"] for label, img in images.items()}
+            truth_path = os.path.splitext(path)[0] + ".txt"
+            if os.path.exists(truth_path):
+                with open(truth_path, encoding="utf-8") as f:
+                    truth = f.read()
+                line += (f", OCR word accuracy plain {words_similarity(texts['plain'], truth):.3f}"
+                         f" / fast {words_similarity(texts['fast'], truth):.3f}")
+            else:
+                line += f", OCR agreement fast vs plain {words_similarity(texts['fast'], texts['plain']):.3f}"
+        print(line)
+    if paths:
+        print(f"total: plain {totals['plain'] * 1000:.1f} ms, fast {totals['fast'] * 1000:.1f} ms, "
+              f"speedup x{totals['plain'] / max(totals['fast'], 1e-9):.2f}")
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp", ".tif", ".tiff"}
+
+def iter_image_files(root: str):
+    """Yield image paths under root in a stable (sorted) order without listing everything up front."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                yield os.path.join(dirpath, name)
+
+def scan_directory(root: str, out_path: str, workers: int, report_every: float = 5.0):
+    """Fact-check every image under root, appending one JSON line per image to out_path.
+
+    The output file is the checkpoint: images already recorded with "ok": true are
+    skipped, so an interrupted scan resumes where it stopped (failed images are retried).
+    """
+    done = set()
+    needs_newline = False
+    if os.path.exists(out_path):
+        with open(out_path, encoding="utf-8") as f:
+            for line in f:
+                needs_newline = not line.endswith("\n")
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # line cut off by an interrupted write
+                if record.get("ok"):
+                    done.add(record["path"])
+    if done:
+        print(f"Resuming: {len(done)} images already done")
+
+    def run(path):
+        with open(path, "rb") as f:
+            file_bytes = f.read()
+        if not file_bytes:
+            raise ValueError("file is empty")
+        result = process_upload(file_bytes)
+        if result['ai_output'].startswith('AI Error:'):
+            # LLM down or breaker open: record a failure so a resumed scan retries the image
+            raise RuntimeError(result['ai_output'])
+        return result
+
+    started = last_report = time.time()
+    processed = failed = 0
+    with open(out_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as executor:
+        if needs_newline:
+            out.write("\n")
+        pending = {}
+        paths = (p for p in iter_image_files(root) if os.path.relpath(p, root) not in done)
+        exhausted = False
+        while pending or not exhausted:
+            # Keep a bounded number of images in flight so huge archives stream through
+            while not exhausted and len(pending) < workers * 2:
+                path = next(paths, None)
+                if path is None:
+                    exhausted = True
+                else:
+                    pending[executor.submit(run, path)] = path
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path = pending.pop(future)
+                record = {"path": os.path.relpath(path, root)}
+                try:
+                    result = future.result()
+                    record.update(ok=True, **result)
+                except Exception as e:
+                    record.update(ok=False, error=str(e))
+                    failed += 1
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                processed += 1
+            now = time.time()
+            if now - last_report >= report_every:
+                print(f"{processed} images ({failed} failed), {processed / (now - started):.2f} images/sec")
+                last_report = now
+    elapsed = max(time.time() - started, 1e-9)
+    print(f"Done: {processed} images ({failed} failed) in {elapsed:.1f}s, {processed / elapsed:.2f} images/sec")
+
+# ----------------------------
+# Production server ("serve")
+# gunicorn with preload_app: the app is imported once in the master, so the compiled
+# templates, static bundles and clients are shared copy-on-write by the forked workers.
+# Pools and background threads start lazily in each worker. Workers are recycled after
+# SERVE_MAX_REQUESTS requests (with jitter, so they don't all restart at once) and get
+# SERVE_GRACEFUL_TIMEOUT seconds to finish in-flight requests on SIGTERM/SIGHUP.
+# State a follow-up request needs is in the shared state DB (see STATE_DB), so no sticky
+# routing is needed. Process-wide budgets (OCR_POOL_SIZE, LLM concurrency and per-client
+# rates) are split between the workers so the totals stay as configured.
+# waitress (single process, threads only) is the fallback on Windows or without gunicorn.
+# ----------------------------
+SERVE_WORKERS = int(os.environ.get("SERVE_WORKERS", str(multiprocessing.cpu_count())))
+SERVE_THREADS = int(os.environ.get("SERVE_THREADS", "4"))
+SERVE_MAX_REQUESTS = int(os.environ.get("SERVE_MAX_REQUESTS", "1000"))
+SERVE_MAX_REQUESTS_JITTER = int(os.environ.get("SERVE_MAX_REQUESTS_JITTER", "100"))
+SERVE_GRACEFUL_TIMEOUT = int(os.environ.get("SERVE_GRACEFUL_TIMEOUT", "30"))
+# A worker silent for this long is killed and replaced; above the slowest LLM stage budget
+SERVE_TIMEOUT = int(os.environ.get("SERVE_TIMEOUT", "120"))
+
+def share_budgets_across_workers(workers):
+    """Give each of `workers` server processes its share of the OCR pool and LLM limits
+    (at least one each). Called in the master before forking."""
+    if workers <= 1:
+        return
+    OCR.pool_size = max(1, OCR_POOL_SIZE // workers)
+    llm.scheduler = LLMScheduler(
+        max(1, LLM_MAX_CONCURRENT // workers),
+        {cls: max(1, limit // workers) for cls, limit in LLM_CLASS_LIMITS.items()},
+        LLM_CLIENT_RATE / workers,
+        LLM_CLIENT_BURST / workers,
+    )
+
+def _serve_post_worker_init(worker):
+    start_warm_up()
+
+def _serve_worker_exit(server, worker):
+    UPLOAD_JOBS.shutdown(SERVE_GRACEFUL_TIMEOUT / 2)
+    OCR.shutdown()
+
+def run_production_server(host, port, workers, threads):
+    if platform.system() != "Windows" and importlib.util.find_spec("gunicorn"):
+        from gunicorn.app.base import BaseApplication
+
+        class InfoBaitServer(BaseApplication):
+            def __init__(self, options):
+                self.options = options
+                super().__init__()
+
+            def load_config(self):
+                for key, value in self.options.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                return app
+
+        share_budgets_across_workers(workers)
+        InfoBaitServer({
+            "bind": f"{host}:{port}",
+            "workers": workers,
+            "threads": threads,
+            "worker_class": "gthread",
+            "preload_app": True,
+            "max_requests": SERVE_MAX_REQUESTS,
+            "max_requests_jitter": SERVE_MAX_REQUESTS_JITTER,
+            "graceful_timeout": SERVE_GRACEFUL_TIMEOUT,
+            "timeout": SERVE_TIMEOUT,
+            "keepalive": 5,
+            "post_worker_init": _serve_post_worker_init,
+            "worker_exit": _serve_worker_exit,
+        }).run()
+    elif importlib.util.find_spec("waitress"):
+        from waitress import serve
+        print(f"gunicorn unavailable; serving with waitress (1 process, {workers * threads} threads)")
+        start_warm_up()
+        serve(app, host=host, port=port, threads=workers * threads)
+    else:
+        raise SystemExit("The serve command needs gunicorn (or waitress on Windows): pip install gunicorn")
+
+def run_dev_server():
     # Start on PORT (default 5002); if busy, pick the next available port.
     base_port = int(os.environ.get("PORT", "5002"))
     port = base_port
@@ -1829,3 +5012,37 @@ if __name__ == "__main__":
     if port != base_port:
         print(f"Port {base_port} is busy. Using {port} instead.")
     app.run(host="0.0.0.0", port=port, debug=True)
+
+STARTUP_TIMINGS["module_init"] = round(time.perf_counter() - _IMPORT_STARTED, 4)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="InfoBait misinformation tracker. Runs the dev server when no command is given.")
+    commands = parser.add_subparsers(dest="command")
+    report_cmd = commands.add_parser("rating-report", help="compare the local rating engine with the LLM scorer on a labeled corpus")
+    report_cmd.add_argument("corpus", help="JSONL file of {\"analysis\": ..., \"label\": 1-10 or null}")
+    report_cmd.add_argument("--no-llm", action="store_true", help="only evaluate the local scorer (no Cohere calls)")
+    bench_cmd = commands.add_parser("bench-decode", help="micro-benchmark the image decode+resize paths")
+    bench_cmd.add_argument("images", nargs="+", help="image files to decode")
+    bench_cmd.add_argument("--repeat", type=int, default=5, help="timed runs per image and path (median is reported)")
+    bench_cmd.add_argument("--ocr", action="store_true", help="also compare OCR output of both paths")
+    scan_cmd = commands.add_parser("scan", help="fact-check every image in a directory, writing JSONL (resumable)")
+    scan_cmd.add_argument("directory", help="directory to scan recursively for images")
+    scan_cmd.add_argument("--out", default="scan_results.jsonl", help="JSONL output file; also the resume checkpoint")
+    scan_cmd.add_argument("--workers", type=int, default=OCR_POOL_SIZE, help="images processed concurrently")
+    serve_cmd = commands.add_parser("serve", help="run under a production WSGI server (gunicorn, or waitress)")
+    serve_cmd.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    serve_cmd.add_argument("--port", type=int, default=int(os.environ.get("PORT", "5002")))
+    serve_cmd.add_argument("--workers", type=int, default=SERVE_WORKERS, help="worker processes")
+    serve_cmd.add_argument("--threads", type=int, default=SERVE_THREADS, help="request threads per worker")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        run_production_server(args.host, args.port, max(1, args.workers), max(1, args.threads))
+    elif args.command == "scan":
+        scan_directory(args.directory, args.out, max(1, args.workers))
+    elif args.command == "rating-report":
+        print(json.dumps(rating_agreement_report(args.corpus, use_llm=not args.no_llm), indent=2))
+    elif args.command == "bench-decode":
+        bench_decode(args.images, repeat=args.repeat, run_ocr=args.ocr)
+    else:
+        run_dev_server()
@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+from io import BytesIO
+
+# Keep the test run off the on-disk result cache and state database
+os.environ.setdefault("RESULT_CACHE_DB", "")
+os.environ.setdefault("STATE_DB", os.path.join(tempfile.mkdtemp(prefix="infobait-tests-"), "state.sqlite3"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+import InfoBait
+
+
+@pytest.fixture
+def ib():
+    return InfoBait
+
+
+def _font(size):
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def _screenshot(claim, fmt="PNG", quality=90, scale=1.0):
+    """A social-media-post style screenshot: header bar, wrapped claim text, footer."""
+    font = _font(22)
+    img = Image.new("RGB", (720, 400), "white")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, 720, 50), fill=(29, 161, 242))
+    draw.text((20, 12), "@someone - 2h", fill="white", font=font)
+    lines, line = [], ""
+    for word in claim.split():
+        if len(line) + len(word) > 45:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    lines.append(line)
+    for i, text in enumerate(lines):
+        draw.text((20, 80 + i * 34), text, fill="black", font=font)
+    draw.text((20, 350), "12 replies   40 reposts   200 likes", fill=(100, 100, 100), font=font)
+    if scale != 1.0:
+        img = img.resize((int(img.width * scale), int(img.height * scale)), Image.BILINEAR)
+    buf = BytesIO()
+    img.save(buf, fmt, quality=quality)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def screenshot():
+    return _screenshot
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+@pytest.fixture
+def pool(ib, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ib, "time", clock)
+    generated = []
+
+    class Reply:
+        def __init__(self, text):
+            self.text = text
+
+    def fake_chat(stage, message="", preamble="", **kwargs):
+        generated.append(message)
+        return Reply(f"reply {len(generated)} to {message}")
+
+    monkeypatch.setattr(ib.llm, "chat", fake_chat)
+    pool = ib.ChatResponsePool(size=2, max_uses=20, refresh=6 * 3600, warm_interval=30, promote_after=3, idle=3600)
+    pool._ensure_warmer = lambda: None
+    pool.clock = clock
+    pool.generated = generated
+    return pool
+
+
+def test_only_pools_that_are_asked_for_get_filled(ib, pool):
+    pool.warm()
+    assert pool.generated == []
+
+    assert pool.take("bibi", "greeting") is None
+    pool.warm()
+    pool.warm()
+    assert pool.generated == ["Hi!", "Hi!"]
+    assert pool.take("bibi", "greeting").startswith("reply")
+
+
+def test_idle_pools_are_not_refilled(ib, pool):
+    pool.take("bibi", "greeting")
+    pool.warm()
+    pool.clock.now += 6 * 3600 + 1  # replies expired and nobody asked since
+    pool.warm()
+    assert len(pool.generated) == 1
+
+
+def test_unused_promoted_opener_is_demoted(ib, pool):
+    for _ in range(3):
+        key = pool.opener_key("Is the earth flat?")
+    assert key == "is the earth flat"
+    pool.take("bibi", key)
+    pool.warm()
+    assert pool.stats()["openers"] == len(ib.CHAT_OPENERS) + 1
+
+    pool.clock.now += 3601
+    pool.warm()
+    assert pool.stats()["openers"] == len(ib.CHAT_OPENERS)
+    assert pool.stats()["demoted"] == 1
+    assert pool.stats()["pooled_replies"] == 0
+    # it has to earn promotion again
+    assert pool.opener_key("Is the earth flat?") is None
+
+
+def test_warmer_stops_when_no_pool_is_in_use(ib, monkeypatch):
+    monkeypatch.setattr(ib.llm, "chat", lambda stage, **kwargs: type("Reply", (), {"text": "hello"})())
+    pool = ib.ChatResponsePool(size=1, max_uses=20, refresh=3600, warm_interval=0.01, promote_after=3, idle=0.05)
+    pool.take("bibi", "greeting")
+    deadline = time.time() + 5
+    while pool._warmer is not None and time.time() < deadline:
+        time.sleep(0.01)
+    assert pool._warmer is None
+    assert pool.take("bibi", "greeting") == "hello"
+    assert pool._warmer is not None
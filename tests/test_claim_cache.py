@@ -0,0 +1,71 @@
+import pytest
+
+CLAIM = ("A new study published this week found that drinking coffee every morning increases "
+         "the risk of heart disease in adults who already have high blood pressure and diabetes")
+
+
+@pytest.fixture
+def cache(ib, monkeypatch):
+    cache = ib.ClaimCache(0.8, 2, 64, 16, 100)
+    monkeypatch.setattr(ib, "CLAIM_CACHE", cache)
+    monkeypatch.setattr(ib, "CLAIM_CACHE_ENABLED", True)
+    return cache
+
+
+@pytest.fixture
+def analyses(ib, monkeypatch):
+    """Claims sent to the analysis stage; the fake reply names the claim."""
+    sent = []
+
+    class Reply:
+        def __init__(self, text):
+            self.text = text
+
+    def fake_chat(stage, validate=None, message="", **kwargs):
+        claim = message.split("Text to evaluate:")[-1].strip()
+        sent.append(claim)
+        return Reply(f"This claim is false. Checked: {claim}\n\nSOURCES:\n- WHO | https://who.int")
+
+    monkeypatch.setattr(ib.llm, "chat", fake_chat)
+    return sent
+
+
+def test_fuzzy_lookup_absorbs_ocr_noise(cache):
+    cache.put(CLAIM, {'ai_output': "stored"})
+    assert cache.get(CLAIM.replace("morning", "mornlng")) == {'ai_output': "stored"}
+
+
+@pytest.mark.parametrize("edited", [
+    CLAIM.replace("increases", "reduces"),
+    CLAIM.replace("coffee", "bleach"),
+])
+def test_exact_lookup_rejects_one_word_edits(cache, edited):
+    cache.put(CLAIM, {'ai_output': "stored"})
+    assert cache.get(edited, fuzzy=False) is None
+    assert cache.get(CLAIM.upper() + " ", fuzzy=False) == {'ai_output': "stored"}
+
+
+def test_exact_key_is_dropped_on_eviction(ib, monkeypatch):
+    monkeypatch.setattr(ib, "CLAIM_CACHE_ENABLED", True)
+    cache = ib.ClaimCache(0.8, 2, 64, 16, 1)
+    cache.put("first claim text", {'ai_output': "one"})
+    cache.put("second claim text", {'ai_output': "two"})
+    assert cache.get("first claim text", fuzzy=False) is None
+    assert cache.get("second claim text", fuzzy=False) == {'ai_output': "two"}
+
+
+@pytest.mark.parametrize("edited", [
+    CLAIM.replace("increases", "reduces"),
+    CLAIM.replace("coffee", "bleach"),
+])
+def test_reanalyze_does_not_return_stale_verdict(ib, cache, analyses, edited):
+    client = ib.app.test_client()
+    ib.WARM_STATE["started"] = True
+
+    first = client.post("/reanalyze", json={"extracted_text": CLAIM}).get_json()
+    second = client.post("/reanalyze", json={"extracted_text": edited}).get_json()
+    again = client.post("/reanalyze", json={"extracted_text": edited}).get_json()
+
+    assert len(analyses) == 2
+    assert second['ai_output'] != first['ai_output']
+    assert again == second
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_USE = r"""
+import threading
+import InfoBait as ib
+barrier = threading.Barrier(8)
+errors = []
+def first_use():
+    barrier.wait()
+    try:
+        ib.httpx.Timeout(1.0)
+        ib.Image.new("L", (4, 4)).filter(ib.ImageFilter.FIND_EDGES)
+        ib.pytesseract.Output.DICT
+    except Exception as e:
+        errors.append(repr(e))
+threads = [threading.Thread(target=first_use) for _ in range(8)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+print(errors)
+"""
+
+
+def test_concurrent_first_use_imports_once():
+    env = dict(os.environ, RESULT_CACHE_DB="")
+    for _ in range(3):
+        done = subprocess.run([sys.executable, "-c", FIRST_USE], cwd=ROOT, env=env,
+                              capture_output=True, text=True, timeout=120)
+        assert done.returncode == 0, done.stderr
+        assert done.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_missing_module_fails_at_import(ib):
+    try:
+        ib.lazy_import("no_such_module_here")
+    except ImportError:
+        pass
+    else:
+        raise AssertionError("expected ImportError")
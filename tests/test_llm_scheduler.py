@@ -0,0 +1,57 @@
+from io import BytesIO
+
+import pytest
+
+
+@pytest.fixture
+def batch_client(ib, monkeypatch):
+    """Test client whose batch items each make a real gateway call (to a fake Cohere client)."""
+    monkeypatch.setattr(ib.llm, "scheduler", ib.LLMScheduler(
+        ib.LLM_MAX_CONCURRENT, ib.LLM_CLASS_LIMITS, ib.LLM_CLIENT_RATE, ib.LLM_CLIENT_BURST))
+    monkeypatch.setattr(ib, "RESULT_CACHE", ib.ResultCache(1 << 20, "", 3600))
+    monkeypatch.setattr(ib, "CLAIM_CACHE_ENABLED", False)
+    monkeypatch.setattr(ib, "PIPELINE_MODE", "chain")
+
+    class Reply:
+        text = "The claim is false.\n\nSOURCES:\n- Reuters | https://reuters.com"
+
+    class FakeCohere:
+        def chat(self, **kwargs):
+            return Reply()
+
+    monkeypatch.setattr(ib.llm, "client", FakeCohere())
+
+    def fake_ocr_upload(file_bytes):
+        text = file_bytes.decode()
+        return {'cache_key': text, 'phash': None, 'ocr': {'text': text, 'words': [(w, 95.0) for w in text.split()]}}
+
+    monkeypatch.setattr(ib, "ocr_upload", fake_ocr_upload)
+    ib.WARM_STATE["started"] = True
+    return ib.app.test_client()
+
+
+def post_batch(client, count, address="10.0.0.1"):
+    files = [(BytesIO(f"claim number {i} is here".encode()), f"{i}.png") for i in range(count)]
+    return client.post("/upload-batch", data={"images": files}, content_type="multipart/form-data",
+                       environ_base={"REMOTE_ADDR": address})
+
+
+def test_full_size_batch_is_not_rate_limited_midway(ib, batch_client):
+    response = post_batch(batch_client, 40)
+    assert response.status_code == 200
+    assert [item["ok"] for item in response.get_json()] == [True] * 40
+
+
+def test_batch_over_budget_is_rejected_before_any_work(ib, batch_client, monkeypatch):
+    assert post_batch(batch_client, 40).status_code == 200
+    monkeypatch.setattr(ib, "ocr_upload", lambda file_bytes: pytest.fail("batch started"))
+    response = post_batch(batch_client, 5)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_token_bucket_charges_above_capacity_only_when_full(ib):
+    bucket = ib.TokenBucket(rate=1, capacity=10)
+    assert bucket.take(25) == 0.0
+    assert bucket.tokens == pytest.approx(-15, abs=0.01)
+    assert bucket.take() == pytest.approx(16, abs=0.1)
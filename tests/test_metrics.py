@@ -0,0 +1,50 @@
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _requests_by_worker(text):
+    return {m.group(1): float(m.group(2)) for m in re.finditer(
+        r'^infobait_http_requests_total\{worker="(\d+)",endpoint="health",status="200"\} (\S+)$', text, re.M)}
+
+
+def test_scrape_reports_every_worker(ib):
+    ib.HTTP_REQUESTS.inc(endpoint="health", status="200")
+    other = subprocess.run(
+        [sys.executable, "-c", "import os, InfoBait as ib\n"
+         "ib.HTTP_REQUESTS.inc(3, endpoint='health', status='200')\n"
+         "assert ib.METRICS_PUBLISHER.publish()\n"
+         "print(os.getpid())"],
+        cwd=ROOT, env=dict(os.environ, RESULT_CACHE_DB=""), capture_output=True, text=True, timeout=120)
+    assert other.returncode == 0, other.stderr
+    other_pid = other.stdout.strip()
+
+    text = ib.app.test_client().get("/metrics").get_data(as_text=True)
+    by_worker = _requests_by_worker(text)
+    assert by_worker[other_pid] == 3
+    assert by_worker[str(os.getpid())] >= 1
+    assert text.count("# TYPE infobait_http_requests_total counter") == 1
+
+
+def test_exited_workers_age_out(ib):
+    ib.HTTP_REQUESTS.inc(endpoint="health", status="200")
+    with ib.state_db() as conn:
+        conn.execute("INSERT INTO metric_samples (worker, metric, seq, line, updated) VALUES (?, ?, 0, ?, 0)",
+                     (1, "infobait_http_requests_total",
+                      'infobait_http_requests_total{worker="1",endpoint="health",status="200"} 9'))
+    text = ib.METRICS_PUBLISHER.render()
+    assert "1" not in _requests_by_worker(text)
+    assert str(os.getpid()) in _requests_by_worker(text)
+
+
+def test_decode_and_resize_are_timed_separately(ib, screenshot):
+    image = screenshot("a claim to decode", fmt="JPEG", scale=3.0)
+    with ib.app.test_request_context("/upload"):
+        ib.preprocess_image(image)
+        assert {"decode", "resize"} <= set(ib.g.server_timing)
+    text = ib.render_metrics({metric.name: metric.sample_lines(0) for metric in ib.METRICS})
+    assert 'infobait_stage_seconds_count{worker="0",stage="decode"}' in text
+    assert 'infobait_stage_seconds_count{worker="0",stage="resize"}' in text
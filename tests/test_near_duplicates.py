@@ -0,0 +1,129 @@
+import random
+import time
+
+import pytest
+
+
+@pytest.fixture
+def pipeline(ib, monkeypatch):
+    """Upload pipeline with fresh caches, OCR answering from a queue and a fake analysis."""
+    monkeypatch.setattr(ib, "RESULT_CACHE", ib.ResultCache(1 << 20, "", 3600))
+    monkeypatch.setattr(ib, "NEAR_DUP_INDEX", ib.NearDuplicateIndex(1000, ib.PHASH_MAX_DISTANCE, 64))
+    monkeypatch.setattr(ib, "CLAIM_CACHE_ENABLED", False)
+    monkeypatch.setattr(ib, "PIPELINE_MODE", "chain")
+    monkeypatch.setattr(ib, "clean_ocr_text", lambda text, words: text)
+    ocr_texts = []
+    analysed = []
+
+    def fake_ocr(img):
+        text = ocr_texts.pop(0)
+        return {'text': text, 'words': [(w, 95.0) for w in text.split()]}
+
+    def fake_analysis(text):
+        analysed.append(text)
+        return {'ai_output': f"Verdict for: {text}", 'rating': 5, 'sources': []}
+        yield
+
+    monkeypatch.setattr(ib.OCR, "image_to_data", fake_ocr)
+    monkeypatch.setattr(ib, "iter_analysis", fake_analysis)
+
+    def upload(image_bytes, ocr_text):
+        ocr_texts.append(ocr_text)
+        return ib.process_upload(image_bytes)
+
+    upload.analysed = analysed
+    return upload
+
+
+SAME_LAYOUT_CLAIMS = [
+    "vaccines cause autism in children according to a new study",
+    "vaccines do not cause autism in children according to a new study",
+    "the moon landing was filmed in a studio in nevada in 1969",
+]
+
+
+def test_same_layout_different_text_is_not_reused(ib, pipeline, screenshot, monkeypatch):
+    # any layout counts as a match here, so only the OCR text can tell these posts apart
+    monkeypatch.setattr(ib, "NEAR_DUP_INDEX", ib.NearDuplicateIndex(1000, 256, 64))
+    shots = [screenshot(claim) for claim in SAME_LAYOUT_CLAIMS]
+    results = [pipeline(shot, claim) for shot, claim in zip(shots, SAME_LAYOUT_CLAIMS)]
+
+    assert [r['extracted_text'] for r in results] == SAME_LAYOUT_CLAIMS
+    assert pipeline.analysed == SAME_LAYOUT_CLAIMS
+
+
+def test_one_word_change_is_not_reused(ib, pipeline, screenshot, monkeypatch):
+    monkeypatch.setattr(ib, "NEAR_DUP_INDEX", ib.NearDuplicateIndex(1000, 256, 64))
+    claim = ("Studies show that drinking coffee every morning increases your risk of "
+             "heart disease by forty percent according to new research from doctors")
+    for variant in (claim, claim.replace("coffee", "bleach"), claim.replace("increases", "reduces")):
+        assert pipeline(screenshot(variant), variant)['extracted_text'] == variant
+    assert len(pipeline.analysed) == 3
+
+
+def test_reshared_screenshot_reuses_verdict(pipeline, screenshot):
+    claim = SAME_LAYOUT_CLAIMS[0]
+    first = pipeline(screenshot(claim), claim)
+    # recompressed and resized, and OCR misreads a few characters of the new copy
+    misread = "Vaccines cause autisrn in chi1dren according to a new studv\n"
+    reshared = pipeline(screenshot(claim, fmt="JPEG", quality=60, scale=0.93), misread)
+
+    assert reshared == first
+    assert pipeline.analysed == [claim]
+
+
+def test_misread_number_is_not_reused(ib, pipeline, screenshot, monkeypatch):
+    monkeypatch.setattr(ib, "NEAR_DUP_INDEX", ib.NearDuplicateIndex(1000, 256, 64))
+    claim = "the moon landing was filmed in a studio in nevada in 1969"
+    pipeline(screenshot(claim), claim)
+    variant = claim.replace("1969", "1968")
+    pipeline(screenshot(variant), variant)
+    assert len(pipeline.analysed) == 2
+
+
+def test_ocr_words_match(ib):
+    words = ib.normalize_claim_text
+    claim = "Drinking coffee every morning increases your risk of heart disease"
+    assert ib.ocr_words_match(words(claim), words(claim.replace("morning", "moming").replace("risk", "rlsk")))
+    assert ib.ocr_words_match(words(claim), words(claim.replace("every morning", "everymorning")))
+    assert not ib.ocr_words_match(words(claim), words(claim.replace("coffee", "bleach")))
+    assert not ib.ocr_words_match(words(claim), words(claim.replace("increases", "reduces")))
+    assert not ib.ocr_words_match(words(claim), words(claim.replace("increases", "never increases")))
+    assert not ib.ocr_words_match(words(claim), [])
+
+
+def test_find_returns_layouts_within_distance(ib):
+    index = ib.NearDuplicateIndex(1000, 3, 64, hash_bits=64)
+    index.add(0, "a")
+    index.add(0b1, "b")
+    assert [(d, key) for d, _, key in index.find(0b111)] == [(2, "b"), (3, "a")]
+    assert index.find((1 << 20) - 1) == []
+    # bit flips spread across the chunks are still found
+    spread = (1 << 63) | (1 << 40) | (1 << 20)
+    assert [key for _, _, key in index.find(spread)] == ["a"]
+
+
+def test_evicted_entries_are_not_found(ib):
+    index = ib.NearDuplicateIndex(2, 3, 64, hash_bits=64)
+    low, high = (1 << 32) - 1, ((1 << 32) - 1) << 32
+    for h, key in ((0, "a"), (low, "b"), (high, "c")):
+        index.add(h, key)
+    assert index.find(0) == []
+    assert [key for _, _, key in index.find(low)] == ["b"]
+
+
+def test_lookup_stays_fast_with_many_low_entropy_hashes(ib):
+    # text screenshots mostly hash to zero bits; that must not degrade lookups
+    rng = random.Random(7)
+    index = ib.NearDuplicateIndex(1_000_000, 12, 64)
+    hashes = []
+    for i in range(200_000):
+        h = 0
+        for _ in range(6):
+            h |= 1 << rng.randrange(256)
+        hashes.append(h)
+        index.add(h, str(i))
+    started = time.perf_counter()
+    for i in range(199_000, 200_000):
+        assert str(i) in [key for _, _, key in index.find(hashes[i] ^ 0b101)]
+    assert (time.perf_counter() - started) / 1000 < 0.001
@@ -0,0 +1,31 @@
+from io import BytesIO
+
+from PIL import Image
+
+
+def _jpeg(img, orientation=None):
+    buf = BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    img.save(buf, "JPEG", quality=90, exif=exif)
+    return buf.getvalue()
+
+
+def test_sideways_tall_screenshot_is_fitted_upright(ib):
+    upright = Image.new("RGB", (900, 4000), "white")
+    # stored rotated a quarter turn counter-clockwise; orientation 6 turns it back
+    stored = upright.transpose(Image.Transpose.ROTATE_90)
+    img = ib.preprocess_image(_jpeg(stored, orientation=6), max_dim=1200, fast=True)
+    # tall: only the width is limited (it already fits), so nothing is crushed
+    assert img.size == (900, 4000)
+
+    img = ib.preprocess_image(_jpeg(stored.transpose(Image.Transpose.ROTATE_180), orientation=8), max_dim=1200, fast=True)
+    assert img.size == (900, 4000)
+
+
+def test_upright_wide_photo_is_fitted_to_the_box(ib):
+    img = ib.preprocess_image(_jpeg(Image.new("RGB", (4000, 3000), "white")), max_dim=1200, fast=True)
+    assert img.size == (1200, 900)
+    img = ib.preprocess_image(_jpeg(Image.new("RGB", (4000, 3000), "white"), orientation=6), max_dim=1200, fast=True)
+    assert img.size == (900, 1200)
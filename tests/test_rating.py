@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rating_corpus.jsonl")
+
+
+@pytest.mark.parametrize("analysis", [
+    "It cannot be verified whether the statement is true.",
+    "It is unclear if the claim is accurate.",
+    "The analysis cannot determine whether this is accurate.",
+    "The claim can't be verified.",
+    "The claim has not been verified by any outlet.",
+    "The claim could not be confirmed.",
+])
+def test_unverifiable_conclusions_are_not_scored(ib, analysis):
+    assert ib.score_analysis_locally(analysis) == (None, True)
+
+
+@pytest.mark.parametrize("analysis", [
+    "The statement is false, and the photo's origin cannot be verified.",
+    "The claim is accurate, though parts of it remain unclear.",
+    "The claim is mostly accurate but misleading.",
+])
+def test_doubtful_or_contradictory_conclusions_go_to_the_llm(ib, analysis):
+    assert ib.score_analysis_locally(analysis) == (None, False)
+
+
+@pytest.mark.parametrize("analysis, score", [
+    ("The claim is partially true but misleading, since the figures omit inflation.", 4),
+    ("The claim is partially true. The headline, however, is misleading.", 4),
+    ("Even if the numbers are true, the claim is false.", 2),
+    ("This statement is accurate.", 9),
+    ("The statement is not accurate.", 2),
+])
+def test_clear_conclusions(ib, analysis, score):
+    assert ib.score_analysis_locally(analysis) == (score, True)
+
+
+def test_unverifiable_analysis_never_reaches_a_confident_score(ib, monkeypatch):
+    monkeypatch.setattr(ib, "RATING_MODE", "local")
+    monkeypatch.setattr(ib, "rate_with_llm", lambda text: pytest.fail("LLM scorer called"))
+    assert ib.derive_rating_from_analysis("It cannot be verified whether the statement is true.") is None
+
+
+def test_local_scorer_agrees_with_labeled_corpus(ib):
+    report = ib.rating_agreement_report(CORPUS, use_llm=False)
+    assert report["disagreements"] == []
+    assert report["local_band_agree"] == report["local_decided"]
+
+
+def test_agreement_report_with_llm_scorer(ib, monkeypatch):
+    monkeypatch.setattr(ib, "rate_with_llm", lambda text: 5)
+    report = ib.rating_agreement_report(CORPUS, use_llm=True)
+    assert report["items"] > 0
+    assert 0 < report["llm_within_1"] < report["items"]
@@ -0,0 +1,31 @@
+import json
+
+
+def test_llm_failures_are_retried_on_resume(ib, monkeypatch, tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    for name in ("a.png", "b.png"):
+        (images / name).write_bytes(b"not really an image " + name.encode())
+    out = tmp_path / "results.jsonl"
+    outcome = {'ai_output': "AI Error: Cohere API is unavailable (circuit open)", 'rating': None, 'sources': []}
+    seen = []
+
+    def fake_process_upload(file_bytes):
+        seen.append(file_bytes)
+        return dict(outcome, extracted_text="text")
+
+    monkeypatch.setattr(ib, "process_upload", fake_process_upload)
+
+    ib.scan_directory(str(images), str(out), workers=2)
+    records = [json.loads(line) for line in out.read_text().splitlines()]
+    assert [r["ok"] for r in records] == [False, False]
+    assert records[0]["error"].startswith("AI Error:")
+
+    outcome['ai_output'] = "The claim is false."
+    ib.scan_directory(str(images), str(out), workers=2)
+    assert len(seen) == 4
+    records = [json.loads(line) for line in out.read_text().splitlines()]
+    assert sorted(r["path"] for r in records if r["ok"]) == ["a.png", "b.png"]
+
+    ib.scan_directory(str(images), str(out), workers=2)
+    assert len(seen) == 4
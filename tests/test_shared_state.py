@@ -0,0 +1,94 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _in_other_worker(code):
+    """Run `code` in a fresh process sharing this one's STATE_DB, like another server worker."""
+    env = dict(os.environ, RESULT_CACHE_DB="")
+    done = subprocess.run([sys.executable, "-c", "import InfoBait as ib\n" + code],
+                          cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+    assert done.returncode == 0, done.stderr
+    return done.stdout.strip()
+
+
+def test_pending_upload_is_streamed_by_another_worker(ib):
+    stream_id = ib.add_pending_upload("ab" * 32)
+    assert _in_other_worker(f"print(ib.take_pending_upload({stream_id!r}))") == "ab" * 32
+    # handed out once
+    assert ib.take_pending_upload(stream_id) is None
+
+
+def test_upload_events_reads_the_image_from_the_blob_store(ib, monkeypatch, tmp_path):
+    monkeypatch.setattr(ib, "BLOBS", ib.BlobStore(str(tmp_path), 3600))
+    seen = []
+
+    def fake_pipeline(file_bytes):
+        seen.append(file_bytes)
+        return {'extracted_text': "text", 'ai_output': "The claim is false.", 'rating': 2, 'sources': []}
+        yield
+
+    monkeypatch.setattr(ib, "iter_upload_pipeline", fake_pipeline)
+    blob_id = ib.BLOBS.put(b"image bytes")
+    stream_id = ib.add_pending_upload(blob_id)
+    # only the blob id goes to the state DB, not the image a second time
+    with ib.state_db() as conn:
+        assert conn.execute("SELECT blob_id FROM pending_streams WHERE id = ?", (stream_id,)).fetchone() == (blob_id,)
+    body = ib.app.test_client().get(f"/upload-events/{stream_id}").get_data(as_text=True)
+    assert "event: done" in body
+    assert seen == [b"image bytes"]
+
+
+def test_state_db_failures_degrade(ib, monkeypatch, tmp_path):
+    monkeypatch.setattr(ib, "STATE_DB", str(tmp_path / "missing" / "state.sqlite3"))
+    jobs = ib.JobQueue(4, 0, 60)
+    assert jobs.submit(lambda: None) is None
+    jobs.shutdown(0)
+    response = ib.app.test_client().post("/upload?async=1", data={"image": (ib.BytesIO(b"x"), "a.png")})
+    assert response.status_code == 503
+
+
+def test_job_status_is_visible_to_every_worker(ib):
+    jobs = ib.JobQueue(4, 1, 60)
+    job_id = jobs.submit(lambda: {"rating": 3})
+    jobs._queue.join()
+    other = ib.JobQueue(4, 1, 60)
+    assert other.get(job_id) == {"id": job_id, "status": "done", "result": {"rating": 3}, "error": None}
+
+
+def test_worker_exit_fails_its_unfinished_jobs(ib):
+    jobs = ib.JobQueue(4, 0, 60)  # no worker threads: the job stays queued
+    job_id = jobs.submit(lambda: None)
+    jobs.shutdown(0)
+    job = ib.JobQueue(4, 1, 60).get(job_id)
+    assert job["status"] == "error" and "restarted" in job["error"]
+
+
+def test_chat_continues_on_another_worker(ib):
+    store = ib.ChatSessionStore(100, 600, 6)
+    session = store.get(None, "bibi")
+    store.record(session, "hello", "Shalom!")
+    other = ib.ChatSessionStore(100, 600, 6)
+    resumed = other.get(session["id"], "bibi")
+    assert resumed["id"] == session["id"]
+    assert other.snapshot(resumed) == ("", [{"role": "USER", "message": "hello"}, {"role": "CHATBOT", "message": "Shalom!"}])
+    # a different character never picks up someone else's session
+    assert other.get(session["id"], "trump")["id"] != session["id"]
+
+
+def test_budgets_are_split_across_workers(ib, monkeypatch):
+    monkeypatch.setattr(ib.OCR, "pool_size", ib.OCR.pool_size)
+    monkeypatch.setattr(ib.llm, "scheduler", ib.llm.scheduler)
+    monkeypatch.setattr(ib, "OCR_POOL_SIZE", 8)
+    monkeypatch.setattr(ib, "LLM_MAX_CONCURRENT", 8)
+    limits = {cls: 6 for cls in ib.LLM_CLASS_LIMITS}
+    limits["chat"] = 1
+    monkeypatch.setattr(ib, "LLM_CLASS_LIMITS", limits)
+    ib.share_budgets_across_workers(4)
+    assert ib.OCR.pool_size == 2
+    scheduler = ib.llm.scheduler
+    assert scheduler.max_concurrent == 2
+    assert scheduler.class_limits == {"fact_check": 1, "chat": 1}
+    assert scheduler.client_rate == ib.LLM_CLIENT_RATE / 4
@@ -0,0 +1,77 @@
+import re
+import time
+from io import BytesIO
+
+import pytest
+
+
+@pytest.fixture
+def client(ib, monkeypatch, tmp_path):
+    monkeypatch.setattr(ib, "BLOBS", ib.BlobStore(str(tmp_path), 3600))
+    monkeypatch.setattr(ib, "PROGRESSIVE_RESULTS", False)
+    monkeypatch.setattr(ib, "process_upload", lambda file_bytes: {
+        'extracted_text': "Some claim", 'ai_output': "The claim is false.", 'rating': 2, 'sources': []})
+    monkeypatch.setattr(ib.UPLOAD_JOBS, "submit", lambda fn, *args: "job-1")
+    return ib.app.test_client()
+
+
+def _post(client, accept):
+    return client.post("/upload", data={"image": (BytesIO(b"image bytes"), "a.png")}, headers={"Accept": accept})
+
+
+BROWSER_ACCEPT = "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"
+
+
+def test_async_uploads_flag_keeps_the_form_on_the_result_page(ib, client, monkeypatch):
+    monkeypatch.setattr(ib, "ASYNC_UPLOADS", True)
+    page = _post(client, BROWSER_ACCEPT)
+    assert page.status_code == 200
+    assert page.mimetype == "text/html"
+    assert b"The claim is false." in page.data
+
+    for accept in ("application/json", "*/*"):
+        job = _post(client, accept)
+        assert job.status_code == 202
+        assert job.get_json()["job_id"] == "job-1"
+
+
+def test_async_query_parameter_always_queues(client):
+    response = client.post("/upload?async=1", data={"image": (BytesIO(b"image bytes"), "a.png")},
+                           headers={"Accept": BROWSER_ACCEPT})
+    assert response.status_code == 202
+
+
+def test_rate_limited_form_submit_gets_a_page(ib, client, monkeypatch):
+    def rate_limited(file_bytes):
+        raise ib.LLMRateLimited(7)
+
+    monkeypatch.setattr(ib, "process_upload", rate_limited)
+    page = _post(client, BROWSER_ACCEPT)
+    assert page.status_code == 429
+    assert page.mimetype == "text/html"
+    assert page.headers["Retry-After"] == "7"
+    assert b"Please retry in 7s." in page.data
+
+    api = _post(client, "application/json")
+    assert api.status_code == 429
+    assert api.get_json() == {"error": "Too many requests. Please retry shortly."}
+
+
+def test_batch_items_time_stages_locally(ib, client, monkeypatch):
+    item_timings = []
+
+    def fake_ocr_upload(file_bytes):
+        # worker threads collect into their own dict, never the request's shared one
+        item_timings.append(ib.STAGE_TIMINGS.get())
+        with ib.stage_timer("ocr"):
+            time.sleep(0.02)
+        return {'cache_key': "k", 'phash': None,
+                'result': {'extracted_text': "t", 'ai_output': "False.", 'rating': 2, 'sources': []}}
+
+    monkeypatch.setattr(ib, "ocr_upload", fake_ocr_upload)
+    files = [(BytesIO(b"image %d" % i), f"{i}.png") for i in range(3)]
+    response = client.post("/upload-batch", data={"images": files}, headers={"Accept": "application/json"})
+    assert response.status_code == 200
+    assert len({id(t) for t in item_timings}) == 3 and all(t == {"ocr": pytest.approx(0.02, abs=0.05)} for t in item_timings)
+    ocr_ms = float(re.search(r"ocr;dur=([\d.]+)", response.headers["Server-Timing"]).group(1))
+    assert ocr_ms >= 60